@@ -1,5 +1,5 @@
 import numpy as np
-import pandas as pd
+from threading import Lock
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from sklearn.cluster import KMeans
@@ -317,6 +317,23 @@ class MoodPredictor:
         
         return suggestions
 
-# 全局实例
-behavior_analyzer = UserBehaviorAnalyzer()
-mood_predictor = MoodPredictor()
+# 全局实例（首次使用时创建）
+behavior_analyzer: Optional[UserBehaviorAnalyzer] = None
+mood_predictor: Optional[MoodPredictor] = None
+_instances_lock = Lock()
+
+def get_behavior_analyzer() -> UserBehaviorAnalyzer:
+    global behavior_analyzer
+    if behavior_analyzer is None:
+        with _instances_lock:
+            if behavior_analyzer is None:
+                behavior_analyzer = UserBehaviorAnalyzer()
+    return behavior_analyzer
+
+def get_mood_predictor() -> MoodPredictor:
+    global mood_predictor
+    if mood_predictor is None:
+        with _instances_lock:
+            if mood_predictor is None:
+                mood_predictor = MoodPredictor()
+    return mood_predictor
@@ -1,54 +1,48 @@
 import os
+import re
 import json
 import sqlite3
+import hashlib
+import unicodedata
 from typing import List, Optional, Dict, Any
 from threading import Lock
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from .storage import use_pg as _use_pg, get_engine as _get_engine, sqlite as _sqlite
 import time
+from .lexical import tokenize, fts5_query, user_token
 
+# 只串行化建表/迁移；Postgres 的读写直接使用 SQLAlchemy 连接池并发执行，SQLite 由 sqlite_pool 单写多读
 _DB_LOCK = Lock()
-_DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(__file__))
-_DB_PATH = os.path.join(_DATA_DIR, 'memory.db')
 
-# Postgres support
-_PG_DSN = os.getenv("POSTGRES_DSN")
-_PG_HOST = os.getenv("POSTGRES_HOST")
-_PG_PORT = os.getenv("POSTGRES_PORT", "5432")
-_PG_DB = os.getenv("POSTGRES_DB")
-_PG_USER = os.getenv("POSTGRES_USER")
-_PG_PASSWORD = os.getenv("POSTGRES_PASSWORD")
-_ENGINE = None
+# 批量写入时每条 INSERT 的行数（Postgres unnest 数组长度）
+_BULK_CHUNK = max(1, int(os.getenv("DB_BULK_CHUNK", "1000")))
+# SQLite 编译未带 FTS5 时词法检索退化为 LIKE
+_FTS_OK = False
+# 建表在应用 lifespan 中完成；未经 lifespan 的进程（脚本、测试）在首次访问时补建
+_schema_ready = False
 
 
-def _use_pg() -> bool:
-    return bool(_PG_DSN or (_PG_HOST and _PG_DB and _PG_USER and _PG_PASSWORD))
+def content_hash(type_: Optional[str], text_: Optional[str]) -> Optional[str]:
+    """同一用户内判重用的内容指纹：类型 + 规范化文本（NFKC、小写、合并空白、去掉句末标点）"""
+    norm = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text_ or "")).strip().lower()
+    norm = norm.rstrip("。.!！?？~～…")
+    if not norm:
+        return None
+    return hashlib.sha1(f"{type_ or ''}\x1f{norm}".encode("utf-8")).hexdigest()
 
 
-def _get_engine():
-    global _ENGINE
-    if _ENGINE is not None:
-        return _ENGINE
-    if _PG_DSN:
-        dsn = _PG_DSN
-    else:
-        dsn = f"postgresql+psycopg://{_PG_USER}:{_PG_PASSWORD}@{_PG_HOST}:{_PG_PORT}/{_PG_DB}"
-    _ENGINE = create_engine(dsn, pool_pre_ping=True)
-    return _ENGINE
-
-
-def _connect():
-    if _use_pg():
-        # SQLAlchemy engine will be used elsewhere; keep this for SQLite fallback
-        raise RuntimeError("_connect() should not be used when Postgres is enabled")
-    conn = sqlite3.connect(_DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def _ensure_schema():
+    if not _schema_ready:
+        init_db()
 
 
 def init_db():
-    with _DB_LOCK:
-        if _use_pg():
+    global _schema_ready
+    if _use_pg():
+        with _DB_LOCK:
+            if _schema_ready:
+                return
             eng = _get_engine()
             with eng.begin() as conn:
                 conn.execute(text(
@@ -62,214 +56,501 @@ def init_db():
                         timestamp TEXT
                     );
                     CREATE INDEX IF NOT EXISTS idx_memory_user_ts ON memory_events(user_id, timestamp DESC);
+                    ALTER TABLE memory_events ADD COLUMN IF NOT EXISTS search_tokens TEXT;
+                    CREATE INDEX IF NOT EXISTS idx_memory_search_tokens ON memory_events
+                        USING GIN (to_tsvector('simple', coalesce(search_tokens, '')));
+                    ALTER TABLE memory_events ADD COLUMN IF NOT EXISTS content_hash TEXT;
+                    CREATE INDEX IF NOT EXISTS idx_memory_user_hash ON memory_events(user_id, content_hash);
                     """
                 ))
+            _backfill_search_tokens_pg(eng)
+            _backfill_content_hash_pg(eng)
+            _schema_ready = True
             return
-        # SQLite fallback
-        conn = _connect()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS memory_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    type TEXT,
-                    text TEXT,
-                    metadata TEXT,
-                    timestamp TEXT
-                )
-                """
+    # SQLite：写连接串行，退出时提交
+    with _sqlite().writer() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS memory_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                type TEXT,
+                text TEXT,
+                metadata TEXT,
+                timestamp TEXT
             )
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_memory_user_ts ON memory_events(user_id, timestamp DESC)")
-            conn.commit()
-        finally:
-            conn.close()
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_memory_user_ts ON memory_events(user_id, timestamp DESC)")
+        _init_content_hash(cur)
+        _init_fts(cur)
+    _schema_ready = True
+
+
+def _init_fts(cur):
+    """分词倒排索引：rowid 对应 memory_events.id，ukey 为用户过滤列"""
+    global _FTS_OK
+    try:
+        cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS memory_events_fts USING fts5(tokens, ukey)")
+    except sqlite3.OperationalError as e:
+        print(f"SQLite FTS5 unavailable, lexical search falls back to LIKE: {e}")
+        _FTS_OK = False
+        return
+    _FTS_OK = True
+    # 补建索引：只处理尚未建立倒排的新行
+    last = cur.execute("SELECT COALESCE(MAX(rowid), 0) FROM memory_events_fts").fetchone()[0]
+    rows = cur.execute("SELECT id, user_id, text FROM memory_events WHERE id > ?", (int(last),)).fetchall()
+    cur.executemany(
+        "INSERT INTO memory_events_fts(rowid, tokens, ukey) VALUES(?,?,?)",
+        [(r[0], " ".join(tokenize(r[2] or "")), user_token(r[1])) for r in rows],
+    )
+
+
+def _init_content_hash(cur):
+    """旧库补列并回填内容指纹"""
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(memory_events)").fetchall()}
+    if 'content_hash' not in cols:
+        cur.execute("ALTER TABLE memory_events ADD COLUMN content_hash TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_memory_user_hash ON memory_events(user_id, content_hash)")
+    rows = cur.execute("SELECT id, type, text FROM memory_events WHERE content_hash IS NULL AND text IS NOT NULL").fetchall()
+    cur.executemany("UPDATE memory_events SET content_hash=? WHERE id=?", [(content_hash(r[1], r[2]), r[0]) for r in rows])
+
+
+def _backfill_content_hash_pg(eng, batch: int = 1000):
+    while True:
+        with eng.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, type, text FROM memory_events WHERE content_hash IS NULL AND text IS NOT NULL "
+                "AND text <> '' LIMIT :n"
+            ), {"n": batch}).all()
+            hashed = [{"id": r[0], "h": content_hash(r[1], r[2])} for r in rows]
+            hashed = [h for h in hashed if h["h"]]
+            if not hashed:
+                return
+            conn.execute(text("UPDATE memory_events SET content_hash=:h WHERE id=:id"), hashed)
+
+
+def _backfill_search_tokens_pg(eng, batch: int = 1000):
+    while True:
+        with eng.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, text FROM memory_events WHERE search_tokens IS NULL LIMIT :n"
+            ), {"n": batch}).all()
+            if not rows:
+                return
+            conn.execute(text("UPDATE memory_events SET search_tokens=:tokens WHERE id=:id"), [
+                {"id": r[0], "tokens": " ".join(tokenize(r[1] or ""))} for r in rows
+            ])
+
+
+def bulk_insert_sql(table: str, columns: List[str], types: List[str], returning: str = "") -> str:
+    """INSERT ... SELECT FROM unnest(:c0, :c1, ...)，参数 c<i> 为第 i 列的数组"""
+    cols = ", ".join(columns)
+    arrays = ", ".join(f"CAST(:c{i} AS {t}[])" for i, t in enumerate(types))
+    return f"INSERT INTO {table}({cols}) SELECT * FROM unnest({arrays})" + (f" RETURNING {returning}" if returning else "")
+
+
+def bulk_chunks(rows: List[tuple], chunk: Optional[int] = None):
+    """按块产出 unnest 的列数组参数"""
+    chunk = chunk or _BULK_CHUNK
+    for i in range(0, len(rows), chunk):
+        yield {f"c{j}": list(col) for j, col in enumerate(zip(*rows[i:i + chunk]))}
+
+
+def pg_bulk_insert(conn, table: str, columns: List[str], types: List[str], rows: List[tuple], chunk: Optional[int] = None) -> int:
+    """Postgres 集合式批量写入：每块一条 INSERT ... SELECT FROM unnest(数组...)，返回准确的写入行数"""
+    sql = text(bulk_insert_sql(table, columns, types))
+    total = 0
+    for params in bulk_chunks(rows, chunk):
+        res = conn.execute(sql, params)
+        total += res.rowcount or 0
+    return total
+
+
+def pg_bulk_insert_ids(conn, table: str, columns: List[str], types: List[str], rows: List[tuple], chunk: Optional[int] = None) -> List[int]:
+    """同 pg_bulk_insert，返回与 rows 同序的新行 id。
+
+    同一条语句内 unnest 按数组顺序产出行、序列按插入顺序取号，块内 id 升序即对应行序。
+    """
+    sql = text(bulk_insert_sql(table, columns, types, returning="id"))
+    ids: List[int] = []
+    for params in bulk_chunks(rows, chunk):
+        res = conn.execute(sql, params)
+        ids.extend(sorted(int(r[0]) for r in res.all()))
+    return ids
+
+
+PG_EVENT_COLUMNS = ["user_id", "type", "text", "metadata", "timestamp", "content_hash", "search_tokens"]
+
+
+def event_rows(events: List[Dict[str, Any]]):
+    """待写入的事件（无 user_id 的跳过）及其行：(user_id, type, text, metadata, timestamp, content_hash)"""
+    written = [ev for ev in (events or []) if ev.get("user_id")]
+    rows = [
+        (
+            ev["user_id"],
+            ev.get("type"),
+            ev.get("text"),
+            json.dumps(ev.get("metadata") or {}),
+            ev.get("timestamp"),
+            content_hash(ev.get("type"), ev.get("text")),
+        )
+        for ev in written
+    ]
+    return written, rows
+
+
+def pg_event_rows(rows: List[tuple]) -> List[tuple]:
+    # Postgres 另存分词结果供 tsvector 检索
+    return [(*r, " ".join(tokenize(r[2] or ""))) for r in rows]
+
+
+def event_dict(r) -> Dict[str, Any]:
+    """memory_events 行（映射或 sqlite3.Row）转为接口返回的记忆，metadata 解析为对象"""
+    md = {}
+    try:
+        if r["metadata"]:
+            md = json.loads(r["metadata"]) or {}
+    except Exception:
+        md = {}
+    return {
+        "id": r["id"],
+        "user_id": r["user_id"],
+        "type": r["type"],
+        "text": r["text"],
+        "metadata": md,
+        "timestamp": r["timestamp"],
+    }
 
 
 def upsert_events(events: List[Dict[str, Any]]) -> int:
-    if not events:
+    """批量写入记忆，返回实际写入的行数（无 user_id 的事件跳过）。
+
+    写入的事件原地回填 "id"（memory_events 行 id），调用方据此写入向量元数据，删除时按 id 对齐。
+    """
+    written_events, rows = event_rows(events)
+    if not rows:
         return 0
-    with _DB_LOCK:
-        if _use_pg():
-            eng = _get_engine()
-            total = 0
-            with eng.begin() as conn:
-                for ev in events:
-                    user_id = ev.get("user_id")
-                    if not user_id:
-                        continue
-                    res = conn.execute(text(
-                        """
-                        INSERT INTO memory_events(user_id, type, text, metadata, timestamp)
-                        VALUES (:user_id, :type, :text, :metadata, :timestamp)
-                        """
-                    ), {
-                        "user_id": user_id,
-                        "type": ev.get("type"),
-                        "text": ev.get("text"),
-                        "metadata": json.dumps(ev.get("metadata") or {}),
-                        "timestamp": ev.get("timestamp"),
-                    })
-                    total += res.rowcount or 0
-            return total
-        # SQLite fallback
-        conn = _connect()
-        try:
-            cur = conn.cursor()
-            for ev in events:
-                user_id = ev.get("user_id")
-                if not user_id:
-                    continue
-                cur.execute(
-                    "INSERT INTO memory_events(user_id, type, text, metadata, timestamp) VALUES(?,?,?,?,?)",
-                    (
-                        user_id,
-                        ev.get("type"),
-                        ev.get("text"),
-                        json.dumps(ev.get("metadata") or {}),
-                        ev.get("timestamp"),
-                    ),
-                )
-            conn.commit()
-            return cur.rowcount or 0
-        finally:
-            conn.close()
+    _ensure_schema()
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            ids = pg_bulk_insert_ids(conn, "memory_events", PG_EVENT_COLUMNS, ["text"] * len(PG_EVENT_COLUMNS), pg_event_rows(rows))
+        for ev, i in zip(written_events, ids):
+            ev["id"] = i
+        return len(ids)
+    # SQLite：写连接串行，退出时提交；同一写事务内新行的 id 都大于写入前的最大 id
+    with _sqlite().writer() as conn:
+        cur = conn.cursor()
+        base = cur.execute("SELECT COALESCE(MAX(id), 0) FROM memory_events").fetchone()[0]
+        cur.executemany(
+            "INSERT INTO memory_events(user_id, type, text, metadata, timestamp, content_hash) VALUES(?,?,?,?,?,?)",
+            rows,
+        )
+        written = cur.rowcount  # executemany 的 rowcount 为各条之和
+        ids = [r[0] for r in cur.execute("SELECT id FROM memory_events WHERE id > ? ORDER BY id", (base,)).fetchall()]
+        for ev, i in zip(written_events, ids):
+            ev["id"] = i
+        if _FTS_OK:
+            cur.executemany(
+                "INSERT INTO memory_events_fts(rowid, tokens, ukey) VALUES(?,?,?)",
+                [(i, " ".join(tokenize(r[2] or "")), user_token(r[0])) for i, r in zip(ids, rows)],
+            )
+        return int(written)
+
+
+def existing_hash_times(user_id: str, hashes: List[str], since: Optional[str] = None) -> Dict[str, List[Optional[str]]]:
+    """返回 hashes 中该用户已存在的内容指纹及各自的时间戳（since 非空时只看该时间及之后的记忆）"""
+    hashes = sorted({h for h in hashes if h})
+    if not user_id or not hashes:
+        return {}
+    _ensure_schema()
+    found: Dict[str, List[Optional[str]]] = {}
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT content_hash, timestamp FROM memory_events WHERE user_id=:uid AND content_hash = ANY(:hashes)"
+                + (" AND timestamp >= :since" if since else "")
+            ), {"uid": user_id, "hashes": hashes, "since": since}).all()
+        for h, ts in rows:
+            found.setdefault(h, []).append(ts)
+        return found
+    # SQLite：只读连接池，WAL 下不被写入阻塞
+    with _sqlite().reader() as conn:
+        cur = conn.cursor()
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            cur.execute(
+                f"SELECT content_hash, timestamp FROM memory_events WHERE user_id=? AND content_hash IN ({','.join('?' * len(chunk))})"
+                + (" AND timestamp >= ?" if since else ""),
+                [user_id, *chunk, *([since] if since else [])],
+            )
+            for h, ts in cur.fetchall():
+                found.setdefault(h, []).append(ts)
+        return found
+
+
+def pg_query_events_sql(user_id: str, query: Optional[str], top_k: int):
+    sql = (
+        "SELECT id, user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=:uid "
+        + ("AND text ILIKE :q " if (query and query.strip()) else "")
+        + "ORDER BY timestamp DESC LIMIT :limit"
+    )
+    params: Dict[str, Any] = {"uid": user_id, "limit": int(top_k)}
+    if query and query.strip():
+        params["q"] = f"%{query}%"
+    return sql, params
 
 
 def query_events(user_id: str, query: Optional[str], top_k: int) -> List[Dict[str, Any]]:
     if not user_id:
         return []
-    with _DB_LOCK:
-        if _use_pg():
-            eng = _get_engine()
-            sql = (
-                "SELECT user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=:uid "
-                + ("AND text ILIKE :q " if (query and query.strip()) else "")
-                + "ORDER BY timestamp DESC LIMIT :limit"
+    _ensure_schema()
+    if _use_pg():
+        eng = _get_engine()
+        sql, params = pg_query_events_sql(user_id, query, top_k)
+        with eng.begin() as conn:
+            rows = conn.execute(text(sql), params).mappings().all()
+        return [event_dict(r) for r in rows]
+    # SQLite：只读连接池，WAL 下不被写入阻塞
+    with _sqlite().reader() as conn:
+        cur = conn.cursor()
+        if query and query.strip():
+            cur.execute(
+                "SELECT id, user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=? AND text LIKE ? ORDER BY timestamp DESC LIMIT ?",
+                (user_id, f"%{query}%", int(top_k)),
             )
-            params = {"uid": user_id, "limit": int(top_k)}
-            if query and query.strip():
-                params["q"] = f"%{query}%"
-            with eng.begin() as conn:
-                rows = conn.execute(text(sql), params).mappings().all()
-            result: List[Dict[str, Any]] = []
-            for r in rows:
+        else:
+            cur.execute(
+                "SELECT id, user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=? ORDER BY timestamp DESC LIMIT ?",
+                (user_id, int(top_k)),
+            )
+        rows = cur.fetchall()
+        result: List[Dict[str, Any]] = []
+        for r in rows:
+            md = {}
+            try:
+                if r["metadata"]:
+                    md = json.loads(r["metadata"]) or {}
+            except Exception:
                 md = {}
-                try:
-                    if r.get("metadata"):
-                        md = json.loads(r["metadata"]) or {}
-                except Exception:
-                    md = {}
-                result.append({
-                    "user_id": r["user_id"],
-                    "type": r["type"],
-                    "text": r["text"],
-                    "metadata": md,
-                    "timestamp": r["timestamp"],
-                })
-            return result
-        # SQLite fallback
-        conn = _connect()
-        try:
+            result.append({
+                "id": r["id"],
+                "user_id": r["user_id"],
+                "type": r["type"],
+                "text": r["text"],
+                "metadata": md,
+                "timestamp": r["timestamp"],
+            })
+        return result
+
+
+def pg_fetch_user_events_sql(user_id: str, since_days: Optional[int], limit: Optional[int]):
+    where = ["user_id = :uid"]
+    params: Dict[str, Any] = {"uid": user_id}
+    if since_days:
+        cutoff = (datetime.now() - timedelta(days=since_days)).isoformat(timespec='minutes')
+        where.append("timestamp >= :cutoff")
+        params["cutoff"] = cutoff
+    sql = "SELECT id, user_id, type, text, metadata, timestamp FROM memory_events WHERE " + " AND ".join(where) + " ORDER BY timestamp DESC"
+    if limit:
+        sql += " LIMIT :limit"
+        params["limit"] = int(limit)
+    return sql, params
+
+
+def fetch_user_events(user_id: str, since_days: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    if not user_id:
+        return []
+    _ensure_schema()
+    if _use_pg():
+        eng = _get_engine()
+        sql, params = pg_fetch_user_events_sql(user_id, since_days, limit)
+        with eng.begin() as conn:
+            rows = conn.execute(text(sql), params).mappings().all()
+        return [event_dict(r) for r in rows]
+    # SQLite：只读连接池，WAL 下不被写入阻塞
+    with _sqlite().reader() as conn:
+        cur = conn.cursor()
+        params: List[Any] = [user_id]
+        where = "user_id=?"
+        if since_days:
+            cutoff = (datetime.now() - timedelta(days=since_days)).isoformat(timespec='minutes')
+            where += " AND timestamp>=?"
+            params.append(cutoff)
+        sql = f"SELECT id, user_id, type, text, metadata, timestamp FROM memory_events WHERE {where} ORDER BY timestamp DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        cur.execute(sql, tuple(params))
+        rows = cur.fetchall()
+        result: List[Dict[str, Any]] = []
+        for r in rows:
+            md = {}
+            try:
+                if r["metadata"]:
+                    md = json.loads(r["metadata"]) or {}
+            except Exception:
+                md = {}
+            result.append({
+                "id": r["id"],
+                "user_id": r["user_id"],
+                "type": r["type"],
+                "text": r["text"],
+                "metadata": md,
+                "timestamp": r["timestamp"],
+            })
+        return result
+
+
+def fetch_events_by_ids(user_id: str, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """按 id 取该用户的记忆（补全仅由向量召回命中的条目），返回 id -> 记忆"""
+    ids = sorted({int(i) for i in ids if i is not None})
+    if not user_id or not ids:
+        return {}
+    _ensure_schema()
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=:uid AND id = ANY(:ids)"
+            ), {"uid": user_id, "ids": ids}).mappings().all()
+    else:
+        with _sqlite().reader() as conn:
+            cur = conn.cursor()
+            rows = []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                cur.execute(
+                    f"SELECT id, user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=? AND id IN ({','.join('?' * len(chunk))})",
+                    (user_id, *chunk),
+                )
+                rows.extend(cur.fetchall())
+    return {int(r["id"]): event_dict(r) for r in rows}
+
+
+def lexical_search(user_id: str, query: str, top_k: int) -> List[Dict[str, Any]]:
+    """分词倒排检索（SQLite FTS5 / Postgres tsvector），按相关度排序，附带 rank（越小越相关）"""
+    tokens = tokenize(query or "")
+    if not user_id or not tokens:
+        return []
+    _ensure_schema()
+    if _use_pg():
+        eng = _get_engine()
+        sql = (
+            "SELECT id, user_id, type, text, metadata, timestamp, "
+            "-ts_rank(to_tsvector('simple', coalesce(search_tokens, '')), q) AS rank "
+            "FROM memory_events, websearch_to_tsquery('simple', :q) AS q "
+            "WHERE user_id=:uid AND to_tsvector('simple', coalesce(search_tokens, '')) @@ q "
+            "ORDER BY rank, timestamp DESC LIMIT :limit"
+        )
+        with eng.begin() as conn:
+            rows = conn.execute(text(sql), {"uid": user_id, "q": " or ".join(tokens), "limit": int(top_k)}).mappings().all()
+    else:
+        with _sqlite().reader() as conn:
             cur = conn.cursor()
-            if query and query.strip():
+            if _FTS_OK:
                 cur.execute(
-                    "SELECT user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=? AND text LIKE ? ORDER BY timestamp DESC LIMIT ?",
-                    (user_id, f"%{query}%", int(top_k)),
+                    "SELECT e.id, e.user_id, e.type, e.text, e.metadata, e.timestamp, bm25(memory_events_fts) AS rank "
+                    "FROM memory_events_fts JOIN memory_events e ON e.id = memory_events_fts.rowid "
+                    "WHERE memory_events_fts MATCH ? ORDER BY rank, e.timestamp DESC LIMIT ?",
+                    (fts5_query(user_id, tokens), int(top_k)),
                 )
             else:
                 cur.execute(
-                    "SELECT user_id, type, text, metadata, timestamp FROM memory_events WHERE user_id=? ORDER BY timestamp DESC LIMIT ?",
-                    (user_id, int(top_k)),
+                    "SELECT id, user_id, type, text, metadata, timestamp, 0 AS rank FROM memory_events "
+                    "WHERE user_id=? AND (" + " OR ".join("text LIKE ?" for _ in tokens) + ") "
+                    "ORDER BY timestamp DESC LIMIT ?",
+                    (user_id, *[f"%{t}%" for t in tokens], int(top_k)),
                 )
             rows = cur.fetchall()
-            result: List[Dict[str, Any]] = []
-            for r in rows:
-                md = {}
-                try:
-                    if r["metadata"]:
-                        md = json.loads(r["metadata"]) or {}
-                except Exception:
-                    md = {}
-                result.append({
-                    "user_id": r["user_id"],
-                    "type": r["type"],
-                    "text": r["text"],
-                    "metadata": md,
-                    "timestamp": r["timestamp"],
-                })
-            return result
-        finally:
-            conn.close()
+    result: List[Dict[str, Any]] = []
+    for r in rows:
+        md = {}
+        try:
+            if r["metadata"]:
+                md = json.loads(r["metadata"]) or {}
+        except Exception:
+            md = {}
+        result.append({
+            "id": r["id"],
+            "user_id": r["user_id"],
+            "type": r["type"],
+            "text": r["text"],
+            "metadata": md,
+            "timestamp": r["timestamp"],
+            "rank": float(r["rank"] or 0.0),
+        })
+    return result
 
 
-def fetch_user_events(user_id: str, since_days: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+def _delete_fts_rows(cur, ids: List[int]) -> None:
+    if not _FTS_OK:
+        return
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cur.execute(f"DELETE FROM memory_events_fts WHERE rowid IN ({','.join('?' * len(chunk))})", chunk)
+
+
+def delete_events(user_id: str, ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """删除用户的记忆（ids 为空时删除该用户全部记忆），返回被删除行的 id/type/text/timestamp"""
     if not user_id:
         return []
-    with _DB_LOCK:
-        if _use_pg():
-            eng = _get_engine()
-            where = ["user_id = :uid"]
-            params: Dict[str, Any] = {"uid": user_id}
-            if since_days:
-                cutoff = (datetime.now() - timedelta(days=since_days)).isoformat(timespec='minutes')
-                where.append("timestamp >= :cutoff")
-                params["cutoff"] = cutoff
-            sql = "SELECT user_id, type, text, metadata, timestamp FROM memory_events WHERE " + " AND ".join(where) + " ORDER BY timestamp DESC"
-            if limit:
-                sql += " LIMIT :limit"
-                params["limit"] = int(limit)
-            with eng.begin() as conn:
-                rows = conn.execute(text(sql), params).mappings().all()
-            result: List[Dict[str, Any]] = []
-            for r in rows:
-                md = {}
-                try:
-                    if r.get("metadata"):
-                        md = json.loads(r["metadata"]) or {}
-                except Exception:
-                    md = {}
-                result.append({
-                    "user_id": r["user_id"],
-                    "type": r["type"],
-                    "text": r["text"],
-                    "metadata": md,
-                    "timestamp": r["timestamp"],
-                })
-            return result
-        # SQLite fallback
-        conn = _connect()
-        try:
-            cur = conn.cursor()
-            params: List[Any] = [user_id]
-            where = "user_id=?"
-            if since_days:
-                cutoff = (datetime.now() - timedelta(days=since_days)).isoformat(timespec='minutes')
-                where += " AND timestamp>=?"
-                params.append(cutoff)
-            sql = f"SELECT user_id, type, text, metadata, timestamp FROM memory_events WHERE {where} ORDER BY timestamp DESC"
-            if limit:
-                sql += " LIMIT ?"
-                params.append(int(limit))
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall()
-            result: List[Dict[str, Any]] = []
-            for r in rows:
-                md = {}
-                try:
-                    if r["metadata"]:
-                        md = json.loads(r["metadata"]) or {}
-                except Exception:
-                    md = {}
-                result.append({
-                    "user_id": r["user_id"],
-                    "type": r["type"],
-                    "text": r["text"],
-                    "metadata": md,
-                    "timestamp": r["timestamp"],
-                })
-            return result
-        finally:
-            conn.close()
+    if ids is not None and not ids:
+        return []
+    _ensure_schema()
+    if _use_pg():
+        eng = _get_engine()
+        sql = "DELETE FROM memory_events WHERE user_id=:uid"
+        params: Dict[str, Any] = {"uid": user_id}
+        if ids is not None:
+            sql += " AND id = ANY(:ids)"
+            params["ids"] = [int(i) for i in ids]
+        with eng.begin() as conn:
+            rows = conn.execute(text(sql + " RETURNING id, type, text, timestamp"), params).mappings().all()
+        return [dict(r) for r in rows]
+    # SQLite：写连接串行，退出时提交
+    with _sqlite().writer() as conn:
+        cur = conn.cursor()
+        if ids is None:
+            cur.execute("SELECT id, type, text, timestamp FROM memory_events WHERE user_id=?", (user_id,))
+            rows = [dict(r) for r in cur.fetchall()]
+        else:
+            rows = []
+            for i in range(0, len(ids), 500):
+                chunk = [int(x) for x in ids[i:i + 500]]
+                cur.execute(
+                    f"SELECT id, type, text, timestamp FROM memory_events WHERE user_id=? AND id IN ({','.join('?' * len(chunk))})",
+                    (user_id, *chunk),
+                )
+                rows.extend(dict(r) for r in cur.fetchall())
+        found = [r["id"] for r in rows]
+        for i in range(0, len(found), 500):
+            chunk = found[i:i + 500]
+            cur.execute(f"DELETE FROM memory_events WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        _delete_fts_rows(cur, found)
+        return rows
+
 
+def expire_events(type_: str, cutoff: str) -> int:
+    """删除某类型中时间戳早于 cutoff 的记忆（TTL），返回删除条数"""
+    _ensure_schema()
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            res = conn.execute(text(
+                "DELETE FROM memory_events WHERE type=:type AND timestamp < :cutoff"
+            ), {"type": type_, "cutoff": cutoff})
+            return res.rowcount or 0
+    # SQLite：写连接串行，退出时提交
+    with _sqlite().writer() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM memory_events WHERE type=? AND timestamp < ?", (type_, cutoff))
+        found = [r[0] for r in cur.fetchall()]
+        for i in range(0, len(found), 500):
+            chunk = found[i:i + 500]
+            cur.execute(f"DELETE FROM memory_events WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        _delete_fts_rows(cur, found)
+        return len(found)
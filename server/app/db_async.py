@@ -0,0 +1,238 @@
+"""存储层的异步接口：与 db.py / db_feedback.py / vector_store.py 同名的 async 函数，供 async 端点直接 await。
+
+Postgres（安装 psycopg_pool 时）走原生异步驱动：psycopg AsyncConnection + AsyncConnectionPool
+（storage.get_async_pool），等待数据库期间不占用任何线程；SQL 与同步实现共用（db.py 等导出的语句构造函数），
+只把 :name 占位转换为 psycopg 的 %(name)s。
+SQLite 没有异步驱动，每次调用按类型投递到对应线程池，事件循环只等待结果：
+  - 写入走 db_write（默认单线程，与单写连接一一对应）；读取走 db，WAL 下读写互不阻塞
+  - 向量写入/检索包含编码，走 inference；Postgres 上只有编码留在 inference 线程池
+"""
+import re
+import weakref
+from typing import Any, Dict, List, Optional
+import numpy as np
+from . import db, db_feedback, storage, vector_store
+from .executors import get_executor
+from .metrics import inc as metrics_inc
+
+_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+# 已注册 pgvector 适配器的连接（vector 类型在首次建表时才存在，按连接惰性注册）
+_vector_conns: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _native() -> bool:
+    return db._use_pg() and storage.HAS_ASYNC_PG
+
+
+def _psycopg(sql: str) -> str:
+    """SQLAlchemy text() 的 :name 占位转为 psycopg 的 %(name)s（不影响 :: 类型转换）"""
+    return _PARAM.sub(r"%(\1)s", sql.replace("%", "%%"))
+
+
+def _write_pool():
+    # 仅 SQLite：单写连接对应的写线程池
+    return get_executor('db_write')
+
+
+async def _ensure_schema() -> None:
+    # 建表/迁移只做一次，沿用同步实现
+    if not db._schema_ready:
+        await get_executor('db').run(db._ensure_schema)
+
+
+async def _ensure_feedback_table() -> None:
+    if not db_feedback._table_ready:
+        await get_executor('db').run(db_feedback._ensure_table)
+
+
+async def _fetch(sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    from psycopg.rows import dict_row
+    pool = await storage.get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(_psycopg(sql), params)
+            return await cur.fetchall()
+
+
+async def upsert_events(events: List[Dict[str, Any]]) -> int:
+    if not _native():
+        return await _write_pool().run(db.upsert_events, events)
+    written, rows = db.event_rows(events)
+    if not rows:
+        return 0
+    await _ensure_schema()
+    sql = _psycopg(db.bulk_insert_sql("memory_events", db.PG_EVENT_COLUMNS, ["text"] * len(db.PG_EVENT_COLUMNS), returning="id"))
+    ids: List[int] = []
+    pool = await storage.get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            for params in db.bulk_chunks(db.pg_event_rows(rows)):
+                await cur.execute(sql, params)
+                # 同 db.pg_bulk_insert_ids：块内 id 升序即行序
+                ids.extend(sorted(int(r[0]) for r in await cur.fetchall()))
+    for ev, i in zip(written, ids):
+        ev["id"] = i
+    return len(ids)
+
+
+async def delete_events(user_id: str, ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    return await (get_executor('db') if db._use_pg() else _write_pool()).run(db.delete_events, user_id, ids)
+
+
+async def query_events(user_id: str, query: Optional[str], top_k: int) -> List[Dict[str, Any]]:
+    if not _native():
+        return await get_executor('db').run(db.query_events, user_id, query, top_k)
+    if not user_id:
+        return []
+    await _ensure_schema()
+    return [db.event_dict(r) for r in await _fetch(*db.pg_query_events_sql(user_id, query, top_k))]
+
+
+async def fetch_user_events(user_id: str, since_days: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    if not _native():
+        return await get_executor('db').run(db.fetch_user_events, user_id, since_days=since_days, limit=limit)
+    if not user_id:
+        return []
+    await _ensure_schema()
+    return [db.event_dict(r) for r in await _fetch(*db.pg_fetch_user_events_sql(user_id, since_days, limit))]
+
+
+async def insert_feedback(ev: Dict[str, Any]) -> int:
+    return await insert_feedback_many([ev])
+
+
+async def insert_feedback_many(events: List[Dict[str, Any]]) -> int:
+    if not _native():
+        return await _write_pool().run(db_feedback.insert_feedback_many, events)
+    rows = db_feedback.feedback_rows(events)
+    if not rows:
+        return 0
+    await _ensure_feedback_table()
+    sql = _psycopg(db.bulk_insert_sql("user_feedback", db_feedback.FEEDBACK_COLUMNS, db_feedback.PG_FEEDBACK_TYPES))
+    total = 0
+    pool = await storage.get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            for params in db.bulk_chunks(rows):
+                await cur.execute(sql, params)
+                total += cur.rowcount or 0
+    return total
+
+
+async def fetch_feedback_stats(user_id: str) -> Dict[str, Any]:
+    if not _native():
+        return await get_executor('db').run(db_feedback.fetch_feedback_stats, user_id)
+    await _ensure_feedback_table()
+    rows = await _fetch(db_feedback.PG_STATS_SQL, {"uid": user_id})
+    return {"counts": {r["feedback_type"]: int(r["cnt"]) for r in rows}}
+
+
+async def _vector_conn(conn):
+    if conn not in _vector_conns:
+        from pgvector.psycopg import register_vector_async
+        await register_vector_async(conn)
+        _vector_conns.add(conn)
+    return conn
+
+
+async def _ensure_vector_table(dim: int) -> None:
+    # 建扩展/建表/检查列类型与 ANN 索引只做一次，沿用同步实现
+    if not vector_store._pg_ready:
+        await get_executor('db').run(vector_store._ensure_index, dim)
+
+
+async def vector_add_texts(texts: List[str], metas: List[Dict[str, Any]]) -> None:
+    if not _native():
+        return await get_executor('inference').run(vector_store.add_texts, texts, metas)
+    embs = await get_executor('inference').run(vector_store.embed_encode, texts)
+    await vector_add_embeddings(embs, metas)
+
+
+async def vector_add_embeddings(embs: np.ndarray, metas: List[Dict[str, Any]]) -> None:
+    if not _native():
+        return await get_executor('inference').run(vector_store.add_embeddings, embs, metas)
+    embs = np.asarray(embs, dtype=np.float32)
+    if not len(metas):
+        return
+    await _ensure_vector_table(embs.shape[1])
+    rows = vector_store._pg_rows(embs, metas)
+    pool = await storage.get_async_pool()
+    async with pool.connection() as conn:
+        await _vector_conn(conn)
+        async with conn.cursor() as cur:
+            # 同 vector_store._pg_insert：大批量 COPY BINARY，小批量 executemany
+            if len(rows) >= vector_store._PG_COPY_MIN_ROWS:
+                async with cur.copy(vector_store._PG_COPY_SQL) as copy:
+                    copy.set_types(vector_store._pg_copy_types())
+                    for row in rows:
+                        await copy.write_row(row)
+            else:
+                await cur.executemany(vector_store._PG_INSERT_SQL, rows)
+    metrics_inc('pgvector_rows_written', len(rows))
+
+
+async def _pg_search(conn, emb: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]],
+                     ef_search: Optional[int], probes: Optional[int]) -> List[Dict[str, Any]]:
+    """同 vector_store._pg_search：在调用方的事务内 SET LOCAL 后检索"""
+    from psycopg.rows import dict_row
+    sql, params = vector_store._pg_search_sql(emb, top_k, filters)
+    async with conn.cursor(row_factory=dict_row) as cur:
+        for stmt in vector_store._pg_search_settings_sql(ef_search, probes):
+            await cur.execute(stmt)
+        await cur.execute(_psycopg(sql), params)
+        return [vector_store._pg_hit(r) for r in await cur.fetchall()]
+
+
+async def vector_query(text: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None, **kwargs) -> List[Dict[str, Any]]:
+    if not _native():
+        return await get_executor('inference').run(vector_store.query, text, top_k=top_k, filters=filters, **kwargs)
+    embs = await get_executor('inference').run(vector_store.embed_encode, [text])
+    return await vector_query_embedding(embs[0], top_k=top_k, filters=filters, **kwargs)
+
+
+async def vector_query_embedding(emb: np.ndarray, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                                 ef_search: Optional[int] = None, probes: Optional[int] = None,
+                                 half_life_days: Optional[float] = None, type_weights: Optional[Dict[str, float]] = None,
+                                 recency_weight: Optional[float] = None) -> List[Dict[str, Any]]:
+    if not _native():
+        return await get_executor('inference').run(
+            vector_store.query_embedding, emb, top_k=top_k, filters=filters, ef_search=ef_search, probes=probes,
+            half_life_days=half_life_days, type_weights=type_weights, recency_weight=recency_weight)
+    emb = np.asarray(emb, dtype=np.float32)
+    await _ensure_vector_table(emb.shape[0])
+    fetch_k = vector_store._fetch_size(top_k, half_life_days, type_weights)
+    pool = await storage.get_async_pool()
+    async with pool.connection() as conn:
+        await _vector_conn(conn)
+        async with conn.transaction():
+            results = await _pg_search(conn, emb, fetch_k, filters, ef_search, probes)
+    if fetch_k != int(top_k):
+        return vector_store.rerank(results, top_k, half_life_days, type_weights, recency_weight)
+    return results
+
+
+async def vector_query_batch(specs: List[Dict[str, Any]]) -> List[Any]:
+    if not _native():
+        return await get_executor('inference').run(vector_store.query_batch, specs)
+    if not specs:
+        return []
+    embs = np.asarray(await get_executor('inference').run(vector_store.embed_encode, [s["text"] for s in specs]), dtype=np.float32)
+    await _ensure_vector_table(embs.shape[1])
+    out: List[Any] = [None] * len(specs)
+    pool = await storage.get_async_pool()
+    # 同 vector_store.query_embedding_batch：同一连接上逐条执行，每条独立事务，单条失败不影响其他查询
+    async with pool.connection() as conn:
+        await _vector_conn(conn)
+        for i, spec in enumerate(specs):
+            top_k = int(spec.get("top_k", 5))
+            fetch_k = vector_store._fetch_size(top_k, spec.get("half_life_days"), spec.get("type_weights"))
+            try:
+                async with conn.transaction():
+                    found = await _pg_search(conn, embs[i], fetch_k, spec.get("filters"), spec.get("ef_search"), spec.get("probes"))
+            except Exception as e:
+                out[i] = e
+                continue
+            out[i] = found if fetch_k == top_k else vector_store.rerank(
+                found, top_k, spec.get("half_life_days"), spec.get("type_weights"), spec.get("recency_weight"))
+    metrics_inc('vector_batch_queries', len(specs))
+    return out
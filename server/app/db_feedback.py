@@ -1,50 +1,27 @@
-import os
-import sqlite3
 from typing import Dict, Any, List
 from threading import Lock
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from .storage import use_pg as _use_pg, get_engine as _get_engine, sqlite as _sqlite
+from .db import pg_bulk_insert
 
+# 只串行化建表；读写不加进程级锁（同 db.py）
 _DB_LOCK = Lock()
-_DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(__file__))
-_DB_PATH = os.path.join(_DATA_DIR, 'memory.db')
 
-# Postgres support (reuse same env as db.py)
-_PG_DSN = os.getenv("POSTGRES_DSN")
-_PG_HOST = os.getenv("POSTGRES_HOST")
-_PG_PORT = os.getenv("POSTGRES_PORT", "5432")
-_PG_DB = os.getenv("POSTGRES_DB")
-_PG_USER = os.getenv("POSTGRES_USER")
-_PG_PASSWORD = os.getenv("POSTGRES_PASSWORD")
-_ENGINE = None
+# 同 db.py：lifespan 中建表，未经 lifespan 的进程首次访问时补建
+_table_ready = False
 
 
-def _use_pg() -> bool:
-    return bool(_PG_DSN or (_PG_HOST and _PG_DB and _PG_USER and _PG_PASSWORD))
-
-
-def _get_engine():
-    global _ENGINE
-    if _ENGINE is not None:
-        return _ENGINE
-    if _PG_DSN:
-        dsn = _PG_DSN
-    else:
-        dsn = f"postgresql+psycopg://{_PG_USER}:{_PG_PASSWORD}@{_PG_HOST}:{_PG_PORT}/{_PG_DB}"
-    _ENGINE = create_engine(dsn, pool_pre_ping=True)
-    return _ENGINE
-
-
-def _connect():
-    if _use_pg():
-        raise RuntimeError("_connect() should not be used when Postgres is enabled")
-    conn = sqlite3.connect(_DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def _ensure_table():
+    if not _table_ready:
+        ensure_feedback_table()
 
 
 def ensure_feedback_table():
-    with _DB_LOCK:
-        if _use_pg():
+    global _table_ready
+    if _use_pg():
+        with _DB_LOCK:
+            if _table_ready:
+                return
             eng = _get_engine()
             with eng.begin() as conn:
                 conn.execute(text(
@@ -62,83 +39,78 @@ def ensure_feedback_table():
                     CREATE INDEX IF NOT EXISTS idx_feedback_user ON user_feedback(user_id);
                     """
                 ))
+            _table_ready = True
             return
-        conn = _connect()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS user_feedback (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    target_type TEXT,
-                    target_id TEXT,
-                    feedback_type TEXT NOT NULL,
-                    score REAL,
-                    comment TEXT,
-                    timestamp TEXT
-                )
-                """
+    # SQLite：写连接串行，退出时提交
+    with _sqlite().writer() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                target_type TEXT,
+                target_id TEXT,
+                feedback_type TEXT NOT NULL,
+                score REAL,
+                comment TEXT,
+                timestamp TEXT
             )
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_feedback_user ON user_feedback(user_id)")
-            conn.commit()
-        finally:
-            conn.close()
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_feedback_user ON user_feedback(user_id)")
+    _table_ready = True
+
+
+FEEDBACK_COLUMNS = ["user_id", "target_type", "target_id", "feedback_type", "score", "comment", "timestamp"]
+PG_FEEDBACK_TYPES = ["text", "text", "text", "text", "double precision", "text", "text"]
+PG_STATS_SQL = "SELECT feedback_type, COUNT(1) as cnt FROM user_feedback WHERE user_id=:uid GROUP BY feedback_type"
+
+
+def feedback_rows(events: List[Dict[str, Any]]) -> List[tuple]:
+    return [tuple(ev.get(c) for c in FEEDBACK_COLUMNS) for ev in (events or [])]
 
 
 def insert_feedback(ev: Dict[str, Any]) -> int:
-    with _DB_LOCK:
-        if _use_pg():
-            eng = _get_engine()
-            with eng.begin() as conn:
-                res = conn.execute(text(
-                    """
-                    INSERT INTO user_feedback(user_id, target_type, target_id, feedback_type, score, comment, timestamp)
-                    VALUES (:user_id, :target_type, :target_id, :feedback_type, :score, :comment, :timestamp)
-                    """
-                ), ev)
-                return res.rowcount or 0
-        conn = _connect()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO user_feedback(user_id, target_type, target_id, feedback_type, score, comment, timestamp) VALUES(?,?,?,?,?,?,?)",
-                (
-                    ev.get('user_id'),
-                    ev.get('target_type'),
-                    ev.get('target_id'),
-                    ev.get('feedback_type'),
-                    ev.get('score'),
-                    ev.get('comment'),
-                    ev.get('timestamp'),
-                )
-            )
-            conn.commit()
-            return cur.rowcount or 0
-        finally:
-            conn.close()
+    return insert_feedback_many([ev])
+
+
+def insert_feedback_many(events: List[Dict[str, Any]]) -> int:
+    """批量写入反馈，返回实际写入的行数"""
+    rows = feedback_rows(events)
+    if not rows:
+        return 0
+    _ensure_table()
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            return pg_bulk_insert(conn, "user_feedback", FEEDBACK_COLUMNS, PG_FEEDBACK_TYPES, rows)
+    # SQLite：写连接串行，退出时提交
+    with _sqlite().writer() as conn:
+        cur = conn.cursor()
+        cur.executemany(
+            "INSERT INTO user_feedback(user_id, target_type, target_id, feedback_type, score, comment, timestamp) VALUES(?,?,?,?,?,?,?)",
+            rows,
+        )
+        return int(cur.rowcount)
 
 
 def fetch_feedback_stats(user_id: str) -> Dict[str, Any]:
-    with _DB_LOCK:
-        if _use_pg():
-            eng = _get_engine()
-            with eng.begin() as conn:
-                rows = conn.execute(text(
-                    "SELECT feedback_type, COUNT(1) as cnt FROM user_feedback WHERE user_id=:uid GROUP BY feedback_type"
-                ), {"uid": user_id}).all()
-            counts = {row[0]: int(row[1]) for row in rows}
-            return {"counts": counts}
-        conn = _connect()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT feedback_type, COUNT(1) as cnt FROM user_feedback WHERE user_id=? GROUP BY feedback_type",
-                (user_id,)
-            )
-            rows = cur.fetchall()
-            counts = {row[0]: int(row[1]) for row in rows}
-            return {"counts": counts}
-        finally:
-            conn.close()
+    _ensure_table()
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            rows = conn.execute(text(PG_STATS_SQL), {"uid": user_id}).all()
+        counts = {row[0]: int(row[1]) for row in rows}
+        return {"counts": counts}
+    # SQLite：只读连接池，WAL 下不被写入阻塞
+    with _sqlite().reader() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT feedback_type, COUNT(1) as cnt FROM user_feedback WHERE user_id=? GROUP BY feedback_type",
+            (user_id,)
+        )
+        rows = cur.fetchall()
+        counts = {row[0]: int(row[1]) for row in rows}
+        return {"counts": counts}
 
@@ -0,0 +1,151 @@
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .db import content_hash, existing_hash_times
+from .embedding import encode as embed_encode
+from .metrics import inc as metrics_inc
+from . import vector_store
+
+# 写入前去重（同一用户、同一类型）：
+#   - 所有类型：内容指纹相同且时间戳相差不超过 MEMORY_DEDUP_RETRY_MINUTES 视为客户端重试/重复同步
+#   - MEMORY_DEDUP_TYPES 中的类型（如反复抽取的目标）：时间窗内指纹相同（精确）或向量余弦不低于阈值（近似）即视为重复
+# 心情、打卡、闲聊等按天重复出现的记录属于时间序列，不在 MEMORY_DEDUP_TYPES 中，不同日期的同文本都会保留
+_ENABLED = os.getenv('MEMORY_DEDUP', '1') == '1'
+_NEAR_COSINE = float(os.getenv('MEMORY_DEDUP_COSINE', '0.95'))  # >= 1 关闭近似去重
+_WINDOW_DAYS = int(os.getenv('MEMORY_DEDUP_WINDOW_DAYS', '30'))  # 去重类型只与该时间窗内的记忆比较（0 = 不限）
+_NEIGHBOURS = max(1, int(os.getenv('MEMORY_DEDUP_NEIGHBOURS', '5')))  # 每条新记忆检查的近邻数
+_TYPES = {t.strip() for t in os.getenv('MEMORY_DEDUP_TYPES', 'goal').split(',') if t.strip()}
+_RETRY_MINUTES = float(os.getenv('MEMORY_DEDUP_RETRY_MINUTES', '10'))
+
+
+def _parse_ts(ts: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(ts) if ts else None
+    except ValueError:
+        return None
+
+
+def _window(type_: Optional[str]) -> Optional[timedelta]:
+    """同一内容视为重复的最大时间差（None = 不限）"""
+    if type_ in _TYPES:
+        return timedelta(days=_WINDOW_DAYS) if _WINDOW_DAYS > 0 else None
+    return timedelta(minutes=max(0.0, _RETRY_MINUTES))
+
+
+def _within_window(type_: Optional[str], ts: Optional[str], other_ts: Optional[str]) -> bool:
+    window = _window(type_)
+    if window is None:
+        return True
+    a, b = _parse_ts(ts), _parse_ts(other_ts)
+    if a is None or b is None:
+        return True
+    try:
+        return abs(a - b) <= window
+    except TypeError:  # 带时区与不带时区的时间戳无法比较，按同一时间窗处理
+        return True
+
+
+def _window_start(events: List[Dict[str, Any]]) -> Optional[str]:
+    """精确去重的查询下界：各事件时间戳减去其类型的时间窗，取最早者（任一事件不限时间窗时为 None）"""
+    starts = []
+    for ev in events:
+        window = _window(ev.get("type"))
+        ts = _parse_ts(ev.get("timestamp"))
+        if window is None or ts is None:
+            return None
+        starts.append(ts - window)
+    return min(starts).isoformat(timespec='minutes') if starts else None
+
+
+def _stored_duplicate(ev: Dict[str, Any], hits: Any) -> bool:
+    """该用户分区中的近邻是否有同类型、时间窗内且余弦不低于阈值的记忆"""
+    if isinstance(hits, Exception):
+        return False
+    return any(
+        it.get("type") == ev.get("type") and float(it.get("score", 0.0)) >= _NEAR_COSINE
+        and _within_window(ev.get("type"), ev.get("timestamp"), it.get("timestamp"))
+        for it in hits or []
+    )
+
+
+def _near_flags(textual: List[Dict[str, Any]], embs: np.ndarray) -> List[bool]:
+    """逐条判定近似重复：先比较本批次内已保留的同用户同类型记忆，再查库中近邻。
+
+    库中近邻一次批量检索；批次内比较按 (用户, 类型) 分组做一次矩阵乘，离线同步上传上千条时不再逐条查询。
+    """
+    hits = vector_store.query_embedding_batch(
+        embs, [{"top_k": _NEIGHBOURS, "filters": {"user_id": ev["user_id"]}} for ev in textual])
+    groups: Dict[Tuple[str, Optional[str]], List[int]] = {}
+    for i, ev in enumerate(textual):
+        groups.setdefault((ev["user_id"], ev.get("type")), []).append(i)
+    flags = [False] * len(textual)
+    for idxs in groups.values():
+        sims = embs[idxs] @ embs[idxs].T
+        kept_local: List[int] = []
+        for a, i in enumerate(idxs):
+            if (kept_local and bool((sims[a, kept_local] >= _NEAR_COSINE).any())) or _stored_duplicate(textual[i], hits[i]):
+                flags[i] = True
+            else:
+                kept_local.append(a)
+    return flags
+
+
+def dedup_events(events: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """过滤重复记忆，返回 (保留的事件, {"exact": n, "near": n})；无文本的事件不参与去重"""
+    report = {"exact": 0, "near": 0}
+    if not _ENABLED or not events:
+        return events, report
+
+    # 精确重复：批次内与库中已有的内容指纹
+    hashes = [content_hash(ev.get("type"), ev.get("text")) if ev.get("user_id") else None for ev in events]
+    by_user: Dict[str, List[str]] = {}
+    for ev, h in zip(events, hashes):
+        if h:
+            by_user.setdefault(ev["user_id"], []).append(h)
+    since = _window_start(events)
+    stored = {uid: existing_hash_times(uid, hs, since=since) for uid, hs in by_user.items()}
+    kept_times: Dict[Tuple[str, str], List[Optional[str]]] = {}
+    candidates: List[Tuple[Dict[str, Any], Optional[str]]] = []
+    for ev, h in zip(events, hashes):
+        if h:
+            key = (ev["user_id"], h)
+            prior = stored.get(ev["user_id"], {}).get(h, []) + kept_times.get(key, [])
+            if any(_within_window(ev.get("type"), ev.get("timestamp"), ts) for ts in prior):
+                report["exact"] += 1
+                continue
+            kept_times.setdefault(key, []).append(ev.get("timestamp"))
+        candidates.append((ev, h))
+
+    # 近似重复（仅 MEMORY_DEDUP_TYPES 中的类型）：向量余弦（编码结果进入嵌入缓存，随后写向量索引时不会重复编码）
+    kept: List[Dict[str, Any]] = [ev for ev, h in candidates if not (h and ev.get("type") in _TYPES)]
+    textual = [ev for ev, h in candidates if h and ev.get("type") in _TYPES]
+    if textual and _NEAR_COSINE < 1.0:
+        try:
+            embs = np.asarray(embed_encode([ev["text"] for ev in textual]), dtype=np.float32)
+        except Exception as e:
+            print(f"Near-duplicate check skipped, encoding failed: {e}")
+            embs = None
+        flags = [False] * len(textual)
+        if embs is not None:
+            try:
+                flags = _near_flags(textual, embs)
+            except Exception as e:
+                # 向量后端不可用时本批次只做精确去重
+                print(f"Near-duplicate check skipped, vector lookup failed: {e}")
+        for ev, dup in zip(textual, flags):
+            if dup:
+                report["near"] += 1
+            else:
+                kept.append(ev)
+    else:
+        kept.extend(textual)
+
+    # 保持原始顺序
+    order = {id(ev): i for i, ev in enumerate(events)}
+    kept.sort(key=lambda ev: order[id(ev)])
+    if report["exact"]:
+        metrics_inc('memory_dedup_exact', report["exact"])
+    if report["near"]:
+        metrics_inc('memory_dedup_near', report["near"])
+    return kept, report
@@ -0,0 +1,379 @@
+import os
+import re
+import json
+import time
+import base64
+import hashlib
+import unicodedata
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+# sentence_transformers（连带 torch）与 onnxruntime 只在加载模型时导入，避免拖慢进程启动
+HAS_ONNXRUNTIME = importlib.util.find_spec('onnxruntime') is not None  # optional, EMBED_BACKEND=onnx / onnx-int8
+from .metrics import inc as metrics_inc
+
+_MODEL_NAME = os.getenv('EMBED_MODEL', 'moka-ai/m3e-small')
+
+# 推理后端：torch（SentenceTransformer）| onnx | onnx-int8（动态 int8 量化）
+_BACKEND = os.getenv('EMBED_BACKEND', 'torch').lower()
+_ONNX_DIR = os.getenv('EMBED_ONNX_DIR', os.path.join(os.getenv('DATA_DIR', os.path.dirname(__file__)), 'onnx'))
+_ONNX_MIN_COSINE = float(os.getenv('EMBED_ONNX_MIN_COSINE', '0.99'))
+_ONNX_THREADS = int(os.getenv('EMBED_ONNX_THREADS', '0'))  # 0 = onnxruntime 默认
+_ONNX_PROBES = [
+    "今天心情不错，想出去散步",
+    "最近工作压力很大，晚上睡不好",
+    "我打算每天读书半小时",
+    "The weather is nice today.",
+]
+
+# 动态微批：并发的 encode 请求在 max_wait 内合并为一次前向计算
+_MAX_BATCH = int(os.getenv('EMBED_BATCH_MAX_SIZE', '32'))
+_MAX_WAIT_MS = float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', '5'))
+
+# 内容寻址缓存：(模型名, 归一化文本哈希) -> 向量
+_CACHE_MAX_ITEMS = int(os.getenv('EMBED_CACHE_MAX_ITEMS', '10000'))
+_CACHE_REDIS = os.getenv('EMBED_CACHE_REDIS', '0') == '1'
+_CACHE_REDIS_TTL = int(os.getenv('EMBED_CACHE_REDIS_TTL', str(86400 * 7)))
+
+_model_lock = Lock()
+_model = None
+_dim: Optional[int] = None
+
+
+def model_name() -> str:
+    return _MODEL_NAME
+
+
+def backend() -> str:
+    return _BACKEND
+
+
+def cache_namespace(model: str) -> str:
+    """缓存键命名空间：非 torch 后端的向量与 torch 略有差异，分开缓存"""
+    return model if _BACKEND == 'torch' else f"{model}@{_BACKEND}"
+
+
+class OnnxSentenceEncoder:
+    """onnxruntime 上的句向量编码器，encode 接口与 SentenceTransformer 一致。
+
+    首次使用时从 SentenceTransformer 导出 transformer 主干（池化在 numpy 中完成），可选动态 int8 量化，
+    并在导出时与 torch 输出比对余弦相似度，低于 EMBED_ONNX_MIN_COSINE 则拒绝使用。
+    """
+
+    def __init__(self, model_name: str, quantize: bool = False, device: Optional[str] = None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        self.model_name = model_name
+        self.dir = os.path.join(_ONNX_DIR, model_name.replace('/', '__'))
+        variant = 'model.int8.onnx' if quantize else 'model.onnx'
+        info = self._load_info()
+        if variant not in info.get('verified', {}):
+            info = self._export(quantize)
+        self.info = info
+        self.tokenizer = AutoTokenizer.from_pretrained(self.dir)
+        opts = onnxruntime.SessionOptions()
+        if _ONNX_THREADS > 0:
+            opts.intra_op_num_threads = _ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(os.path.join(self.dir, variant), opts, providers=['CPUExecutionProvider'])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def _load_info(self) -> Dict:
+        try:
+            with open(os.path.join(self.dir, 'export.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _export(self, quantize: bool) -> Dict:
+        import torch
+        import onnxruntime
+        from sentence_transformers import SentenceTransformer
+        st = SentenceTransformer(self.model_name, device='cpu')
+        transformer, pooling = st[0], st[1]
+        os.makedirs(self.dir, exist_ok=True)
+        info = self._load_info()
+        info.update({
+            'dim': int(st.get_sentence_embedding_dimension()),
+            'max_seq_length': int(transformer.max_seq_length or 512),
+            'pooling': 'cls' if pooling.pooling_mode_cls_token else ('max' if pooling.pooling_mode_max_tokens else 'mean'),
+        })
+        info.setdefault('verified', {})
+        path = os.path.join(self.dir, 'model.onnx')
+        if not os.path.exists(path):
+            class _Backbone(torch.nn.Module):
+                def __init__(self, m):
+                    super().__init__()
+                    self.m = m
+
+                def forward(self, input_ids, attention_mask):
+                    return self.m(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+            sample = transformer.tokenizer(_ONNX_PROBES, padding=True, return_tensors='pt')
+            torch.onnx.export(
+                _Backbone(transformer.auto_model.eval()),
+                (sample['input_ids'], sample['attention_mask']),
+                path + '.tmp',
+                input_names=['input_ids', 'attention_mask'],
+                output_names=['last_hidden_state'],
+                dynamic_axes={'input_ids': {0: 'batch', 1: 'seq'}, 'attention_mask': {0: 'batch', 1: 'seq'},
+                              'last_hidden_state': {0: 'batch', 1: 'seq'}},
+                opset_version=14,
+            )
+            os.replace(path + '.tmp', path)
+            transformer.tokenizer.save_pretrained(self.dir)
+        variant = 'model.onnx'
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            variant = 'model.int8.onnx'
+            quantize_dynamic(path, os.path.join(self.dir, variant), weight_type=QuantType.QInt8)
+        # 与 torch 输出比对
+        self.info = info
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(self.dir)
+        self.session = onnxruntime.InferenceSession(os.path.join(self.dir, variant), providers=['CPUExecutionProvider'])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        ref = np.asarray(st.encode(_ONNX_PROBES, normalize_embeddings=True), dtype=np.float32)
+        got = self.encode(_ONNX_PROBES, normalize_embeddings=True)
+        min_cos = float(np.min(np.sum(ref * got, axis=1)))
+        if min_cos < _ONNX_MIN_COSINE:
+            raise RuntimeError(f"ONNX export {variant} deviates from torch (min cosine {min_cos:.5f} < {_ONNX_MIN_COSINE})")
+        info['verified'][variant] = round(min_cos, 6)
+        with open(os.path.join(self.dir, 'export.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        os.replace(os.path.join(self.dir, 'export.json.tmp'), os.path.join(self.dir, 'export.json'))
+        return info
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.info['dim'])
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **_kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        out: List[np.ndarray] = []
+        for start in range(0, len(sentences), max(1, int(batch_size))):
+            batch = list(sentences[start:start + max(1, int(batch_size))])
+            enc = self.tokenizer(batch, padding=True, truncation=True, max_length=self.info['max_seq_length'], return_tensors='np')
+            feeds = {k: enc[k].astype(np.int64) for k in ('input_ids', 'attention_mask') if k in self._inputs}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc['attention_mask'][..., None].astype(np.float32)
+            if self.info['pooling'] == 'cls':
+                pooled = hidden[:, 0]
+            elif self.info['pooling'] == 'max':
+                pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+            else:
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            out.append(pooled.astype(np.float32))
+        embs = np.concatenate(out) if out else np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        if normalize_embeddings:
+            embs = embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+        return embs
+
+
+def load_encoder(model_name: str, device: Optional[str] = None):
+    """按 EMBED_BACKEND 加载编码器；ONNX 不可用或校验失败时回退到 torch"""
+    if _BACKEND in ('onnx', 'onnx-int8'):
+        if not HAS_ONNXRUNTIME:
+            print("EMBED_BACKEND=%s but onnxruntime is not installed; using torch" % _BACKEND)
+        else:
+            try:
+                return OnnxSentenceEncoder(model_name, quantize=(_BACKEND == 'onnx-int8'), device=device)
+            except Exception as e:
+                print(f"ONNX embedding backend unavailable for {model_name}, using torch: {e}")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=device) if device else SentenceTransformer(model_name)
+
+
+def get_model():
+    global _model, _dim
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model = load_encoder(_MODEL_NAME)
+                _dim = model.get_sentence_embedding_dimension()
+                _model = model
+    return _model
+
+
+def dimension() -> int:
+    get_model()
+    return int(_dim)
+
+
+class EmbeddingBatcher:
+    """收集并发的编码请求，按批次交给模型执行"""
+
+    def __init__(self, max_batch: int = _MAX_BATCH, max_wait_ms: float = _MAX_WAIT_MS):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "Queue[Tuple[List[str], Future, float]]" = Queue()
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._thread.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """编码并归一化；阻塞直到所在批次完成"""
+        if not texts:
+            return np.zeros((0, dimension()), dtype=np.float32)
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((list(texts), fut, time.perf_counter()))
+        return fut.result()
+
+    def _collect(self) -> List[Tuple[List[str], Future, float]]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            texts: List[str] = [t for item in batch for t in item[0]]
+            try:
+                model = get_model()
+                # 单次前向最多 max_batch 条：批量写入/回填上千条时按块编码，峰值内存有界
+                embs = np.asarray(model.encode(texts, batch_size=self.max_batch, normalize_embeddings=True), dtype=np.float32)
+            except Exception as e:
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                continue
+            offset = 0
+            for item_texts, fut, _ in batch:
+                fut.set_result(embs[offset: offset + len(item_texts)])
+                offset += len(item_texts)
+            try:
+                wait_ms = sum((started - enq) * 1000.0 for _, _, enq in batch)
+                metrics_inc('embed_batches', 1)
+                metrics_inc('embed_batch_requests', len(batch))
+                metrics_inc('embed_batch_texts', len(texts))
+                metrics_inc('embed_queue_wait_ms_sum', int(wait_ms))
+                metrics_inc('embed_forward_ms_sum', int((time.perf_counter() - started) * 1000))
+            except Exception:
+                pass
+
+
+def normalize_text(text: str) -> str:
+    """缓存键用的文本归一化：NFKC、去首尾空白、合并连续空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+class EmbeddingCache:
+    """有界 LRU 向量缓存；开启 EMBED_CACHE_REDIS 时经 CacheManager 共享到 Redis"""
+
+    def __init__(self, max_items: int = _CACHE_MAX_ITEMS, use_redis: bool = _CACHE_REDIS):
+        self.max_items = max(0, int(max_items))
+        self.use_redis = use_redis
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        digest = hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+        return f"emb:{model}:{digest}"
+
+    def _redis(self):
+        if not self.use_redis:
+            return None
+        try:
+            from .models import get_cache_manager
+            cm = get_cache_manager()
+            return cm if cm.enabled else None
+        except Exception:
+            return None
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._items.get(key)
+            if vec is not None:
+                self._items.move_to_end(key)
+                return vec
+        cm = self._redis()
+        if cm is None:
+            return None
+        data = cm.get(key)
+        if not data or 'v' not in data:
+            return None
+        vec = np.frombuffer(base64.b64decode(data['v']), dtype=data.get('dtype', 'float32'))
+        metrics_inc('embed_cache_redis_hits', 1)
+        self._put_local(key, vec)
+        return vec
+
+    def _put_local(self, key: str, vec: np.ndarray) -> None:
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = vec
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        self._put_local(key, vec)
+        cm = self._redis()
+        if cm is not None:
+            cm.set(key, {'v': base64.b64encode(vec.tobytes()).decode('ascii'), 'dtype': str(vec.dtype)}, ttl=_CACHE_REDIS_TTL)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+_cache = EmbeddingCache()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    return _cache
+
+
+def cached_encode(model: str, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+    """先查缓存，仅对未命中（去重后）的文本调用 encode_fn"""
+    keys = [EmbeddingCache.key(model, t) for t in texts]
+    found: Dict[str, np.ndarray] = {}
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k in found or k in missing:
+            continue
+        vec = _cache.get(k)
+        if vec is None:
+            missing[k] = t
+        else:
+            found[k] = vec
+    hits = sum(1 for k in keys if k in found)
+    metrics_inc('embed_cache_hits', hits)
+    metrics_inc('embed_cache_misses', len(keys) - hits)
+    if missing:
+        embs = np.asarray(encode_fn(list(missing.values())))
+        for k, vec in zip(missing.keys(), embs):
+            _cache.put(k, vec)
+            found[k] = vec
+    if not keys:
+        return np.asarray(encode_fn([]))
+    return np.stack([found[k] for k in keys])
+
+
+_batcher = EmbeddingBatcher()
+
+
+def encode(texts: List[str]) -> np.ndarray:
+    """归一化句向量（float32, shape=(n, dim)），先查缓存，未命中的经微批合并后执行"""
+    return cached_encode(cache_namespace(_MODEL_NAME), texts, _batcher.encode)
@@ -0,0 +1,109 @@
+import os
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+from .metrics import inc as metrics_inc
+
+# 阻塞调用按类型分流到独立线程池，避免慢请求占满事件循环或互相挤占：
+#   inference - 向量编码/检索、情感模型等推理
+#   db        - SQLite/Postgres 读写
+#   db_write  - SQLite 写入（单写连接本就串行，独立线程避免排队的写入占满 db 线程池）
+#   analytics - 聚类、模型训练等重计算
+_POOL_SIZES = {
+    'inference': int(os.getenv('EXECUTOR_INFERENCE_WORKERS', '4')),
+    'db': int(os.getenv('EXECUTOR_DB_WORKERS', '8')),
+    'db_write': int(os.getenv('EXECUTOR_DB_WRITE_WORKERS', '1')),
+    'analytics': int(os.getenv('EXECUTOR_ANALYTICS_WORKERS', '2')),
+}
+
+
+class InstrumentedExecutor:
+    """ThreadPoolExecutor 包装：统计排队深度、执行中数量、排队与执行耗时"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'{name}-exec')
+        self._lock = Lock()
+        self.queued = 0
+        self.active = 0
+
+    def _wrap(self, fn: Callable[[], Any], submitted: float) -> Callable[[], Any]:
+        def run():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn()
+            finally:
+                with self._lock:
+                    self.active -= 1
+                metrics_inc(f'executor_{self.name}_tasks', 1)
+                metrics_inc(f'executor_{self.name}_wait_ms_sum', int((started - submitted) * 1000))
+                metrics_inc(f'executor_{self.name}_run_ms_sum', int((time.perf_counter() - started) * 1000))
+        return run
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        # 复制 contextvars，与 starlette.run_in_threadpool 行为一致
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._wrap(call, time.perf_counter()))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"workers": self.workers, "queued": self.queued, "active": self.active}
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+_executors: Dict[str, InstrumentedExecutor] = {}
+_executors_lock = Lock()
+
+
+def get_executor(name: str) -> InstrumentedExecutor:
+    ex = _executors.get(name)
+    if ex is None:
+        with _executors_lock:
+            ex = _executors.get(name)
+            if ex is None:
+                if name not in _POOL_SIZES:
+                    raise KeyError(f"unknown executor: {name}")
+                ex = _executors[name] = InstrumentedExecutor(name, _POOL_SIZES[name])
+    return ex
+
+
+async def run_inference(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await get_executor('inference').run(fn, *args, **kwargs)
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await get_executor('db').run(fn, *args, **kwargs)
+
+
+async def run_analytics(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await get_executor('analytics').run(fn, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Dict[str, int]]:
+    """各线程池当前排队深度与执行中任务数（未使用过的线程池不创建，按 0 报告）"""
+    out: Dict[str, Dict[str, int]] = {}
+    for name, size in _POOL_SIZES.items():
+        ex: Optional[InstrumentedExecutor] = _executors.get(name)
+        out[name] = ex.stats() if ex is not None else {"workers": max(1, size), "queued": 0, "active": 0}
+    return out
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    with _executors_lock:
+        for ex in _executors.values():
+            ex.shutdown(wait=wait)
+        _executors.clear()
@@ -0,0 +1,55 @@
+import re
+import hashlib
+from typing import List
+try:
+    import jieba  # optional, 中文分词；缺失时退化为字/二元组切分
+    jieba.setLogLevel(60)
+    HAS_JIEBA = True
+except Exception:
+    jieba = None
+    HAS_JIEBA = False
+
+# 高频虚词不参与检索，避免 OR 查询命中用户的全部记录
+_STOPWORDS = {
+    '的', '了', '我', '你', '他', '她', '它', '是', '在', '和', '也', '就', '都', '很',
+    '吗', '呢', '啊', '吧', '呀', '着', '过', '把', '被', '又', '还', '要', '会', '有',
+    'the', 'a', 'an', 'to', 'of', 'and', 'is', 'in',
+}
+_WORD_RE = re.compile(r"[0-9a-zA-Z_]+|[一-鿿]+")
+
+
+def _fallback_cut(text: str) -> List[str]:
+    tokens: List[str] = []
+    for m in _WORD_RE.finditer(text):
+        w = m.group(0)
+        if w.isascii():
+            tokens.append(w)
+            continue
+        tokens.extend(w)
+        tokens.extend(w[i:i + 2] for i in range(len(w) - 1))
+    return tokens
+
+
+def tokenize(text: str) -> List[str]:
+    """检索用分词：jieba 搜索引擎模式，小写、去标点与停用词、保序去重"""
+    raw = jieba.cut_for_search(text or "") if HAS_JIEBA else _fallback_cut(text or "")
+    seen = set()
+    tokens: List[str] = []
+    for tok in raw:
+        tok = tok.strip().lower()
+        if not tok or tok in _STOPWORDS or not _WORD_RE.search(tok) or tok in seen:
+            continue
+        seen.add(tok)
+        tokens.append(tok)
+    return tokens
+
+
+def user_token(user_id: str) -> str:
+    """FTS 中按用户过滤用的索引列取值（哈希后避免特殊字符）"""
+    return 'u' + hashlib.sha1(str(user_id).encode('utf-8')).hexdigest()[:20]
+
+
+def fts5_query(user_id: str, tokens: List[str]) -> str:
+    """SQLite FTS5 MATCH 表达式：限定用户，任一词命中即可，由 bm25 排序"""
+    terms = " OR ".join('tokens:"' + t.replace('"', '""') + '"' for t in tokens)
+    return f'ukey:"{user_token(user_id)}" AND ({terms})'
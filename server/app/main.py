@@ -1,16 +1,30 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Response, HTTPException, Depends, Header
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, field_validator, model_validator
 from typing import List, Dict, Optional, Any
 from datetime import datetime
 from .models import get_emotion_analyzer, get_embedding_recommender, get_cache_manager
-from .advanced_analytics import behavior_analyzer, mood_predictor
-from .online_learning import adaptive_engine
-from .db import init_db, upsert_events, query_events
+from . import db_async as adb
+from .dedup import dedup_events
+from . import startup
+from .storage import close_async_pool
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Cuddle Cat AI Analysis Service")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # 建表与后台线程在此完成，模型在后台线程预热；导入 app.main 本身不做重活
+    startup.start()
+    yield
+    await close_async_pool()
+    startup.shutdown()
+
+
+app = FastAPI(title="Cuddle Cat AI Analysis Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,12 +34,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-init_db()
+from .retention import sweep_expired
+from .executors import run_inference, run_db, run_analytics, executor_stats
+from .storage import pool_stats as storage_pool_stats
 
 from .metrics import inc as metrics_inc, get_counters as metrics_get, uptime_seconds as metrics_uptime, add_latency_sample as metrics_add_latency, get_latency_p95 as metrics_p95
 
-from .db_feedback import ensure_feedback_table, insert_feedback, fetch_feedback_stats
-ensure_feedback_table()
+
+
+# sklearn 相关模块与引擎按需导入/构造（在线程池中调用，避免阻塞事件循环）
+def _get_adaptive_engine():
+    from .online_learning import get_adaptive_engine
+    return get_adaptive_engine()
+
+
+def _get_behavior_analyzer():
+    from .advanced_analytics import get_behavior_analyzer
+    return get_behavior_analyzer()
+
+
+def _get_mood_predictor():
+    from .advanced_analytics import get_mood_predictor
+    return get_mood_predictor()
 
 def require_metrics_key(x_api_key: str | None = Header(default=None, alias='X-API-Key')):
     required = os.getenv('METRICS_API_KEY') or os.getenv('AI_SERVICE_INTERNAL_KEY')
@@ -35,6 +65,23 @@ def require_metrics_key(x_api_key: str | None = Header(default=None, alias='X-AP
     return True
 
 
+_admin_key_warned = False
+
+def require_admin_key(x_api_key: str | None = Header(default=None, alias='X-API-Key')):
+    """不可逆操作（删除记忆、清理、重建索引）的鉴权：ADMIN_API_KEY，未设置时退回 AI_SERVICE_INTERNAL_KEY。
+
+    监控密钥只能读指标，不能用于删除。两者都未配置时放行（本地开发），并在首次调用时打印警告。
+    """
+    global _admin_key_warned
+    required = os.getenv('ADMIN_API_KEY') or os.getenv('AI_SERVICE_INTERNAL_KEY')
+    if required:
+        if not x_api_key or x_api_key != required:
+            raise HTTPException(status_code=403, detail='Forbidden')
+    elif not _admin_key_warned:
+        _admin_key_warned = True
+        print("WARNING: ADMIN_API_KEY / AI_SERVICE_INTERNAL_KEY not set; destructive endpoints are unauthenticated")
+    return True
+
 
 class MoodRecord(BaseModel):
     timestamp: str
@@ -129,12 +176,37 @@ class MemoryEvent(BaseModel):
 class MemoryUpsertRequest(BaseModel):
     events: List[MemoryEvent]
 
+class MemoryDeleteRequest(BaseModel):
+    user_id: str
+    ids: List[int]
+
 class MemoryQueryRequest(BaseModel):
     user_id: str
     query: Optional[str] = None
     top_k: int = 10
+    # pgvector ANN 查询参数（可选，覆盖 PGVECTOR_HNSW_EF_SEARCH / PGVECTOR_IVFFLAT_PROBES）
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    # 向量召回重排（可选）：时间衰减半衰期（天）与类型权重，如 {"goal": 1.2}
+    half_life_days: Optional[float] = None
+    type_weights: Optional[Dict[str, float]] = None
+
+class MemoryQueryBatchRequest(BaseModel):
+    queries: List[MemoryQueryRequest]
+    @field_validator('queries')
+    @classmethod
+    def _check_queries(cls, v: List[MemoryQueryRequest]):
+        if len(v) > _MAX_BATCH_QUERIES:
+            raise ValueError(f'too many queries (max={_MAX_BATCH_QUERIES})')
+        return v
+
+class MemoryQueryBatchResponse(BaseModel):
+    status: str = "success"
+    # 与请求同序，每项为 {"status": "success", "data": [...]} 或 {"status": "error", "message": ...}
+    data: List[Dict[str, Any]]
 
-from .vector_store import add_texts as vs_add_texts, query as vs_query
+from .retrieval import hybrid_search, hybrid_search_batch, recency_defaults
+from .vector_store import delete_matching as vs_delete_matching, delete_user as vs_delete_user, index_status as vs_index_status, ensure_ann_index as vs_ensure_ann_index
 
 class MemoryQueryResponse(BaseModel):
     status: str = "success"
@@ -147,6 +219,8 @@ _MAX_MESSAGE_LEN = 2000
 _MAX_MEMORY_TEXT_LEN = 2000
 _MAX_MEMORY_TYPE_LEN = 32
 _MAX_FEEDBACK_COMMENT_LEN = 500
+_MAX_BATCH_QUERIES = 32
+_MAX_FEEDBACK_BATCH = int(os.getenv('FEEDBACK_BATCH_MAX', '5000'))  # 离线同步单次上传的反馈条数上限
 _ALLOWED_FEEDBACK_TYPES = {"like","dislike","complete","skip","useful"}
 
 class ChatMessage(BaseModel):
@@ -208,7 +282,9 @@ async def recommend_gifts(req: RecommendRequest):
 
         # 使用自适应推荐引擎
         try:
-            adaptive_result = adaptive_engine.get_adaptive_recommendations(
+            adaptive_engine = await run_analytics(_get_adaptive_engine)
+            adaptive_result = await run_inference(
+                adaptive_engine.get_adaptive_recommendations,
                 user_context={
                     "recent_messages": req.recentMessages,
                     "mood_records": [r.dict() for r in req.moodRecords],
@@ -273,6 +349,7 @@ async def recommend_wellness_plan(req: RecommendRequest):
         user_id = req.stats.get("user_id", "anonymous") if req.stats else "anonymous"
         hour = datetime.now().hour
         # 从自适应引擎读取用户偏好
+        adaptive_engine = await run_analytics(_get_adaptive_engine)
         prefs = adaptive_engine.user_preferences.get(user_id, {
             'category_weights': {},
             'time_preferences': {},
@@ -333,8 +410,7 @@ async def recommend_wellness_plan(req: RecommendRequest):
 @app.get("/analytics/profile/{user_id}")
 async def analytics_profile(user_id: str):
     try:
-        from .db import fetch_user_events
-        events = fetch_user_events(user_id, since_days=60, limit=500)
+        events = await adb.fetch_user_events(user_id, since_days=60, limit=500)
         category_weights: Dict[str, int] = {}
         hour_pref = [0]*24
         emotion_trend: List[Dict[str, Any]] = []
@@ -505,46 +581,36 @@ async def chat_reply(req: ChatReplyRequest):
         last_user = next((m for m in reversed(req.messages) if m.role == 'user'), None)
         query_text = last_user.content if last_user else None
 
-        # 检索记忆（向量优先、回退DB）
+        # 检索记忆（词法 + 向量混合，一次调用；无查询文本时取最近记忆）
         used_memories: List[Dict[str, Any]] = []
-        retrieval_had_vector = False
-        retrieval_fallback = False
-        if query_text:
-            try:
-                vs_items = vs_query(query_text, top_k=req.top_k_memories, filters={"user_id": req.user_id})
-                threshold = float(os.getenv('MEMORY_VECTOR_SCORE_THRESHOLD', '0.6'))
-                # vector scores avg (before filter)
-                try:
-                    scores = [float(it.get('score', 0.0)) for it in vs_items]
-                    if scores:
-                        metrics_inc('mem_vector_score_sum', int(sum(scores) * 1000))
-                        metrics_inc('mem_vector_score_count', len(scores))
-                except Exception:
-                    pass
-                filtered = [it for it in vs_items if float(it.get('score', 0.0)) >= threshold]
-                used_memories = [
-                    {"text": it.get("text"), "type": it.get("type"), "timestamp": it.get("timestamp")}
-                    for it in filtered
-                ]
-                retrieval_had_vector = True
-                if used_memories:
-                    metrics_inc('mem_retrieval_hits', 1)
-            except Exception:
-                used_memories = []
-        if not used_memories:
-            used_memories = query_events(req.user_id, query_text, req.top_k_memories)
-            retrieval_fallback = True
+        try:
+            # 近期的目标与情绪在向量召回内部提权，不再额外查询 memory_events
+            half_life, type_weights = recency_defaults()
+            hits, rstats = await run_inference(hybrid_search, req.user_id, query_text, req.top_k_memories,
+                                               half_life_days=half_life, type_weights=type_weights)
+            used_memories = [
+                {"text": it.get("text"), "type": it.get("type"), "timestamp": it.get("timestamp")}
+                for it in hits
+            ]
+        except Exception:
+            rstats = {}
         # metrics: retrieval counters
         try:
             metrics_inc('mem_retrieval_total', 1)
-            if retrieval_had_vector and retrieval_fallback:
+            scores = rstats.get('vector_scores') or []
+            if scores:
+                metrics_inc('mem_vector_score_sum', int(sum(scores) * 1000))
+                metrics_inc('mem_vector_score_count', len(scores))
+            if rstats.get('vector_hits'):
+                metrics_inc('mem_retrieval_hits', 1)
+            # 向量未命中、仅靠词法召回
+            if rstats.get('vector_ok') and not rstats.get('vector_hits') and rstats.get('lexical_hits'):
                 metrics_inc('mem_retrieval_fallback', 1)
         except Exception:
             pass
 
         # 用户画像
-        from .db import fetch_user_events
-        events = fetch_user_events(req.user_id, since_days=60, limit=500)
+        events = await adb.fetch_user_events(req.user_id, since_days=60, limit=500)
         # 简易画像（复用 analytics_profile 的逻辑片段）
         category_weights: Dict[str, int] = {}
         for ev in events:
@@ -593,28 +659,32 @@ async def chat_reply(req: ChatReplyRequest):
         except Exception:
             pass
 
-        # 若提取到目标，落库到 memory_events 并写向量索引
+        # 若提取到目标，落库到 memory_events 并写向量索引（与已有目标重复的跳过）
+        goals_deduplicated = 0
         if extracted_goals:
             try:
-                from .db import upsert_events
-                events = []
-                texts, metas = [], []
-                for g in extracted_goals:
-                    payload = {
+                events = [
+                    {
                         "user_id": g.user_id,
                         "type": "goal",
                         "text": g.content,
                         "metadata": {"goal_type": g.goal_type, "extracted_at": g.extracted_at},
                         "timestamp": g.extracted_at,
                     }
-                    events.append(payload)
-                    texts.append(g.content)
-                    metas.append({"user_id": g.user_id, "type": "goal", "text": g.content, "timestamp": g.extracted_at})
-                upsert_events(events)
-                try:
-                    vs_add_texts(texts, metas)
-                except Exception:
-                    pass
+                    for g in extracted_goals
+                ]
+                events, dedup = await run_inference(dedup_events, events)
+                goals_deduplicated = dedup["exact"] + dedup["near"]
+                if events:
+                    await adb.upsert_events(events)
+                    try:
+                        await adb.vector_add_texts(
+                            [p["text"] for p in events],
+                            [{"user_id": p["user_id"], "type": "goal", "text": p["text"], "timestamp": p["timestamp"], "id": p.get("id")}
+                             for p in events],
+                        )
+                    except Exception:
+                        pass
             except Exception:
                 pass
 
@@ -626,6 +696,8 @@ async def chat_reply(req: ChatReplyRequest):
             references.append(f"top_categories:{','.join(top_categories)}")
         if extracted_goals:
             references.append(f"extracted_goals:{len(extracted_goals)}")
+        if goals_deduplicated:
+            references.append(f"deduplicated_goals:{goals_deduplicated}")
 
         # 最小回复生成（规则+拼接；后续阶段可接LLM）
         user_text = query_text or ""
@@ -638,6 +710,18 @@ async def chat_reply(req: ChatReplyRequest):
         fallback = next((m.content for m in reversed(req.messages) if m.role == 'user'), "" )
         return ChatReplyResponse(status="success", data=ChatReplyData(text=fallback, used_memories=[], profile={}))
 
+def _executor_metrics(counters: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+    """线程池当前排队/执行数与平均排队、执行耗时"""
+    out: Dict[str, Dict[str, Any]] = {}
+    for name, st in executor_stats().items():
+        tasks = float(counters.get(f'executor_{name}_tasks', 0))
+        out[name] = {
+            **st,
+            "wait_ms_avg": (float(counters.get(f'executor_{name}_wait_ms_sum', 0)) / tasks) if tasks > 0 else None,
+            "run_ms_avg": (float(counters.get(f'executor_{name}_run_ms_sum', 0)) / tasks) if tasks > 0 else None,
+        }
+    return out
+
 @app.get("/metrics")
 async def get_metrics(_: bool = Depends(require_metrics_key)):
     p95 = metrics_p95()
@@ -648,6 +732,12 @@ async def get_metrics(_: bool = Depends(require_metrics_key)):
     vec_sum = float(counters.get('mem_vector_score_sum', 0)) / 1000.0
     vec_cnt = float(counters.get('mem_vector_score_count', 0))
     vec_avg = (vec_sum / vec_cnt) if vec_cnt > 0 else None
+    emb_batches = float(counters.get('embed_batches', 0))
+    emb_reqs = float(counters.get('embed_batch_requests', 0))
+    emb_batch_avg = (float(counters.get('embed_batch_texts', 0)) / emb_batches) if emb_batches > 0 else None
+    emb_wait_avg = (float(counters.get('embed_queue_wait_ms_sum', 0)) / emb_reqs) if emb_reqs > 0 else None
+    emb_lookups = float(counters.get('embed_cache_hits', 0)) + float(counters.get('embed_cache_misses', 0))
+    emb_hit_rate = (float(counters.get('embed_cache_hits', 0)) / emb_lookups) if emb_lookups > 0 else None
     return {
         "status": "success",
         "data": {
@@ -656,6 +746,11 @@ async def get_metrics(_: bool = Depends(require_metrics_key)):
             "latency_ms_p95": p95,
             "latency_ms_avg": lat_avg,
             "mem_vector_score_avg": vec_avg,
+            "embed_batch_size_avg": emb_batch_avg,
+            "embed_queue_wait_ms_avg": emb_wait_avg,
+            "embed_cache_hit_rate": emb_hit_rate,
+            "executors": _executor_metrics(counters),
+            "db_pool": storage_pool_stats(),
         }
     }
 
@@ -669,6 +764,12 @@ async def get_metrics_prom(_: bool = Depends(require_metrics_key)):
     vec_sum = float(counters.get('mem_vector_score_sum', 0)) / 1000.0
     vec_cnt = float(counters.get('mem_vector_score_count', 0))
     vec_avg = (vec_sum / vec_cnt) if vec_cnt > 0 else None
+    emb_batches = float(counters.get('embed_batches', 0))
+    emb_reqs = float(counters.get('embed_batch_requests', 0))
+    emb_batch_avg = (float(counters.get('embed_batch_texts', 0)) / emb_batches) if emb_batches > 0 else None
+    emb_wait_avg = (float(counters.get('embed_queue_wait_ms_sum', 0)) / emb_reqs) if emb_reqs > 0 else None
+    emb_lookups = float(counters.get('embed_cache_hits', 0)) + float(counters.get('embed_cache_misses', 0))
+    emb_hit_rate = (float(counters.get('embed_cache_hits', 0)) / emb_lookups) if emb_lookups > 0 else None
 
     lines = []
     # HELP/TYPE headers
@@ -680,6 +781,18 @@ async def get_metrics_prom(_: bool = Depends(require_metrics_key)):
     lines.append("# TYPE cuddle_latency_ms_avg gauge")
     lines.append("# HELP cuddle_mem_vector_score_avg Average similarity score from vector search")
     lines.append("# TYPE cuddle_mem_vector_score_avg gauge")
+    lines.append("# HELP cuddle_embed_batch_size_avg Average number of texts per embedding forward pass")
+    lines.append("# TYPE cuddle_embed_batch_size_avg gauge")
+    lines.append("# HELP cuddle_embed_queue_wait_ms_avg Average time an encode request waited for its batch (ms)")
+    lines.append("# TYPE cuddle_embed_queue_wait_ms_avg gauge")
+    lines.append("# HELP cuddle_embed_cache_hit_rate Embedding cache hit rate")
+    lines.append("# TYPE cuddle_embed_cache_hit_rate gauge")
+    lines.append("# HELP cuddle_executor_queue_depth Tasks waiting for a worker thread, per executor")
+    lines.append("# TYPE cuddle_executor_queue_depth gauge")
+    lines.append("# HELP cuddle_executor_active Tasks currently running, per executor")
+    lines.append("# TYPE cuddle_executor_active gauge")
+    lines.append("# HELP cuddle_executor_wait_ms_avg Average executor queue wait (ms)")
+    lines.append("# TYPE cuddle_executor_wait_ms_avg gauge")
 
     def g(k, v):
         if v is None:
@@ -694,7 +807,27 @@ async def get_metrics_prom(_: bool = Depends(require_metrics_key)):
         'mem_retrieval_hits': 'Times when vector memory retrieval returned any usable items',
         'mem_retrieval_fallback': 'Times when memory retrieval fell back due to empty/low-score results',
         'feedback_total': 'Total number of feedback posts',
+        'embed_batches': 'Total number of batched embedding forward passes',
+        'embed_batch_requests': 'Total number of encode requests served by the batcher',
+        'embed_batch_texts': 'Total number of texts encoded by the batcher',
+        'embed_queue_wait_ms_sum': 'Sum of encode request queue wait time (ms)',
+        'embed_forward_ms_sum': 'Sum of batched embedding forward pass time (ms)',
+        'embed_cache_hits': 'Texts served from the embedding cache',
+        'embed_cache_misses': 'Texts that missed the embedding cache',
+        'embed_cache_redis_hits': 'Embedding cache hits served from Redis',
+        'vector_snapshots': 'Total number of local vector partition snapshots written',
+        'vector_index_prealloc_resizes': 'Local vector partitions grown ahead of time by the background thread',
+        'vector_index_sync_resizes': 'Local vector partitions grown synchronously on the write path',
+        'vector_deleted': 'Vectors deleted (explicit deletes and TTL expiry)',
+        'vector_cleanup_failures': 'Vector deletions still failing after background retries (memory rows already removed)',
+        'vector_compactions': 'Local vector partitions rebuilt to reclaim tombstones',
+        'vector_tombstones_reclaimed': 'Tombstoned vectors reclaimed by compaction',
+        'memory_events_expired': 'Memory events removed by TTL expiry',
     }
+    for pool in executor_stats():
+        help_map[f'executor_{pool}_tasks'] = f'Tasks completed on the {pool} executor'
+        help_map[f'executor_{pool}_wait_ms_sum'] = f'Sum of queue wait time on the {pool} executor (ms)'
+        help_map[f'executor_{pool}_run_ms_sum'] = f'Sum of run time on the {pool} executor (ms)'
     for k, v in counters.items():
         lines.append(f"# HELP cuddle_{k} {help_map.get(k, 'Counter ' + k)}")
         lines.append(f"# TYPE cuddle_{k} counter")
@@ -704,6 +837,16 @@ async def get_metrics_prom(_: bool = Depends(require_metrics_key)):
     g("cuddle_latency_ms_p95", int(p95) if p95 is not None else None)
     g("cuddle_latency_ms_avg", float(f"{lat_avg:.3f}") if lat_avg is not None else None)
     g("cuddle_mem_vector_score_avg", float(f"{vec_avg:.6f}") if vec_avg is not None else None)
+    g("cuddle_embed_batch_size_avg", float(f"{emb_batch_avg:.3f}") if emb_batch_avg is not None else None)
+    g("cuddle_embed_queue_wait_ms_avg", float(f"{emb_wait_avg:.3f}") if emb_wait_avg is not None else None)
+    g("cuddle_embed_cache_hit_rate", float(f"{emb_hit_rate:.6f}") if emb_hit_rate is not None else None)
+    for name, st in _executor_metrics(counters).items():
+        g(f'cuddle_executor_queue_depth{{pool="{name}"}}', st["queued"])
+        g(f'cuddle_executor_active{{pool="{name}"}}', st["active"])
+        g(f'cuddle_executor_wait_ms_avg{{pool="{name}"}}', float(f"{st['wait_ms_avg']:.3f}") if st["wait_ms_avg"] is not None else None)
+    dbp = storage_pool_stats()
+    for k in ("capacity", "checked_out", "idle", "overflow", "utilization"):
+        g(f'cuddle_db_pool_{k}{{backend="{dbp["backend"]}"}}', dbp[k])
 
     body = "\n".join(lines) + "\n"
     return Response(content=body, media_type="text/plain")
@@ -743,29 +886,49 @@ class FeedbackResponse(BaseModel):
     status: str = "success"
     data: Dict[str, Any] = {}
 
+class FeedbackBatchRequest(BaseModel):
+    events: List[FeedbackEvent]
+    @field_validator('events')
+    @classmethod
+    def _check_events(cls, v: List[FeedbackEvent]):
+        if len(v) > _MAX_FEEDBACK_BATCH:
+            raise ValueError(f'too many events (max={_MAX_FEEDBACK_BATCH})')
+        return v
+
+def _feedback_payload(ev: FeedbackEvent) -> Dict[str, Any]:
+    payload = ev.dict()
+    if payload.get('timestamp') is None:
+        payload['timestamp'] = datetime.now().isoformat(timespec='minutes')
+    # metrics: feedback counters
+    try:
+        ft = payload.get('feedback_type') or 'unknown'
+        metrics_inc('feedback_total', 1)
+        metrics_inc(f'feedback_type_{ft}', 1)
+    except Exception:
+        pass
+    return payload
+
 @app.post("/feedback", response_model=FeedbackResponse)
 async def post_feedback(ev: FeedbackEvent):
     try:
-        payload = ev.dict()
-        if payload.get('timestamp') is None:
-            payload['timestamp'] = datetime.now().isoformat(timespec='minutes')
-        # metrics: feedback counters
-        try:
-            ft = payload.get('feedback_type') or 'unknown'
-            metrics_inc('feedback_total', 1)
-            metrics_inc(f'feedback_type_{ft}', 1)
-        except Exception:
-            pass
-
-        insert_feedback(payload)
+        await adb.insert_feedback(_feedback_payload(ev))
         return FeedbackResponse(status="success", data={"ok": True})
     except Exception as e:
         return FeedbackResponse(status="error", data={"ok": False, "message": str(e)})
 
+@app.post("/feedback/batch", response_model=FeedbackResponse)
+async def post_feedback_batch(req: FeedbackBatchRequest):
+    """批量写入反馈（离线同步上传），一个事务内集合式写入，返回实际写入条数"""
+    try:
+        written = await adb.insert_feedback_many([_feedback_payload(ev) for ev in req.events])
+        return FeedbackResponse(status="success", data={"ok": True, "written": written})
+    except Exception as e:
+        return FeedbackResponse(status="error", data={"ok": False, "message": str(e)})
+
 @app.get("/feedback/stats/{user_id}", response_model=FeedbackResponse)
 async def get_feedback_stats(user_id: str):
     try:
-        stats = fetch_feedback_stats(user_id)
+        stats = await adb.fetch_feedback_stats(user_id)
         return FeedbackResponse(status="success", data=stats)
     except Exception as e:
         return FeedbackResponse(status="error", data={"ok": False, "message": str(e)})
@@ -822,10 +985,7 @@ def _update_recommendation_weights(user_id: str, feedback: Dict):
 async def memory_upsert(req: MemoryUpsertRequest):
     """将事件批量写入SQLite与向量索引；失败时回退到缓存。"""
     try:
-        # 先写入DB
         events = []
-        texts: List[str] = []
-        metas: List[Dict[str, Any]] = []
         for ev in req.events:
             ts = ev.timestamp or datetime.now().isoformat(timespec='minutes')
             payload = {
@@ -836,14 +996,19 @@ async def memory_upsert(req: MemoryUpsertRequest):
                 "timestamp": ts,
             }
             events.append(payload)
-            if ev.text:
-                texts.append(ev.text)
-                metas.append({"user_id": ev.user_id, "type": ev.type, "text": ev.text, "timestamp": ts})
-        written = upsert_events(events)
+        # 跳过与该用户已有记忆（或本批次内）重复的事件
+        events, dedup = await run_inference(dedup_events, events)
+        # 先写入DB（回填各事件的行 id，写入向量元数据供删除时对齐）
+        written = await adb.upsert_events(events)
+        texts: List[str] = [p["text"] for p in events if p["text"]]
+        metas: List[Dict[str, Any]] = [
+            {"user_id": p["user_id"], "type": p["type"], "text": p["text"], "timestamp": p["timestamp"], "id": p.get("id")}
+            for p in events if p["text"]
+        ]
         # 写向量索引（忽略错误，保持主流程）
         try:
             if texts:
-                vs_add_texts(texts, metas)
+                await adb.vector_add_texts(texts, metas)
         except Exception:
             pass
         # 同步写缓存（可选）
@@ -854,7 +1019,7 @@ async def memory_upsert(req: MemoryUpsertRequest):
                 cache.set(key, p, ttl=86400 * 7)
         except Exception:
             pass
-        return {"status": "success", "written": int(written)}
+        return {"status": "success", "written": int(written), "deduplicated": dedup["exact"] + dedup["near"], "dedup": dedup}
     except Exception:
         # 回退到缓存
         try:
@@ -876,28 +1041,106 @@ async def memory_upsert(req: MemoryUpsertRequest):
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+_VECTOR_CLEANUP_RETRY_DELAYS = (5.0, 30.0, 120.0)
+_vector_cleanup_tasks: set = set()
+
+async def _retry_vector_cleanup(fn, *args) -> None:
+    """记忆行已删除而向量清理失败时在后台重试（如向量后端暂不可用）"""
+    for delay in _VECTOR_CLEANUP_RETRY_DELAYS:
+        await asyncio.sleep(delay)
+        try:
+            await run_db(fn, *args)
+            return
+        except Exception as e:
+            print(f"Vector cleanup retry failed: {e}")
+    metrics_inc('vector_cleanup_failures', 1)
+
+async def _delete_vectors(fn, *args) -> Dict[str, Any]:
+    """删除向量；失败时记忆行的删除不回滚，返回 partial 并转入后台重试"""
+    try:
+        return {"status": "success", "vectors_deleted": int(await run_db(fn, *args))}
+    except Exception as e:
+        task = asyncio.create_task(_retry_vector_cleanup(fn, *args))
+        _vector_cleanup_tasks.add(task)
+        task.add_done_callback(_vector_cleanup_tasks.discard)
+        return {"status": "partial", "vectors_deleted": 0, "vector_cleanup": "pending", "message": str(e)}
+
+@app.post("/memory/delete")
+async def memory_delete(req: MemoryDeleteRequest, _: bool = Depends(require_admin_key)):
+    """按 id 删除用户记忆，并删除对应向量"""
+    try:
+        rows = await adb.delete_events(req.user_id, req.ids)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    vectors = await _delete_vectors(vs_delete_matching, req.user_id, rows) if rows else {"status": "success", "vectors_deleted": 0}
+    return {**vectors, "deleted": len(rows)}
+
+@app.delete("/memory/user/{user_id}")
+async def memory_delete_user(user_id: str, _: bool = Depends(require_admin_key)):
+    """删除用户的全部记忆与向量分区"""
+    try:
+        rows = await adb.delete_events(user_id)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    return {**await _delete_vectors(vs_delete_user, user_id), "deleted": len(rows)}
+
+@app.post("/admin/memory/sweep")
+async def memory_sweep(_: bool = Depends(require_admin_key)):
+    """立即按 MEMORY_TTL_DAYS 清理过期记忆"""
+    try:
+        return {"status": "success", "data": await run_db(sweep_expired)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/admin/vector-index")
+async def vector_index_status(_: bool = Depends(require_metrics_key)):
+    """向量索引状态：构建进度、是否有效、大小"""
+    try:
+        return {"status": "success", "data": await run_db(vs_index_status)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/admin/vector-index/rebuild")
+async def vector_index_rebuild(_: bool = Depends(require_admin_key)):
+    """后台重建 pgvector ANN 索引（CREATE INDEX CONCURRENTLY，不阻塞读写）"""
+    try:
+        return {"status": "success", "data": await run_db(vs_ensure_ann_index, rebuild=True)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+def _memory_items(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"id": it.get("id"), "user_id": it.get("user_id"), "type": it.get("type"), "text": it.get("text"), "metadata": it.get("metadata") or {}, "timestamp": it.get("timestamp")}
+        for it in hits
+    ]
+
+@app.post("/memory/query-batch", response_model=MemoryQueryBatchResponse)
+async def memory_query_batch(req: MemoryQueryBatchRequest):
+    """批量检索：所有查询一次编码、同一用户分区一次 knn_query，结果与请求同序，单项失败不影响其他项。"""
+    if not req.queries:
+        return MemoryQueryBatchResponse(status="success", data=[])
+    metrics_inc('memory_query_batch_requests', 1)
+    metrics_inc('memory_query_batch_items', len(req.queries))
+    requests = [q.dict() for q in req.queries]
+    try:
+        results = await run_inference(hybrid_search_batch, requests)
+    except Exception as e:
+        return MemoryQueryBatchResponse(status="error", data=[{"status": "error", "message": str(e)} for _ in requests])
+    data: List[Dict[str, Any]] = []
+    for res in results:
+        if isinstance(res, Exception):
+            data.append({"status": "error", "message": str(res)})
+        else:
+            data.append({"status": "success", "data": _memory_items(res[0])})
+    return MemoryQueryBatchResponse(status="success", data=data)
+
 @app.post("/memory/query", response_model=MemoryQueryResponse)
 async def memory_query(req: MemoryQueryRequest):
-    """优先向量检索（当有查询文本时），否则按SQLite时间倒序；失败回退缓存。"""
+    """有查询文本时词法 + 向量混合检索（RRF 融合），否则按时间倒序；失败回退缓存。"""
     try:
-        items: List[Dict[str, Any]] = []
-        q = (req.query or "").strip()
-        if q:
-            try:
-                # 先向量检索（按 user_id 过滤），再按相似度阈值过滤，避免误召回
-                vs_items = vs_query(q, top_k=req.top_k, filters={"user_id": req.user_id})
-                threshold = float(os.getenv('MEMORY_VECTOR_SCORE_THRESHOLD', '0.6'))
-                filtered = [it for it in vs_items if float(it.get('score', 0.0)) >= threshold]
-                if filtered:
-                    items = [
-                        {"user_id": it.get("user_id"), "type": it.get("type"), "text": it.get("text"), "metadata": {}, "timestamp": it.get("timestamp")}
-                        for it in filtered
-                    ]
-            except Exception:
-                items = []
-        if not items:
-            items = query_events(req.user_id, req.query, req.top_k)
-        return MemoryQueryResponse(status="success", data=items)
+        hits, _ = await run_inference(hybrid_search, req.user_id, req.query, req.top_k, ef_search=req.ef_search, probes=req.probes,
+                                      half_life_days=req.half_life_days, type_weights=req.type_weights)
+        return MemoryQueryResponse(status="success", data=_memory_items(hits))
     except Exception:
         # 回退到缓存回扫
         cache = get_cache_manager()
@@ -1194,14 +1437,15 @@ async def get_analytics_stats(days: int = 7):
     """获取分析统计"""
     from .analytics import analytics
 
-    stats = analytics.get_recommendation_stats(days=days)
+    stats = await run_analytics(analytics.get_recommendation_stats, days=days)
     return stats
 
 @app.post("/analytics/user-clusters")
 async def analyze_user_clusters(user_data: List[Dict]):
     """用户聚类分析"""
     try:
-        result = behavior_analyzer.analyze_user_clusters(user_data)
+        behavior_analyzer = await run_analytics(_get_behavior_analyzer)
+        result = await run_analytics(behavior_analyzer.analyze_user_clusters, user_data)
         return {"status": "success", "data": result}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -1210,7 +1454,8 @@ async def analyze_user_clusters(user_data: List[Dict]):
 async def train_mood_predictor(training_data: List[Dict]):
     """训练心情预测模型"""
     try:
-        result = mood_predictor.train(training_data)
+        mood_predictor = await run_analytics(_get_mood_predictor)
+        result = await run_analytics(mood_predictor.train, training_data)
         return {"status": "success", "data": result}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -1234,10 +1479,10 @@ async def extract_goals(payload: Dict):
             if content:
                 gm = GoalMemory(user_id=user_id, goal_type='personal_goal', content=content, extracted_at=datetime.now().isoformat(timespec='minutes'))
                 goals.append(gm)
-        # 落库
+        # 落库（与已有目标重复的跳过）
+        dedup = {"exact": 0, "near": 0}
         if goals:
             events = []
-            from .db import upsert_events
             for g in goals:
                 events.append({
                     'user_id': g.user_id,
@@ -1246,8 +1491,10 @@ async def extract_goals(payload: Dict):
                     'metadata': {'goal_type': g.goal_type, 'extracted_at': g.extracted_at},
                     'timestamp': g.extracted_at,
                 })
-            upsert_events(events)
-        return {"status": "success", "data": [g.dict() for g in goals]}
+            events, dedup = await run_inference(dedup_events, events)
+            if events:
+                await adb.upsert_events(events)
+        return {"status": "success", "data": [g.dict() for g in goals], "deduplicated": dedup["exact"] + dedup["near"]}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -1256,8 +1503,7 @@ async def reminder_suggestions(user_id: str, limit: int = 5):
     """基于目标类记忆生成鼓励性提醒文案"""
     try:
         # 简化：从最近目标事件生成建议，同时融合最近心情、时间段进行个性化
-        from .db import fetch_user_events
-        events = fetch_user_events(user_id, since_days=90, limit=300)
+        events = await adb.fetch_user_events(user_id, since_days=90, limit=300)
         goals = [ev for ev in events if (ev.get('type') == 'goal' and ev.get('text'))]
         recent_moods = [ev for ev in events if ev.get('type') == 'mood']
         # 判断白天/晚上
@@ -1298,7 +1544,8 @@ async def reminder_suggestions(user_id: str, limit: int = 5):
 async def predict_mood(user_context: Dict):
     """预测用户心情"""
     try:
-        result = mood_predictor.predict_mood(user_context)
+        mood_predictor = await run_analytics(_get_mood_predictor)
+        result = await run_inference(mood_predictor.predict_mood, user_context)
         return {"status": "success", "data": result}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -1307,11 +1554,11 @@ async def predict_mood(user_context: Dict):
 async def analyze_emotion_advanced(request: Dict):
     """高级情感分析"""
     try:
-        emotion_analyzer = get_emotion_analyzer()
+        emotion_analyzer = await run_inference(get_emotion_analyzer)
         text = request.get("text", "")
         context = request.get("context", {})
 
-        result = emotion_analyzer.analyze_emotion_advanced(text, context)
+        result = await run_inference(emotion_analyzer.analyze_emotion_advanced, text, context)
         return {"status": "success", "emotions": result}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -1320,6 +1567,7 @@ async def analyze_emotion_advanced(request: Dict):
 async def get_learning_system_stats():
     """获取在线学习系统统计"""
     try:
+        adaptive_engine = await run_analytics(_get_adaptive_engine)
         stats = adaptive_engine.get_system_stats()
         return {"status": "success", "data": stats}
     except Exception as e:
@@ -1334,6 +1582,7 @@ async def update_strategy_weights(weights: Dict[str, float]):
         if abs(total_weight - 1.0) > 0.01:
             return {"status": "error", "message": "Weights must sum to 1.0"}
 
+        adaptive_engine = await run_analytics(_get_adaptive_engine)
         adaptive_engine.strategy_weights.update(weights)
         return {"status": "success", "message": "Strategy weights updated"}
     except Exception as e:
@@ -1345,10 +1594,12 @@ async def train_models():
     try:
         results = {}
 
+        adaptive_engine = await run_analytics(_get_adaptive_engine)
+
         # 训练心情预测模型
         mood_engine = adaptive_engine.mood_predictor
         if not mood_engine.is_initialized:
-            mood_engine._initialize_with_synthetic_data()
+            await run_analytics(mood_engine._initialize_with_synthetic_data)
             results["mood_predictor"] = "initialized with synthetic data"
         else:
             results["mood_predictor"] = "already initialized"
@@ -1356,7 +1607,7 @@ async def train_models():
         # 训练参与度预测模型
         engagement_engine = adaptive_engine.engagement_predictor
         if not engagement_engine.is_initialized:
-            engagement_engine._initialize_with_synthetic_data()
+            await run_analytics(engagement_engine._initialize_with_synthetic_data)
             results["engagement_predictor"] = "initialized with synthetic data"
         else:
             results["engagement_predictor"] = "already initialized"
@@ -1364,7 +1615,7 @@ async def train_models():
         # 训练满意度预测模型
         satisfaction_engine = adaptive_engine.satisfaction_predictor
         if not satisfaction_engine.is_initialized:
-            satisfaction_engine._initialize_with_synthetic_data()
+            await run_analytics(satisfaction_engine._initialize_with_synthetic_data)
             results["satisfaction_predictor"] = "initialized with synthetic data"
         else:
             results["satisfaction_predictor"] = "already initialized"
@@ -1395,6 +1646,7 @@ async def add_training_data(data: Dict):
             return {"status": "error", "message": "Features are required"}
 
         # 选择对应的模型
+        adaptive_engine = await run_analytics(_get_adaptive_engine)
         if model_type == "mood":
             engine = adaptive_engine.mood_predictor
         elif model_type == "engagement":
@@ -1405,7 +1657,7 @@ async def add_training_data(data: Dict):
             return {"status": "error", "message": "Invalid model type"}
 
         # 添加训练样本
-        engine.add_training_sample(features, target, user_id, weight)
+        await run_analytics(engine.add_training_sample, features, target, user_id, weight)
 
         return {
             "status": "success",
@@ -1420,6 +1672,12 @@ async def add_training_data(data: Dict):
 async def root():
     return {"status": "ok", "service": "Cuddle Cat AI Analysis"}
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪探针：启动预热完成前返回 503，负载均衡据此决定是否导流"""
+    state = startup.readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content={"status": "ready" if state["ready"] else "warming", **state})
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
@@ -1437,17 +1695,20 @@ async def health_check():
         except Exception:
             cache_status = "error"
 
-        # 检查AI模型状态
-        model_status = "ok"
-        try:
-            if not adaptive_engine.mood_predictor.is_initialized:
-                model_status = "initializing"
-        except Exception:
-            model_status = "error"
+        # 检查AI模型状态（启动预热未完成时为 initializing）
+        readiness = startup.readiness()
+        model_status = "ok" if readiness["ready"] or not readiness["started"] else "initializing"
 
         # 获取缓存统计
         cache_stats = cache_manager.get_cache_stats()
 
+        # 本地向量索引容量余量
+        try:
+            from .vector_store import capacity_status
+            vector_index = capacity_status()
+        except Exception as e:
+            vector_index = {"error": str(e)}
+
         return {
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
@@ -1456,6 +1717,7 @@ async def health_check():
                 "ai_models": model_status,
             },
             "cache_stats": cache_stats,
+            "vector_index": vector_index,
             "version": "1.0.0"
         }
     except Exception as e:
@@ -1,20 +1,26 @@
 import os
 import json
-import torch
 from typing import List, Dict, Optional, Tuple
-from transformers import AutoTokenizer, AutoModel, pipeline
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import os
-import redis
 from datetime import datetime, timedelta
+from threading import Lock
+
+# torch / transformers / sklearn / redis 导入开销大，延迟到首次构造模型或缓存时再导入
+
+
+def _torch_device() -> str:
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
 
 class EmotionAnalyzer:
     """增强的中文情感分析模型"""
 
     def __init__(self, model_name: str = "hfl/chinese-roberta-wwm-ext"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = _torch_device()
         print(f"Using device: {self.device}")
 
         # 支持多种模型配置
@@ -102,6 +108,7 @@ class EmotionAnalyzer:
     def _load_primary_model(self, model_name: str):
         """加载主要模型"""
         try:
+            from transformers import pipeline
             self.sentiment_pipeline = pipeline(
                 "sentiment-analysis",
                 model=model_name,
@@ -115,6 +122,7 @@ class EmotionAnalyzer:
         """尝试加载备用模型"""
         for name, model_path in self.model_configs.items():
             try:
+                from transformers import pipeline
                 self.sentiment_pipeline = pipeline(
                     "sentiment-analysis",
                     model=model_path,
@@ -213,10 +221,12 @@ class EmbeddingRecommender:
     """基于嵌入的推荐系统"""
 
     def __init__(self, model_name: str = "moka-ai/m3e-base"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = _torch_device()
+        self.model_name = model_name
 
         try:
-            self.model = SentenceTransformer(model_name, device=self.device)
+            from .embedding import load_encoder
+            self.model = load_encoder(model_name, device=self.device)
         except Exception as e:
             print(f"Failed to load embedding model: {e}")
             self.model = None
@@ -228,7 +238,9 @@ class EmbeddingRecommender:
             return self._simple_vectorize(texts)
 
         try:
-            embeddings = self.model.encode(texts, convert_to_numpy=True)
+            from .embedding import cached_encode, cache_namespace
+            # 未归一化向量，与 vector_store 的归一化向量分开缓存
+            embeddings = cached_encode(cache_namespace(f"{self.model_name}:raw"), texts, lambda batch: self.model.encode(batch, convert_to_numpy=True))
             return embeddings
         except Exception as e:
             print(f"Encoding failed: {e}")
@@ -269,6 +281,7 @@ class EmbeddingRecommender:
         if len(embeddings) == 0:
             return []
 
+        from sklearn.metrics.pairwise import cosine_similarity
         query_embedding = embeddings[0:1]
         candidate_embeddings = embeddings[1:]
 
@@ -288,6 +301,7 @@ class CacheManager:
         self._memory_cache = {}
 
         try:
+            import redis
             url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
             self.redis_client = redis.from_url(url)
             self.redis_client.ping()
@@ -408,25 +422,34 @@ class CacheManager:
         ]
         return f"recommendations:{'_'.join(key_parts)}"
 
-# 全局实例
+# 全局实例（启动预热线程与请求可能并发创建，加锁保证只构造一次）
 emotion_analyzer = None
 embedding_recommender = None
 cache_manager = None
+_emotion_lock = Lock()
+_recommender_lock = Lock()
+_cache_lock = Lock()
 
 def get_emotion_analyzer() -> EmotionAnalyzer:
     global emotion_analyzer
     if emotion_analyzer is None:
-        emotion_analyzer = EmotionAnalyzer()
+        with _emotion_lock:
+            if emotion_analyzer is None:
+                emotion_analyzer = EmotionAnalyzer()
     return emotion_analyzer
 
 def get_embedding_recommender() -> EmbeddingRecommender:
     global embedding_recommender
     if embedding_recommender is None:
-        embedding_recommender = EmbeddingRecommender()
+        with _recommender_lock:
+            if embedding_recommender is None:
+                embedding_recommender = EmbeddingRecommender()
     return embedding_recommender
 
 def get_cache_manager() -> CacheManager:
     global cache_manager
     if cache_manager is None:
-        cache_manager = CacheManager()
+        with _cache_lock:
+            if cache_manager is None:
+                cache_manager = CacheManager()
     return cache_manager
@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime, timedelta
 import json
@@ -9,7 +8,6 @@ from collections import deque, defaultdict
 from sklearn.linear_model import SGDRegressor, SGDClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_squared_error, accuracy_score
-import redis
 from .models import get_cache_manager
 
 class OnlineLearningEngine:
@@ -648,5 +646,14 @@ class AdaptiveRecommendationEngine:
             'strategy_weights': self.strategy_weights
         }
 
-# 全局实例
-adaptive_engine = AdaptiveRecommendationEngine()
+# 全局实例：构造时会用合成数据训练模型，延迟到首次使用（或启动预热）时创建
+adaptive_engine: Optional[AdaptiveRecommendationEngine] = None
+_engine_lock = threading.Lock()
+
+def get_adaptive_engine() -> AdaptiveRecommendationEngine:
+    global adaptive_engine
+    if adaptive_engine is None:
+        with _engine_lock:
+            if adaptive_engine is None:
+                adaptive_engine = AdaptiveRecommendationEngine()
+    return adaptive_engine
@@ -0,0 +1,63 @@
+import os
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from typing import Dict, Optional
+from .db import expire_events
+from .metrics import inc as metrics_inc
+from . import vector_store
+
+# 按类型的保留天数，如 "chat=30,mood=180"；未列出的类型（如 goal）永不过期
+_TTL_SPEC = os.getenv('MEMORY_TTL_DAYS', '')
+_SWEEP_INTERVAL = float(os.getenv('MEMORY_TTL_SWEEP_INTERVAL', '3600'))
+
+_stop = Event()
+_thread: Optional[Thread] = None
+
+
+def parse_ttls(spec: str) -> Dict[str, int]:
+    ttls: Dict[str, int] = {}
+    for part in (spec or "").split(','):
+        if '=' not in part:
+            continue
+        type_, days = part.split('=', 1)
+        try:
+            if type_.strip() and int(days) > 0:
+                ttls[type_.strip()] = int(days)
+        except ValueError:
+            continue
+    return ttls
+
+
+def sweep_expired(now: Optional[datetime] = None) -> Dict[str, Dict[str, int]]:
+    """按 TTL 删除过期记忆与向量，返回 {type: {events, vectors}}"""
+    now = now or datetime.now()
+    result: Dict[str, Dict[str, int]] = {}
+    for type_, days in parse_ttls(_TTL_SPEC).items():
+        cutoff = (now - timedelta(days=days)).isoformat(timespec='minutes')
+        events = expire_events(type_, cutoff)
+        try:
+            vectors = vector_store.expire(type_, cutoff)
+        except Exception as e:
+            print(f"Vector TTL sweep failed for type {type_}: {e}")
+            vectors = 0
+        result[type_] = {"events": events, "vectors": vectors}
+        metrics_inc('memory_events_expired', events)
+    return result
+
+
+def _loop():
+    while not _stop.wait(timeout=max(60.0, _SWEEP_INTERVAL)):
+        try:
+            sweep_expired()
+        except Exception as e:
+            print(f"Memory TTL sweep failed: {e}")
+
+
+def start_retention_worker() -> bool:
+    """配置了 MEMORY_TTL_DAYS 时启动后台过期清理线程"""
+    global _thread
+    if _thread is not None or not parse_ttls(_TTL_SPEC):
+        return False
+    _thread = Thread(target=_loop, name='memory-retention', daemon=True)
+    _thread.start()
+    return True
@@ -0,0 +1,142 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from .db import fetch_events_by_ids, lexical_search, query_events
+from .vector_store import query as vs_query, query_batch as vs_query_batch
+
+# 倒数排名融合：score = Σ 1 / (k + rank)，k 越大越平滑
+_RRF_K = int(os.getenv('MEMORY_RRF_K', '60'))
+# 每一路召回的候选数 = top_k * 该值
+_CANDIDATE_FACTOR = max(1, int(os.getenv('MEMORY_HYBRID_CANDIDATE_FACTOR', '3')))
+
+
+def _vector_threshold() -> float:
+    return float(os.getenv('MEMORY_VECTOR_SCORE_THRESHOLD', '0.6'))
+
+
+def recency_defaults() -> Tuple[float, Dict[str, float]]:
+    """对话召回默认的时间衰减半衰期（天，0 = 关闭）与类型权重（如 goal:1.2,mood:1.1）"""
+    half_life = float(os.getenv('MEMORY_RECENCY_HALF_LIFE_DAYS', '14'))
+    weights: Dict[str, float] = {}
+    for part in os.getenv('MEMORY_TYPE_WEIGHTS', 'goal:1.2,mood:1.1').split(','):
+        name, _, value = part.partition(':')
+        try:
+            if name.strip():
+                weights[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return half_life, weights
+
+
+def _key(item: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+    return (item.get("type"), (item.get("text") or "").strip(), item.get("timestamp"))
+
+
+def rrf_fuse(ranked_lists: List[List[Dict[str, Any]]], top_k: int, k: int = _RRF_K) -> List[Dict[str, Any]]:
+    """按 (type, text, timestamp) 合并多路有序结果，RRF 得分降序"""
+    fused: Dict[Tuple[Any, Any, Any], Dict[str, Any]] = {}
+    for items in ranked_lists:
+        for rank, item in enumerate(items, start=1):
+            key = _key(item)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**item, "rrf_score": 0.0}
+            else:
+                # 保留各路提供的字段（词法结果带 metadata，向量结果带 score）
+                for field, value in item.items():
+                    if entry.get(field) in (None, {}, ""):
+                        entry[field] = value
+            entry["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda it: it["rrf_score"], reverse=True)[:top_k]
+
+
+def _fuse(user_id: str, q: str, top_k: int, raw: Optional[List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """向量召回结果（raw 为 None 表示向量检索失败）按阈值过滤后与词法召回 RRF 融合"""
+    stats: Dict[str, Any] = {"vector_scores": [], "vector_ok": raw is not None, "lexical_hits": 0, "vector_hits": 0}
+    vector_items: List[Dict[str, Any]] = []
+    if raw is not None:
+        sims = [float(it.get("similarity", it.get("score", 0.0))) for it in raw]
+        stats["vector_scores"] = sims
+        threshold = _vector_threshold()
+        # 不带 metadata：融合后仍缺 metadata 的即仅由向量召回命中，按 id 回查记忆补全
+        vector_items = [
+            {"id": it.get("id"), "user_id": it.get("user_id"), "type": it.get("type"), "text": it.get("text"),
+             "timestamp": it.get("timestamp"), "score": float(it.get("score", 0.0))}
+            for it, sim in zip(raw, sims) if sim >= threshold
+        ]
+    try:
+        lexical_items = lexical_search(user_id, q, int(top_k) * _CANDIDATE_FACTOR)
+    except Exception:
+        lexical_items = []
+    stats["vector_hits"] = len(vector_items)
+    stats["lexical_hits"] = len(lexical_items)
+    fused = rrf_fuse([vector_items, lexical_items], top_k)
+    vector_only = [it for it in fused if "metadata" not in it]
+    events: Dict[int, Dict[str, Any]] = {}
+    if vector_only:
+        try:
+            events = fetch_events_by_ids(user_id, [it["id"] for it in vector_only if it.get("id") is not None])
+        except Exception:
+            events = {}
+    for it in vector_only:
+        event = events.get(it.get("id"))
+        it["metadata"] = event["metadata"] if event else {}
+    for it in fused:
+        it.pop("rank", None)
+    return fused, stats
+
+
+def hybrid_search(user_id: str, query: Optional[str], top_k: int,
+                  ef_search: Optional[int] = None, probes: Optional[int] = None,
+                  half_life_days: Optional[float] = None,
+                  type_weights: Optional[Dict[str, float]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """词法 + 向量混合检索一次完成；无查询文本时按时间倒序返回最近记忆。
+
+    half_life_days / type_weights 在向量召回内部按时间衰减与类型权重重排（阈值仍作用于原始相似度）。
+    返回 (items, stats)，stats 含 vector_scores（阈值过滤前）、vector_ok、lexical_hits、vector_hits。
+    """
+    q = (query or "").strip()
+    if not q:
+        return query_events(user_id, None, top_k), {"vector_scores": [], "vector_ok": False, "lexical_hits": 0, "vector_hits": 0}
+    try:
+        raw = vs_query(q, top_k=int(top_k) * _CANDIDATE_FACTOR, filters={"user_id": user_id}, ef_search=ef_search,
+                       probes=probes, half_life_days=half_life_days, type_weights=type_weights)
+    except Exception:
+        raw = None
+    return _fuse(user_id, q, top_k, raw)
+
+
+def hybrid_search_batch(requests: List[Dict[str, Any]]) -> List[Any]:
+    """批量混合检索：向量部分一次编码、按分区一次 knn_query，词法部分逐条执行。
+
+    requests 每项含 user_id、query、top_k，可选 ef_search / probes / half_life_days / type_weights；
+    返回与输入同序的列表，每项为 (items, stats) 或该项的异常对象。
+    """
+    out: List[Any] = [None] * len(requests)
+    textual = [i for i, r in enumerate(requests) if (r.get("query") or "").strip()]
+    vector: Dict[int, Any] = {}
+    if textual:
+        specs = [{
+            "text": requests[i]["query"].strip(),
+            "top_k": int(requests[i]["top_k"]) * _CANDIDATE_FACTOR,
+            "filters": {"user_id": requests[i]["user_id"]},
+            "ef_search": requests[i].get("ef_search"),
+            "probes": requests[i].get("probes"),
+            "half_life_days": requests[i].get("half_life_days"),
+            "type_weights": requests[i].get("type_weights"),
+        } for i in textual]
+        try:
+            vector = dict(zip(textual, vs_query_batch(specs)))
+        except Exception:
+            # 编码失败：全部退化为仅词法召回
+            vector = {}
+    for i, r in enumerate(requests):
+        try:
+            q = (r.get("query") or "").strip()
+            if not q:
+                out[i] = hybrid_search(r["user_id"], None, r["top_k"])
+                continue
+            raw = vector.get(i)
+            out[i] = _fuse(r["user_id"], q, r["top_k"], None if isinstance(raw, Exception) else raw)
+        except Exception as e:
+            out[i] = e
+    return out
@@ -0,0 +1,128 @@
+"""SQLite 连接池：WAL 日志模式下一个写连接 + 多个只读连接。
+
+写入经单一写连接串行执行（上下文退出时提交，异常时回滚）；读取从只读连接池中取连接，
+WAL 模式下读不阻塞写、写也不阻塞读。同一数据库文件在进程内共享一个池（db.py 与 db_feedback.py 共用 memory.db）。
+"""
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, List
+
+_POOL_SIZE = max(1, int(os.getenv('SQLITE_POOL_SIZE', '4')))  # 只读连接数上限
+_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()  # WAL 下 NORMAL 仅在断电时可能丢失最近提交
+_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))  # 每个连接的页缓存
+_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # 0 = 不使用内存映射读
+_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+if _SYNCHRONOUS not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+    _SYNCHRONOUS = 'NORMAL'
+
+
+class SQLitePool:
+    def __init__(self, path: str, size: int = _POOL_SIZE):
+        self.path = path
+        self.size = max(1, int(size))
+        self.pid = os.getpid()
+        self._write_lock = Lock()
+        self._writer = None
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._create_lock = Lock()
+        self._all: List[sqlite3.Connection] = []
+
+    def _open(self, readonly: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=_BUSY_TIMEOUT_MS / 1000.0)
+        conn.row_factory = sqlite3.Row
+        if not readonly:
+            # journal_mode 持久化在数据库文件中，由写连接设置一次即可
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size=-{max(0, _CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={max(0, _MMAP_SIZE)}")
+        conn.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if readonly:
+            conn.execute("PRAGMA query_only=1")
+        self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """独占写连接；正常退出时提交，异常时回滚"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open(readonly=False)
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """只读连接：池未满时新建，否则等待空闲连接"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._create_lock:
+                if self._created < self.size:
+                    self._created += 1
+                    conn = self._open(readonly=True)
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def stats(self) -> Dict[str, int]:
+        """连接使用情况：容量 = 只读连接上限 + 1 个写连接"""
+        writing = 1 if self._write_lock.locked() else 0
+        idle = self._idle.qsize()
+        return {"capacity": self.size + 1, "size": self._created + (1 if self._writer is not None else 0),
+                "checked_out": max(0, self._created - idle) + writing, "idle": idle, "overflow": 0}
+
+    def close(self) -> None:
+        with self._write_lock, self._create_lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._all.clear()
+            self._writer = None
+            self._idle = queue.LifoQueue()
+            self._created = 0
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = Lock()
+
+
+def get_pool(path: str) -> SQLitePool:
+    """按文件路径取共享连接池；fork 后的子进程重新建池，不复用父进程的连接"""
+    key = os.path.realpath(path)
+    pool = _pools.get(key)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            pool = _pools[key] = SQLitePool(key)
+        return pool
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            if pool.pid == os.getpid():
+                pool.close()
+        _pools.clear()
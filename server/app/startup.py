@@ -0,0 +1,237 @@
+"""进程启动：建表、后台线程与模型预热，以及启动耗时剖析。
+
+    python -m app.startup --profile-startup            # 按模块统计 import 耗时，并给出各初始化步骤耗时
+    python -m app.startup --profile-startup --json     # 同上，输出 JSON
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 启动后在后台预热的组件（逗号分隔，留空则不预热、立即就绪）
+_DEFAULT_WARMUP = 'embedding,vector_index,adaptive_engine,emotion'
+
+_lock = Lock()
+_timings: Dict[str, float] = {}  # 步骤 -> 毫秒
+_pending: List[str] = []
+_errors: Dict[str, str] = {}
+_ready = Event()
+_started = False
+_warm_thread: Optional[Thread] = None
+
+
+def _warmup_names() -> List[str]:
+    spec = os.getenv('STARTUP_WARMUP', _DEFAULT_WARMUP)
+    return [s.strip() for s in spec.split(',') if s.strip()]
+
+
+@contextmanager
+def _timed(step: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _timings[step] = round((time.perf_counter() - t0) * 1000.0, 1)
+
+
+def _warm_embedding():
+    from .embedding import get_model
+    get_model()
+
+
+def _warm_vector_index():
+    from .vector_store import warmup
+    warmup()
+
+
+def _warm_adaptive_engine():
+    from .online_learning import get_adaptive_engine
+    get_adaptive_engine()
+
+
+def _warm_emotion():
+    from .models import get_emotion_analyzer
+    get_emotion_analyzer()
+
+
+def _warm_cache():
+    from .models import get_cache_manager
+    get_cache_manager()
+
+
+_WARMUPS: Dict[str, Callable[[], None]] = {
+    'embedding': _warm_embedding,
+    'vector_index': _warm_vector_index,
+    'adaptive_engine': _warm_adaptive_engine,
+    'emotion': _warm_emotion,
+    'cache': _warm_cache,
+}
+
+
+def _init_steps() -> List[Tuple[str, Callable[[], Any]]]:
+    from .db import init_db
+    from .db_feedback import ensure_feedback_table
+    from .retention import start_retention_worker
+    return [
+        ('init:init_db', init_db),
+        ('init:ensure_feedback_table', ensure_feedback_table),
+        ('init:retention_worker', start_retention_worker),
+    ]
+
+
+def run_init() -> None:
+    """同步初始化（建表、后台线程），耗时短，在 lifespan 中阻塞执行"""
+    for step, fn in _init_steps():
+        with _timed(step):
+            fn()
+
+
+def run_warmup() -> None:
+    """依次预热各组件；单个组件失败只记录错误，不阻止就绪（请求时会再按需加载）"""
+    for name in list(_pending):
+        fn = _WARMUPS.get(name)
+        try:
+            if fn is None:
+                raise KeyError(f"unknown warm-up component: {name}")
+            with _timed(f'warmup:{name}'):
+                fn()
+        except Exception as e:
+            print(f"Startup warm-up '{name}' failed: {e}")
+            with _lock:
+                _errors[name] = str(e)
+        finally:
+            with _lock:
+                _pending.remove(name)
+    _ready.set()
+
+
+def start(background: bool = True) -> None:
+    """lifespan 启动钩子：初始化后启动后台预热，预热完成前 /ready 返回 503"""
+    global _started, _warm_thread
+    with _lock:
+        if _started:
+            return
+        _started = True
+        _pending[:] = _warmup_names()
+    run_init()
+    if not background:
+        run_warmup()
+        return
+    _warm_thread = Thread(target=run_warmup, name='startup-warmup', daemon=True)
+    _warm_thread.start()
+
+
+def shutdown() -> None:
+    from .executors import shutdown_executors
+    from .storage import dispose
+    shutdown_executors(wait=False)
+    dispose()
+
+
+def readiness() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "ready": _ready.is_set(),
+            "started": _started,
+            "pending": list(_pending),
+            "errors": dict(_errors),
+            "timings_ms": dict(_timings),
+        }
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 输出：[(module, self_us, cumulative_us)]"""
+    rows: List[Tuple[str, int, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+        except ValueError:
+            continue
+    return rows
+
+
+def _profile_child() -> None:
+    # 在 -X importtime 子进程中执行：导入 app.main，再同步执行初始化与预热
+    t0 = time.perf_counter()
+    import app.main  # noqa: F401
+    import_ms = (time.perf_counter() - t0) * 1000.0
+    start(background=False)
+    report = readiness()
+    report["import_app_main_ms"] = round(import_ms, 1)
+    sys.stdout.write(json.dumps(report, ensure_ascii=False))
+
+
+def profile_startup(top: int = 25) -> Dict[str, Any]:
+    server_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'app.startup', '--_profile-child'],
+        cwd=server_dir, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup profile run failed:\n{proc.stderr[-4000:]}")
+    child = json.loads(proc.stdout.strip().splitlines()[-1])
+    rows = _parse_importtime(proc.stderr)
+    by_package: Dict[str, int] = {}
+    for module, self_us, _ in rows:
+        pkg = module.split('.')[0]
+        by_package[pkg] = by_package.get(pkg, 0) + self_us
+    return {
+        "import_app_main_ms": child["import_app_main_ms"],
+        "imports_by_package_ms": {k: round(v / 1000.0, 1) for k, v in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]},
+        "slowest_imports_ms": [
+            {"module": m, "self": round(s / 1000.0, 1), "cumulative": round(c / 1000.0, 1)}
+            for m, s, c in sorted(rows, key=lambda r: -r[2])[:top]
+        ],
+        "init_steps_ms": child["timings_ms"],
+        "warmup_errors": child["errors"],
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"import app.main: {report['import_app_main_ms']:.1f} ms\n")
+    print("imports by top-level package (self time, including warm-up):")
+    for pkg, ms in report["imports_by_package_ms"].items():
+        print(f"  {ms:>9.1f} ms  {pkg}")
+    print("\nslowest imports (cumulative):")
+    for row in report["slowest_imports_ms"]:
+        print(f"  {row['cumulative']:>9.1f} ms  {row['module']}")
+    print("\ninit / warm-up steps:")
+    for step, ms in report["init_steps_ms"].items():
+        print(f"  {ms:>9.1f} ms  {step}")
+    for name, err in report["warmup_errors"].items():
+        print(f"  warm-up '{name}' failed: {err}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--profile-startup', action='store_true', help='剖析启动耗时（import 与初始化步骤）')
+    ap.add_argument('--json', action='store_true')
+    ap.add_argument('--top', type=int, default=25)
+    ap.add_argument('--_profile-child', dest='profile_child', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.profile_child:
+        _profile_child()
+        return
+    if not args.profile_startup:
+        ap.print_help()
+        return
+    report = profile_startup(top=args.top)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == '__main__':
+    main()
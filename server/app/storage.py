@@ -0,0 +1,170 @@
+"""存储后端注册：进程内唯一的 Postgres 引擎与 SQLite 连接池，db.py / db_feedback.py / vector_store.py 共用。
+
+POSTGRES_* 只在此读取一次；每个进程最多 POSTGRES_POOL_SIZE + POSTGRES_MAX_OVERFLOW 个连接，
+节点总连接数 = 该值 × worker 进程数（另加 pgvector 建索引时临时脱离连接池的一个连接）。
+安装 psycopg_pool 时 async 端点另有一个原生异步连接池（见 get_async_pool），上限同为
+POSTGRES_POOL_SIZE + POSTGRES_MAX_OVERFLOW；此时同步引擎只剩后台任务与 SQLite 之外的少数路径在用。
+"""
+import os
+import asyncio
+from threading import Lock
+from typing import Any, Dict, Optional
+from sqlalchemy import create_engine
+from .sqlite_pool import SQLitePool, get_pool
+try:
+    from psycopg_pool import AsyncConnectionPool  # optional, native async Postgres path (db_async)
+    HAS_ASYNC_PG = True
+except Exception:
+    AsyncConnectionPool = None
+    HAS_ASYNC_PG = False
+
+_DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(__file__))
+SQLITE_PATH = os.path.join(_DATA_DIR, 'memory.db')
+
+_PG_DSN = os.getenv("POSTGRES_DSN")
+_PG_HOST = os.getenv("POSTGRES_HOST")
+_PG_PORT = os.getenv("POSTGRES_PORT", "5432")
+_PG_DB = os.getenv("POSTGRES_DB")
+_PG_USER = os.getenv("POSTGRES_USER")
+_PG_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+_PG_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
+_PG_MAX_OVERFLOW = int(os.getenv("POSTGRES_MAX_OVERFLOW", "10"))
+_PG_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+_PG_POOL_RECYCLE = int(os.getenv("POSTGRES_POOL_RECYCLE", "1800"))
+_PG_STATEMENT_TIMEOUT_MS = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "0"))  # 0 = 服务器默认
+_PG_APP_NAME = os.getenv("POSTGRES_APPLICATION_NAME", "cuddle-ai")
+
+_ENGINE = None
+_ENGINE_PID: Optional[int] = None
+_engine_lock = Lock()
+
+# 异步连接池绑定创建它的事件循环与进程
+_ASYNC_POOL = None
+_ASYNC_POOL_KEY: Optional[tuple] = None
+
+
+def use_pg() -> bool:
+    return bool(_PG_DSN or (_PG_HOST and _PG_DB and _PG_USER and _PG_PASSWORD))
+
+
+def pg_pool_options() -> Dict[str, Any]:
+    options: Dict[str, Any] = {"application_name": _PG_APP_NAME}
+    if _PG_STATEMENT_TIMEOUT_MS > 0:
+        options["options"] = f"-c statement_timeout={_PG_STATEMENT_TIMEOUT_MS}"
+    return {
+        "pool_pre_ping": True,
+        "pool_size": max(1, _PG_POOL_SIZE),
+        "max_overflow": max(0, _PG_MAX_OVERFLOW),
+        "pool_timeout": _PG_POOL_TIMEOUT,
+        "pool_recycle": _PG_POOL_RECYCLE,
+        "connect_args": options,
+    }
+
+
+def pg_dsn() -> str:
+    if _PG_DSN:
+        return _PG_DSN
+    return f"postgresql+psycopg://{_PG_USER}:{_PG_PASSWORD}@{_PG_HOST}:{_PG_PORT}/{_PG_DB}"
+
+
+def pg_conninfo() -> str:
+    """libpq 连接串：去掉 SQLAlchemy 方言后缀（postgresql+psycopg:// -> postgresql://）"""
+    dsn = pg_dsn()
+    scheme, sep, rest = dsn.partition("://")
+    return (scheme.split("+", 1)[0] + sep + rest) if sep else dsn
+
+
+async def get_async_pool():
+    """原生异步连接池（psycopg AsyncConnectionPool），首次使用时在当前事件循环中打开；
+    fork 后的子进程或新的事件循环（如测试客户端）重新建池"""
+    global _ASYNC_POOL, _ASYNC_POOL_KEY
+    if not HAS_ASYNC_PG:
+        raise RuntimeError("psycopg_pool not installed; please pip install psycopg-pool")
+    key = (os.getpid(), id(asyncio.get_running_loop()))
+    if _ASYNC_POOL is not None and _ASYNC_POOL_KEY == key:
+        return _ASYNC_POOL
+    kwargs: Dict[str, Any] = {"application_name": _PG_APP_NAME}
+    if _PG_STATEMENT_TIMEOUT_MS > 0:
+        kwargs["options"] = f"-c statement_timeout={_PG_STATEMENT_TIMEOUT_MS}"
+    pool = AsyncConnectionPool(
+        pg_conninfo(),
+        min_size=1,
+        max_size=max(1, _PG_POOL_SIZE) + max(0, _PG_MAX_OVERFLOW),
+        timeout=_PG_POOL_TIMEOUT,
+        max_lifetime=float(_PG_POOL_RECYCLE),
+        kwargs=kwargs,
+        open=False,
+    )
+    await pool.open()
+    # 同一循环内并发的首次调用可能各建一个池：只保留先完成的，其余关闭
+    if _ASYNC_POOL is not None and _ASYNC_POOL_KEY == key:
+        await pool.close()
+        return _ASYNC_POOL
+    _ASYNC_POOL, _ASYNC_POOL_KEY = pool, key
+    return pool
+
+
+async def close_async_pool() -> None:
+    global _ASYNC_POOL, _ASYNC_POOL_KEY
+    pool, key = _ASYNC_POOL, _ASYNC_POOL_KEY
+    _ASYNC_POOL, _ASYNC_POOL_KEY = None, None
+    if pool is not None and key == (os.getpid(), id(asyncio.get_running_loop())):
+        await pool.close()
+
+
+def get_engine():
+    """共享 SQLAlchemy 引擎；fork 后的子进程新建连接池，不复用父进程的连接"""
+    global _ENGINE, _ENGINE_PID
+    eng = _ENGINE
+    if eng is not None and _ENGINE_PID == os.getpid():
+        return eng
+    with _engine_lock:
+        if _ENGINE is not None and _ENGINE_PID != os.getpid():
+            _ENGINE.dispose(close=False)
+            _ENGINE = None
+        if _ENGINE is None:
+            _ENGINE = create_engine(pg_dsn(), **pg_pool_options())
+            _ENGINE_PID = os.getpid()
+        return _ENGINE
+
+
+def sqlite() -> SQLitePool:
+    if use_pg():
+        raise RuntimeError("sqlite() should not be used when Postgres is enabled")
+    return get_pool(SQLITE_PATH)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """连接池使用情况；尚未建立的池按 0 报告"""
+    if use_pg():
+        capacity = max(1, _PG_POOL_SIZE) + max(0, _PG_MAX_OVERFLOW)
+        out: Dict[str, Any] = {"backend": "postgres", "capacity": capacity, "size": max(1, _PG_POOL_SIZE),
+                               "checked_out": 0, "idle": 0, "overflow": 0}
+        eng = _ENGINE if _ENGINE_PID == os.getpid() else None
+        if eng is not None:
+            pool = eng.pool
+            try:
+                out.update(checked_out=pool.checkedout(), idle=pool.checkedin(), overflow=max(0, pool.overflow()))
+            except AttributeError:
+                pass
+        pool = _ASYNC_POOL if _ASYNC_POOL_KEY and _ASYNC_POOL_KEY[0] == os.getpid() else None
+        if pool is not None:
+            st = pool.get_stats()
+            out["async"] = {"size": int(st.get("pool_size", 0)), "idle": int(st.get("pool_available", 0)),
+                            "waiting": int(st.get("requests_waiting", 0))}
+    else:
+        out = {"backend": "sqlite", **get_pool(SQLITE_PATH).stats()}
+    out["utilization"] = round(out["checked_out"] / max(1, out["capacity"]), 4)
+    return out
+
+
+def dispose() -> None:
+    """关闭共享引擎与 SQLite 连接池（进程退出时调用）"""
+    global _ENGINE, _ENGINE_PID
+    from .sqlite_pool import close_pools
+    with _engine_lock:
+        if _ENGINE is not None and _ENGINE_PID == os.getpid():
+            _ENGINE.dispose()
+        _ENGINE = None
+        _ENGINE_PID = None
+    close_pools()
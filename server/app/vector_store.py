@@ -1,6 +1,16 @@
 import os
+import re
 import json
+import math
+import time
+import pickle
+import shutil
+import atexit
+import base64
+import hashlib
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
+import sqlite3
 import numpy as np
 try:
     import hnswlib  # optional, used only in SQLite/local fallback
@@ -8,60 +18,1413 @@ try:
 except Exception:
     hnswlib = None
     HAS_HNSWLIB = False
-from sentence_transformers import SentenceTransformer
-from threading import Lock
-from sqlalchemy import create_engine, text
+try:
+    from pgvector import HalfVector
+    from pgvector.psycopg import register_vector  # optional, binary vector adapter for psycopg 3
+    HAS_PGVECTOR = True
+except Exception:
+    HalfVector = None
+    register_vector = None
+    HAS_PGVECTOR = False
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock, Event, Thread, Condition, local, current_thread
+from sqlalchemy import text
+from .storage import use_pg as _use_pg, get_engine as _get_engine
+from .metrics import inc as metrics_inc
+from .embedding import encode as embed_encode, dimension as embed_dimension
 
 _DATA_DIR = os.getenv('DATA_DIR', os.path.dirname(__file__))
 _INDEX_PATH = os.path.join(_DATA_DIR, 'memory_hnsw.index')
 _META_PATH = os.path.join(_DATA_DIR, 'memory_hnsw_meta.json')
-_MODEL_NAME = os.getenv('EMBED_MODEL', 'moka-ai/m3e-small')
 
-# Postgres / pgvector
-_PG_DSN = os.getenv("POSTGRES_DSN")
-_PG_HOST = os.getenv("POSTGRES_HOST")
-_PG_PORT = os.getenv("POSTGRES_PORT", "5432")
-_PG_DB = os.getenv("POSTGRES_DB")
-_PG_USER = os.getenv("POSTGRES_USER")
-_PG_PASSWORD = os.getenv("POSTGRES_PASSWORD")
-_ENGINE = None
+# Postgres / pgvector（引擎与连接池由 storage 模块统一持有）
+# 写入行数达到该值时使用二进制 COPY，否则走 executemany（pipeline）
+_PG_COPY_MIN_ROWS = int(os.getenv('PGVECTOR_COPY_MIN_ROWS', '64'))
+
+# pgvector ANN 索引：hnsw | ivfflat | none；构建参数与查询参数均可经环境变量调整
+_PG_ANN_METHOD = os.getenv('PGVECTOR_INDEX', 'hnsw').lower()
+_PG_HNSW_M = int(os.getenv('PGVECTOR_HNSW_M', '16'))
+_PG_HNSW_EF_CONSTRUCTION = int(os.getenv('PGVECTOR_HNSW_EF_CONSTRUCTION', '64'))
+_PG_IVFFLAT_LISTS = int(os.getenv('PGVECTOR_IVFFLAT_LISTS', '0'))  # 0 = 按行数估算
+_PG_HNSW_EF_SEARCH = int(os.getenv('PGVECTOR_HNSW_EF_SEARCH', '0'))  # 0 = 使用服务器默认值
+_PG_IVFFLAT_PROBES = int(os.getenv('PGVECTOR_IVFFLAT_PROBES', '0'))
+_PG_ITERATIVE_SCAN = os.getenv('PGVECTOR_ITERATIVE_SCAN', '')  # relaxed_order | strict_order（pgvector >= 0.8）
+_PG_BUILD_WORK_MEM = os.getenv('PGVECTOR_BUILD_MAINTENANCE_WORK_MEM', '')
+
+
+# 并发模型：查询对分区加读锁并行执行，写入按分区串行；编码不持有任何索引锁
+_init_lock = Lock()
+_registry_lock = Lock()
+_dim: Optional[int] = None
+_pg_ready = False
+_local_ready = False
+
+# 本地 HNSW：按用户分区，每个用户一个独立索引，查询只在该用户分区内进行
+_PARTITION_DIR = os.path.join(_DATA_DIR, 'memory_hnsw')
+_PARTITION_INIT_CAPACITY = int(os.getenv('VECTOR_PARTITION_INIT_CAPACITY', '1024'))
+_MAX_LOADED_PARTITIONS = int(os.getenv('VECTOR_MAX_LOADED_PARTITIONS', '256'))
+# 容量按几何倍数增长；填充率超过 headroom 阈值时由后台线程提前扩容，写请求不在热路径上 resize
+_GROWTH_FACTOR = max(1.1, float(os.getenv('VECTOR_INDEX_GROWTH_FACTOR', '2.0')))
+_PREALLOC_RATIO = min(1.0, max(0.1, float(os.getenv('VECTOR_INDEX_PREALLOC_RATIO', '0.8'))))
+_EF_CONSTRUCTION = 200
+_M = 48
+_EF_SEARCH = 64
+
+# 写入先追加到 WAL，快照由后台线程按条数/时间触发，启动加载时回放 WAL
+_SNAPSHOT_MAX_WAL = int(os.getenv('VECTOR_SNAPSHOT_MAX_WAL', '1000'))
+_SNAPSHOT_INTERVAL = float(os.getenv('VECTOR_SNAPSHOT_INTERVAL', '60'))
+_WAL_FSYNC = os.getenv('VECTOR_WAL_FSYNC', '0') == '1'
+
+# 多进程部署角色：standalone（默认，单进程）| writer | reader | auto（按文件锁选出唯一 writer，其余为 reader）。
+# writer 独占分区文件与 WAL，每次快照后发布一个不可变版本并更新清单；reader 只读加载清单中的最新版本、
+# 发现新版本时热替换，自身收到的写入/删除经元数据库中的 outbox 表转交 writer
+_ROLE_SETTING = os.getenv('VECTOR_ROLE', 'standalone').lower()
+_PUBLISH_INTERVAL = max(0.1, float(os.getenv('VECTOR_PUBLISH_INTERVAL', '1.0')))
+_PUBLISH_KEEP = max(2, int(os.getenv('VECTOR_PUBLISH_KEEP', '3')))
+_PUBLISH_DIR = os.path.join(_PARTITION_DIR, 'published')
+_MANIFEST_PATH = os.path.join(_PUBLISH_DIR, 'manifest.json')
+_WRITER_LOCK_PATH = os.path.join(_PARTITION_DIR, 'writer.lock')
+_role: Optional[str] = None
+
+# 删除为墓碑标记（mark_deleted）；墓碑占比与数量都超过阈值时由后台线程重建分区
+_COMPACT_RATIO = float(os.getenv('VECTOR_COMPACT_TOMBSTONE_RATIO', '0.2'))
+_COMPACT_MIN = int(os.getenv('VECTOR_COMPACT_MIN_TOMBSTONES', '64'))
+
+# 量化存储：none | float16 | int8（逐向量 scale）。内存中只保留量化编码做粗排，
+# 对 top_k * VECTOR_RESCORE_FACTOR 个候选用磁盘上的重排向量（VECTOR_RESCORE_DTYPE）精确重排
+_QUANTIZATION = os.getenv('VECTOR_QUANTIZATION', 'none').lower()
+if _QUANTIZATION not in ('float16', 'int8'):
+    _QUANTIZATION = 'none'
+_RESCORE_FACTOR = max(1, int(os.getenv('VECTOR_RESCORE_FACTOR', '4')))
+# 重排向量文件的精度：float32 | float16 | none（不落盘，直接按编码打分）；
+# auto = int8 用 float16 重排，float16 编码本身已足够精确、不再另存
+_RESCORE_DTYPE: Optional[str] = os.getenv('VECTOR_RESCORE_DTYPE', 'auto').lower()
+if _RESCORE_DTYPE not in ('float32', 'float16', 'none'):
+    _RESCORE_DTYPE = 'float16' if _QUANTIZATION == 'int8' else 'none'
+if _RESCORE_DTYPE == 'none':
+    _RESCORE_DTYPE = None
+# pgvector 无 int8 类型：任一量化模式都在 halfvec 表达式上建 ANN 索引，再用原始 vector 列重排
+_PG_HALFVEC = _QUANTIZATION != 'none'
+# embedding 列类型：vector（float32）| halfvec（float16，表与索引约减半，不再有 float32 重排）。
+# 只作用于新建的表；已有表按实际列类型运行，见 _pg_column
+_PG_COLUMN_TYPE = 'halfvec' if os.getenv('PGVECTOR_COLUMN_TYPE', 'vector').lower() == 'halfvec' else 'vector'
+_pg_column = 'vector'
+
+# 召回重排（时间衰减 / 类型权重）时的候选倍数，以及未指定时时间衰减项所占权重
+_RERANK_FACTOR = max(1, int(os.getenv('VECTOR_RERANK_CANDIDATE_FACTOR', '4')))
+_RECENCY_WEIGHT = min(1.0, max(0.0, float(os.getenv('MEMORY_RECENCY_WEIGHT', '0.3'))))
+
+# 向量元数据（text/type/user_id/timestamp）存放在 SQLite 表中，只按 top-k 标签回查
+_META_DB_PATH = os.path.join(_PARTITION_DIR, 'meta.db')
+
+
+class _RWLock:
+    """写优先的读写锁：多个读者并行，写者独占"""
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _MetaStore:
+    """按 (分区, 标签) 索引的向量元数据表；event_id 为对应 memory_events 行的 id（旧数据为空）"""
+
+    _FIELDS = ("user_id", "type", "text", "timestamp")
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._path = path
+        # 单一写连接 + 每线程只读连接（WAL 模式下读不阻塞写）
+        self._lock = Lock()
+        self._local = local()
+        self._readers: List[sqlite3.Connection] = []
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vector_meta (
+                part TEXT NOT NULL,
+                label INTEGER NOT NULL,
+                user_id TEXT,
+                type TEXT,
+                text TEXT,
+                timestamp TEXT,
+                event_id INTEGER,
+                PRIMARY KEY (part, label)
+            ) WITHOUT ROWID
+            """
+        )
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(vector_meta)").fetchall()}
+        if 'event_id' not in columns:
+            self._conn.execute("ALTER TABLE vector_meta ADD COLUMN event_id INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vector_meta_type_ts ON vector_meta(type, timestamp)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vector_meta_event ON vector_meta(part, event_id)")
+        # reader 进程收到的写入排队于此，由 writer 按 id 顺序应用（至少一次）
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vector_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                part TEXT NOT NULL,
+                payload TEXT
+            )
+            """
+        )
+        # 存储级设置（如向量维度），删除/过期路径据此打开已有分区而无需加载嵌入模型
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vector_settings (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute("PRAGMA query_only=1")
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in [self._conn, *self._readers]:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._readers.clear()
+
+    def get_setting(self, key: str) -> Optional[str]:
+        row = self._reader().execute("SELECT value FROM vector_settings WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO vector_settings(key, value) VALUES(?,?)", (key, str(value)))
+            self._conn.commit()
+
+    def put_many(self, part: str, labels: List[int], metas: List[Dict[str, Any]]) -> None:
+        rows = [(part, int(lab), *(m.get(f) for f in self._FIELDS), m.get("id")) for lab, m in zip(labels, metas)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vector_meta(part, label, user_id, type, text, timestamp, event_id) VALUES(?,?,?,?,?,?,?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def get_many(self, part: str, labels: List[int]) -> Dict[int, Dict[str, Any]]:
+        if not labels:
+            return {}
+        marks = ",".join("?" * len(labels))
+        rows = self._reader().execute(
+            f"SELECT label, user_id, type, text, timestamp, event_id FROM vector_meta WHERE part=? AND label IN ({marks})",
+            (part, *[int(lab) for lab in labels]),
+        ).fetchall()
+        return {int(r[0]): {**dict(zip(self._FIELDS, r[1:5])), "id": r[5]} for r in rows}
+
+    def labels(self, part: str) -> List[int]:
+        rows = self._reader().execute("SELECT label FROM vector_meta WHERE part=? ORDER BY label", (part,)).fetchall()
+        return [int(r[0]) for r in rows]
+
+    def find(self, part: str, items: List[Dict[str, Any]]) -> List[int]:
+        """查找与被删除的 memory_events 行对应的标签：按 id 对齐；
+        没有记录 event_id 的旧向量退回按 (type, text, timestamp) 匹配"""
+        found: List[int] = []
+        reader = self._reader()
+        for it in items:
+            rows = []
+            if it.get("id") is not None:
+                rows = reader.execute(
+                    "SELECT label FROM vector_meta WHERE part=? AND event_id=?", (part, int(it["id"]))
+                ).fetchall()
+            if not rows:
+                rows = reader.execute(
+                    "SELECT label FROM vector_meta WHERE part=? AND type IS ? AND text IS ? AND timestamp IS ?"
+                    + (" AND event_id IS NULL" if it.get("id") is not None else ""),
+                    (part, it.get("type"), it.get("text"), it.get("timestamp")),
+                ).fetchall()
+            found.extend(int(r[0]) for r in rows)
+        return found
+
+    def expired(self, type_: str, cutoff: str) -> Dict[str, List[int]]:
+        rows = self._reader().execute(
+            "SELECT part, label FROM vector_meta WHERE type=? AND timestamp < ?", (type_, cutoff)
+        ).fetchall()
+        by_part: Dict[str, List[int]] = {}
+        for part, label in rows:
+            by_part.setdefault(part, []).append(int(label))
+        return by_part
+
+    def delete_many(self, part: str, labels: List[int]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM vector_meta WHERE part=? AND label=?", [(part, int(lab)) for lab in labels])
+            self._conn.commit()
+
+    def delete_part(self, part: str) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM vector_meta WHERE part=?", (part,))
+            self._conn.commit()
+            return int(cur.rowcount or 0)
+
+    def enqueue(self, op: str, part: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO vector_outbox(op, part, payload) VALUES(?,?,?)",
+                (op, part, json.dumps(payload, ensure_ascii=False)),
+            )
+            self._conn.commit()
+
+    def pending_ops(self, limit: int) -> List[tuple]:
+        rows = self._reader().execute(
+            "SELECT id, op, part, payload FROM vector_outbox ORDER BY id LIMIT ?", (int(limit),)
+        ).fetchall()
+        return [(int(r[0]), r[1], r[2], json.loads(r[3] or '{}')) for r in rows]
+
+    def ack(self, ids: List[int]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM vector_outbox WHERE id=?", [(int(i),) for i in ids])
+            self._conn.commit()
+
+    def outbox_size(self) -> int:
+        return int(self._reader().execute("SELECT COUNT(1) FROM vector_outbox").fetchone()[0])
+
+
+_meta_store: Optional[_MetaStore] = None
+_meta_store_lock = Lock()
+
+
+def _get_meta_store() -> _MetaStore:
+    global _meta_store
+    if _meta_store is None:
+        with _meta_store_lock:
+            if _meta_store is None:
+                _meta_store = _MetaStore(_META_DB_PATH)
+    return _meta_store
+
+
+class _QuantizedIndex:
+    """量化的分区索引，接口与 hnswlib.Index 中用到的部分一致。
+
+    内存中保存 float16 / int8 编码（int8 附带逐向量 scale）做全量粗排；重排向量（vec_dtype：
+    float32 / float16，None 为不落盘）按行定长写入 vec_path，查询时只读取候选行精确重排。
+    分区按用户划分、规模较小，粗排为精确扫描。reader 从发布版本加载时编码为只读内存映射
+    （load_published），多个进程共享同一份页缓存。
+    """
+
+    _CHUNK = 8192
+
+    def __init__(self, dim: int, mode: str, vec_path: str, max_elements: int, vec_dtype: Optional[str] = 'float32'):
+        self.dim = int(dim)
+        self.mode = mode
+        self.vec_path = vec_path
+        self.vec_dtype = vec_dtype
+        cap = max(1, int(max_elements))
+        self.codes = np.zeros((cap, self.dim), dtype=np.int8 if mode == 'int8' else np.float16)
+        self.scales = np.ones(cap, dtype=np.float32)
+        self.labels = np.zeros(cap, dtype=np.int64)
+        self.n = 0
+        self._rows: Optional[Dict[int, int]] = {}
+        self.deleted: set = set()
+        self._mm: Optional[np.memmap] = None
+
+    @property
+    def rows(self) -> Dict[int, int]:
+        """标签 -> 行号；从快照加载时按需构建（只读副本的查询路径不需要）"""
+        if self._rows is None:
+            self._rows = {int(lab): i for i, lab in enumerate(self.labels[:self.n].tolist())}
+        return self._rows
+
+    def get_ids_list(self) -> List[int]:
+        return list(self.rows.keys())
+
+    def mark_deleted(self, label: int) -> None:
+        row = self.rows.get(int(label))
+        if row is None or row in self.deleted:
+            raise RuntimeError("Label not found or already deleted")
+        self.deleted.add(row)
+
+    def get_current_count(self) -> int:
+        return self.n
+
+    def get_max_elements(self) -> int:
+        return len(self.codes)
+
+    def set_ef(self, ef: int) -> None:
+        pass
+
+    def resize_index(self, new_size: int) -> None:
+        n = self.n
+        new_size = max(int(new_size), n, 1)
+        codes = np.zeros((new_size, self.dim), dtype=self.codes.dtype)
+        codes[:n] = self.codes[:n]
+        scales = np.ones(new_size, dtype=np.float32)
+        scales[:n] = self.scales[:n]
+        labels = np.zeros(new_size, dtype=np.int64)
+        labels[:n] = self.labels[:n]
+        self.codes, self.scales, self.labels = codes, scales, labels
+
+    def _quantize(self, vecs: np.ndarray):
+        if self.mode == 'int8':
+            scales = np.maximum(np.abs(vecs).max(axis=1), 1e-12) / 127.0
+            codes = np.clip(np.rint(vecs / scales[:, None]), -127, 127).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return vecs.astype(np.float16), np.ones(len(vecs), dtype=np.float32)
+
+    def add_items(self, data, ids) -> None:
+        vecs = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        rows = []
+        for label in np.asarray(ids).reshape(-1).tolist():
+            row = self.rows.get(int(label))
+            if row is None:
+                row = self.n
+                if row >= len(self.codes):
+                    raise RuntimeError("The number of elements exceeds the specified limit")
+                self.rows[int(label)] = row
+                self.labels[row] = int(label)
+                self.n += 1
+            rows.append(row)
+        codes, scales = self._quantize(vecs)
+        self.codes[rows] = codes
+        self.scales[rows] = scales
+        if self.vec_dtype is None:
+            return
+        # 重排向量按行偏移写入，WAL 回放时重复写同一位置是幂等的
+        row_bytes = self.dim * np.dtype(self.vec_dtype).itemsize
+        mode = 'r+b' if os.path.exists(self.vec_path) else 'wb'
+        with open(self.vec_path, mode) as f:
+            for row, vec in zip(rows, vecs.astype(self.vec_dtype)):
+                f.seek(row * row_bytes)
+                f.write(vec.tobytes())
+
+    def _map_vectors(self) -> Optional[np.memmap]:
+        if self.vec_dtype is None or not os.path.exists(self.vec_path):
+            return None
+        size = os.path.getsize(self.vec_path) // (self.dim * np.dtype(self.vec_dtype).itemsize)
+        if not size:
+            return None
+        return np.memmap(self.vec_path, dtype=self.vec_dtype, mode='r', shape=(size, self.dim))
+
+    def _exact(self, rows: np.ndarray) -> Optional[np.ndarray]:
+        try:
+            mm = self._mm if self._mm is not None else self._map_vectors()
+            if mm is None or mm.shape[0] <= int(rows.max()):
+                return None
+            return np.asarray(mm[rows], dtype=np.float32)
+        except Exception:
+            return None
+
+    def pin_vectors(self) -> None:
+        """只读副本：常驻映射重排向量文件（多个进程共享页缓存；文件被回收后映射仍然有效）"""
+        self._mm = self._map_vectors()
+
+    def get_items(self, ids) -> np.ndarray:
+        rows = np.asarray([self.rows[int(i)] for i in ids], dtype=np.int64)
+        if not len(rows):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        exact = self._exact(rows)
+        if exact is not None:
+            return exact
+        return self.codes[rows].astype(np.float32) * self.scales[rows][:, None]
+
+    def knn_query(self, data, k: int = 1):
+        # 多条查询共用一次粗排矩阵乘法，再逐条取候选精确重排
+        qs = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        qs = qs / np.maximum(np.linalg.norm(qs, axis=1, keepdims=True), 1e-12)
+        n = self.n
+        live = n - len(self.deleted)
+        k = min(int(k), live)
+        approx = np.empty((n, len(qs)), dtype=np.float32)
+        for start in range(0, n, self._CHUNK):
+            end = min(n, start + self._CHUNK)
+            approx[start:end] = (self.codes[start:end].astype(np.float32) @ qs.T) * self.scales[start:end, None]
+        if self.deleted:
+            approx[list(self.deleted)] = -np.inf
+        cand = min(live, k * _RESCORE_FACTOR)
+        labels = np.empty((len(qs), k), dtype=np.int64)
+        distances = np.empty((len(qs), k), dtype=np.float32)
+        for j, q in enumerate(qs):
+            col = approx[:, j]
+            rows = np.argpartition(-col, cand - 1)[:cand] if cand < n else np.arange(n)
+            exact = self._exact(rows)
+            scores = exact @ q if exact is not None else col[rows]
+            order = np.argsort(-scores)[:k]
+            labels[j] = self.labels[rows[order]]
+            distances[j] = 1.0 - scores[order]
+        return labels, distances
+
+    def save_index(self, path: str) -> None:
+        n = self.n
+        if self.vec_dtype is not None and os.path.exists(self.vec_path):
+            with open(self.vec_path, 'rb+') as f:
+                os.fsync(f.fileno())
+        with open(path, 'wb') as f:
+            np.savez(f, codes=self.codes[:n], scales=self.scales[:n], labels=self.labels[:n],
+                     capacity=np.asarray([len(self.codes)]), deleted=np.asarray(sorted(self.deleted), dtype=np.int64),
+                     vec_dtype=np.asarray(self.vec_dtype or 'none'))
+
+    @classmethod
+    def load(cls, path: str, dim: int, mode: str, vec_path: str) -> "_QuantizedIndex":
+        with np.load(path, allow_pickle=False) as z:
+            labels = z['labels']
+            # 旧快照未记录重排精度，均为 float32
+            vec_dtype = str(z['vec_dtype']) if 'vec_dtype' in z.files else 'float32'
+            index = cls(dim, mode, vec_path, max(int(z['capacity'][0]), len(labels)),
+                        vec_dtype=None if vec_dtype == 'none' else vec_dtype)
+            n = len(labels)
+            index.labels[:n] = labels
+            index.n = n
+            index._rows = None
+            if 'deleted' in z.files:
+                index.deleted = set(int(r) for r in z['deleted'].tolist())
+            if z['codes'].dtype == index.codes.dtype:
+                index.codes[:n] = z['codes']
+                index.scales[:n] = z['scales']
+            elif n:
+                # 量化模式变化：优先用磁盘上的重排向量重新量化
+                vecs = index._exact(np.arange(n))
+                if vecs is None:
+                    vecs = z['codes'].astype(np.float32) * z['scales'][:, None]
+                codes, scales = index._quantize(vecs)
+                index.codes[:n] = codes
+                index.scales[:n] = scales
+        return index
+
+    _PUBLISHED = ('codes.npy', 'scales.npy', 'labels.npy')
+
+    def save_published(self, directory: str, reuse_from: Optional[str] = None) -> int:
+        """writer：把编码写成可内存映射的 .npy（np.savez 的 zip 无法映射），返回写入字节数。
+
+        reuse_from 为上一版本目录且期间没有新写入时，编码文件直接硬链接；墓碑每次重写（很小）。
+        """
+        n = self.n
+        written = 0
+        for name, arr in zip(self._PUBLISHED, (self.codes[:n], self.scales[:n], self.labels[:n])):
+            dst = os.path.join(directory, name)
+            if reuse_from and os.path.exists(os.path.join(reuse_from, name)):
+                _link_or_copy(os.path.join(reuse_from, name), dst)
+            else:
+                np.save(dst, arr)
+                written += os.path.getsize(dst)
+        np.save(os.path.join(directory, 'deleted.npy'), np.asarray(sorted(self.deleted), dtype=np.int64))
+        with open(os.path.join(directory, 'quantized.json'), 'w', encoding='utf-8') as f:
+            json.dump({'mode': self.mode, 'vec_dtype': self.vec_dtype, 'count': n}, f)
+        return written
+
+    @classmethod
+    def load_published(cls, directory: str) -> "_QuantizedIndex":
+        """reader：编码、scale、标签均以只读内存映射加载，不复制到进程私有内存"""
+        with open(os.path.join(directory, 'quantized.json'), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        index = cls.__new__(cls)
+        index.mode = info['mode']
+        index.vec_dtype = info.get('vec_dtype')
+        index.vec_path = os.path.join(directory, 'vec')
+        index.codes, index.scales, index.labels = (
+            np.load(os.path.join(directory, name), mmap_mode='r') for name in cls._PUBLISHED)
+        index.dim = int(index.codes.shape[1])
+        index.n = int(info['count'])
+        index._rows = None
+        index.deleted = set(int(r) for r in np.load(os.path.join(directory, 'deleted.npy')).tolist())
+        index._mm = None
+        return index
+
 
+class _Partition:
+    """单个用户的本地 HNSW 索引（元数据见 _MetaStore）"""
 
-def _use_pg() -> bool:
-    return bool(_PG_DSN or (_PG_HOST and _PG_DB and _PG_USER and _PG_PASSWORD))
+    def __init__(self, key: str, index: "hnswlib.Index", next_id: int = 0):
+        self.key = key
+        self.index = index
+        self.next_id = next_id
+        # lock 串行化该分区的写者（追加/快照/淘汰）；rw 隔离内存索引的修改与并发查询
+        self.lock = Lock()
+        self.rw = _RWLock()
+        self._ef = _EF_SEARCH
+        self.wal_pending = 0
+        self.dirty_since: Optional[float] = None
+        self.evicted = False
+        self.tombstones = 0
+        self.generation = 0  # reader：当前加载的发布版本
+        self.data_changed = True  # writer：上次发布后是否有新写入（编码与重排向量文件变化）
 
+    @property
+    def index_path(self) -> str:
+        return os.path.join(_PARTITION_DIR, f"{self.key}.index")
 
-def _get_engine():
-    global _ENGINE
-    if _ENGINE is not None:
-        return _ENGINE
-    if _PG_DSN:
-        dsn = _PG_DSN
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(_PARTITION_DIR, f"{self.key}.meta.json")
+
+    @property
+    def wal_path(self) -> str:
+        return os.path.join(_PARTITION_DIR, f"{self.key}.wal")
+
+    @property
+    def vec_path(self) -> str:
+        return os.path.join(_PARTITION_DIR, f"{self.key}.vec")
+
+    def count(self) -> int:
+        return int(self.index.get_current_count())
+
+    def capacity(self) -> int:
+        return int(self.index.get_max_elements())
+
+    def fill_ratio(self) -> float:
+        return self.count() / max(1, self.capacity())
+
+    def live_count(self) -> int:
+        return max(0, self.count() - self.tombstones)
+
+    def needs_compaction(self) -> bool:
+        # 重排精度配置变化时也借重建把重排向量文件改写为新精度（或删除）
+        if isinstance(self.index, _QuantizedIndex) and self.index.vec_dtype != _RESCORE_DTYPE:
+            return True
+        return self.tombstones >= _COMPACT_MIN and self.tombstones >= self.count() * _COMPACT_RATIO
+
+    def needs_prealloc(self) -> bool:
+        return self.fill_ratio() >= _PREALLOC_RATIO
+
+    def ensure_capacity(self, extra: int) -> None:
+        """兜底：单批写入超过剩余容量时同步扩容（调用方持有 rw 写锁）"""
+        needed = self.count() + extra
+        cap = self.capacity()
+        if needed > cap:
+            self.index.resize_index(_grow_target(needed, cap))
+            metrics_inc('vector_index_sync_resizes', 1)
+
+    def preallocate(self) -> bool:
+        """后台扩容（调用方持有 self.lock）：在副本上 resize 后替换，期间查询照常进行"""
+        if not self.needs_prealloc():
+            return False
+        with self.rw.read():
+            clone = pickle.loads(pickle.dumps(self.index))
+        clone.resize_index(_grow_target(self.count() + 1, self.capacity()))
+        clone.set_ef(self._ef)
+        with self.rw.write():
+            self.index = clone
+        metrics_inc('vector_index_prealloc_resizes', 1)
+        return True
+
+    def _apply(self, embs: np.ndarray, ids: List[int]) -> None:
+        with self.rw.write():
+            self.ensure_capacity(len(ids))
+            self.index.add_items(embs, np.asarray(ids))
+            self.next_id = max(self.next_id, max(ids) + 1)
+            self.data_changed = True
+
+    def _append_wal(self, records: List[Dict[str, Any]]) -> None:
+        os.makedirs(_PARTITION_DIR, exist_ok=True)
+        with open(self.wal_path, 'a', encoding='utf-8') as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+            if _WAL_FSYNC:
+                os.fsync(f.fileno())
+        self.wal_pending += len(records)
+        if self.dirty_since is None:
+            self.dirty_since = time.time()
+
+    def add(self, embs: np.ndarray, metas: List[Dict[str, Any]]) -> None:
+        """追加写：元数据入表、向量落 WAL，再更新内存索引，不触发整份索引重写"""
+        embs = np.asarray(embs, dtype=np.float32)
+        ids = list(range(self.next_id, self.next_id + len(metas)))
+        _get_meta_store().put_many(self.key, ids, metas)
+        self._append_wal([{'id': i, 'vec': base64.b64encode(emb.tobytes()).decode('ascii')} for i, emb in zip(ids, embs)])
+        self._apply(embs, ids)
+
+    def _mark_deleted(self, labels: List[int]) -> int:
+        done = 0
+        with self.rw.write():
+            for lab in labels:
+                try:
+                    self.index.mark_deleted(int(lab))
+                    done += 1
+                except RuntimeError:
+                    # 已删除或不存在（WAL 重放时可能重复）
+                    pass
+        self.tombstones += done
+        return done
+
+    def delete(self, labels: List[int]) -> int:
+        """删除：元数据出表、墓碑落 WAL，再在内存索引中标记删除（调用方持有 self.lock）"""
+        labels = sorted(set(int(lab) for lab in labels))
+        if not labels:
+            return 0
+        _get_meta_store().delete_many(self.key, labels)
+        self._append_wal([{'del': labels}])
+        return self._mark_deleted(labels)
+
+    def compact(self) -> int:
+        """用存活向量重建索引以回收墓碑（调用方持有 self.lock），返回回收数量"""
+        with self.rw.read():
+            present = set(int(i) for i in self.index.get_ids_list())
+            live = [lab for lab in _get_meta_store().labels(self.key) if lab in present]
+            vecs = np.asarray(self.index.get_items(live), dtype=np.float32) if live else None
+        tmp_vec = self.vec_path + '.compact'
+        if os.path.exists(tmp_vec):
+            os.remove(tmp_vec)
+        index = _new_index(self.key, _grow_target(len(live) + 1, max(_PARTITION_INIT_CAPACITY, len(live))), vec_path=tmp_vec)
+        if live:
+            index.add_items(vecs, np.asarray(live))
+        index.set_ef(self._ef)
+        reclaimed = self.tombstones
+        with self.rw.write():
+            if isinstance(index, _QuantizedIndex):
+                if os.path.exists(tmp_vec):
+                    os.replace(tmp_vec, self.vec_path)
+                elif os.path.exists(self.vec_path):
+                    os.remove(self.vec_path)
+                index.vec_path = self.vec_path
+            self.index = index
+            self.tombstones = 0
+            self.data_changed = True
+        self.snapshot()
+        return reclaimed
+
+    def replay_wal(self) -> None:
+        """加载时回放快照之后的 WAL 记录；忽略崩溃导致的残缺尾行"""
+        if not os.path.exists(self.wal_path):
+            return
+        snapshot_next = self.next_id
+        ids: List[int] = []
+        vecs: List[np.ndarray] = []
+        deleted: List[int] = []
+        legacy_ids: List[int] = []
+        legacy_metas: List[Dict[str, Any]] = []
+        with open(self.wal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    if 'del' in rec:
+                        deleted.extend(int(lab) for lab in rec['del'])
+                        continue
+                    vec = np.frombuffer(base64.b64decode(rec['vec']), dtype=np.float32)
+                except Exception:
+                    continue
+                if int(rec['id']) < snapshot_next:
+                    continue
+                ids.append(int(rec['id']))
+                vecs.append(vec)
+                # 旧格式 WAL 记录内联了元数据，回放时迁移到元数据表
+                if rec.get('meta'):
+                    legacy_ids.append(int(rec['id']))
+                    legacy_metas.append(rec['meta'])
+        if legacy_ids:
+            _get_meta_store().put_many(self.key, legacy_ids, legacy_metas)
+        if ids:
+            self._apply(np.stack(vecs), ids)
+        if deleted:
+            self._mark_deleted(deleted)
+        if ids or deleted:
+            self.wal_pending = len(ids) + len(deleted)
+            self.dirty_since = time.time()
+
+    def search(self, emb: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        return self.search_many(np.asarray(emb, dtype=np.float32)[None, :], [top_k])[0]
+
+    def search_many(self, embs: np.ndarray, top_ks: List[int]) -> List[List[Dict[str, Any]]]:
+        """一次 knn_query 检索多条查询（k 取最大值后逐条截断），元数据一次回查"""
+        with self.rw.read():
+            # hnswlib 要求 k 不超过当前（未删除）元素数，且 ef >= k
+            k = min(max(int(t) for t in top_ks), self.live_count())
+            if k <= 0:
+                return [[] for _ in top_ks]
+            # ef 由所有查询共享：只增不减，避免并发查询互相调小
+            if k > self._ef:
+                self._ef = k
+                self.index.set_ef(k)
+            labels, distances = self.index.knn_query(embs, k=k)
+        metas = _get_meta_store().get_many(self.key, sorted(set(int(lab) for lab in labels.reshape(-1))))
+        out: List[List[Dict[str, Any]]] = []
+        for row_labels, row_dists, want in zip(labels, distances, top_ks):
+            results: List[Dict[str, Any]] = []
+            for lab, dist in zip(row_labels, row_dists):
+                meta = metas.get(int(lab))
+                if meta is None:
+                    continue
+                results.append({**meta, 'score': float(1 - dist)})
+            out.append(results[:int(want)])
+        return out
+
+    def needs_snapshot(self, now: float) -> bool:
+        if not self.wal_pending:
+            return False
+        # writer 的快照即发布，按发布间隔进行，reader 的可见延迟由此决定
+        interval = _PUBLISH_INTERVAL if _role == 'writer' else _SNAPSHOT_INTERVAL
+        return self.wal_pending >= _SNAPSHOT_MAX_WAL or (now - (self.dirty_since or now)) >= interval
+
+    def snapshot(self) -> None:
+        """原子写入索引与元数据快照，随后截断 WAL（调用方持有 self.lock）"""
+        os.makedirs(_PARTITION_DIR, exist_ok=True)
+        with self.rw.read():
+            self.index.save_index(self.index_path + '.tmp')
+        with open(self.meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'next_id': self.next_id, 'tombstones': self.tombstones, 'dim': _dim}, f)
+        os.replace(self.index_path + '.tmp', self.index_path)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+        if os.path.exists(self.wal_path):
+            open(self.wal_path, 'w').close()
+        self.wal_pending = 0
+        self.dirty_since = None
+        if _role == 'writer':
+            self.publish()
+
+    def publish(self) -> int:
+        """writer：把刚写好的快照发布为不可变版本目录并更新清单（调用方持有 self.lock），返回版本号。
+
+        索引与 meta.json 每次快照都经 os.replace 整体替换、从不原地修改，直接硬链接进版本目录；
+        量化索引改为发布可内存映射的 .npy 编码（见 _QuantizedIndex.save_published），reader 之间
+        经页缓存共享。重排向量文件会被原地追加，仅在上次发布后有写入时复制，否则链接上一版本的文件。
+        """
+        with _publish_lock:
+            prev = _manifest.get(self.key, 0)
+        gen = prev + 1
+        target = os.path.join(_PUBLISH_DIR, self.key, str(gen))
+        tmp = target + '.tmp'
+        prev_dir = os.path.join(_PUBLISH_DIR, self.key, str(prev))
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        if isinstance(self.index, _QuantizedIndex):
+            with self.rw.read():
+                written = self.index.save_published(tmp, None if self.data_changed else prev_dir)
+            metrics_inc('vector_publish_bytes_copied', written)
+        elif os.path.exists(self.index_path):
+            _link_or_copy(self.index_path, os.path.join(tmp, 'index'))
+        if os.path.exists(self.meta_path):
+            _link_or_copy(self.meta_path, os.path.join(tmp, 'meta.json'))
+        if os.path.exists(self.vec_path):
+            prev_vec = os.path.join(prev_dir, 'vec')
+            if not self.data_changed and os.path.exists(prev_vec):
+                _link_or_copy(prev_vec, os.path.join(tmp, 'vec'))
+            else:
+                shutil.copyfile(self.vec_path, os.path.join(tmp, 'vec'))
+                metrics_inc('vector_publish_bytes_copied', os.path.getsize(self.vec_path))
+        # 上次发布在写清单前中断时可能残留同号目录（尚未被任何 reader 引用）
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        with _publish_lock:
+            _manifest[self.key] = gen
+            _write_manifest()
+        _prune_published(self.key, gen)
+        self.data_changed = False
+        metrics_inc('vector_snapshots_published', 1)
+        return gen
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """硬链接（零拷贝，与 writer 共享页缓存）；文件系统不支持时退化为复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+        metrics_inc('vector_publish_bytes_copied', os.path.getsize(src))
+
+
+_partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+_snapshot_wakeup = Event()
+_snapshot_thread: Optional[Thread] = None
+_stop = Event()  # 后台线程（快照 / 副本刷新）的停止信号，见 close()
+
+
+def _partition_key(user_id: Any) -> str:
+    """用户ID -> 分区文件名（哈希，避免非法路径字符）"""
+    return hashlib.sha1(str(user_id).encode('utf-8')).hexdigest()[:20]
+
+
+def _grow_target(needed: int, cap: int) -> int:
+    """几何增长，且扩容后仍低于预分配阈值，避免刚扩完又触发"""
+    target = max(int(math.ceil(cap * _GROWTH_FACTOR)), int(math.ceil(needed / _PREALLOC_RATIO)) + 1)
+    return max(target, needed)
+
+
+def _new_index(key: str, max_elements: int, vec_path: Optional[str] = None):
+    if _QUANTIZATION != 'none':
+        os.makedirs(_PARTITION_DIR, exist_ok=True)
+        return _QuantizedIndex(_dim, _QUANTIZATION, vec_path or os.path.join(_PARTITION_DIR, f"{key}.vec"), max_elements,
+                               vec_dtype=_RESCORE_DTYPE)
+    index = hnswlib.Index(space='cosine', dim=_dim)
+    index.init_index(max_elements=max(1, int(max_elements)), ef_construction=_EF_CONSTRUCTION, M=_M)
+    index.set_ef(_EF_SEARCH)
+    return index
+
+
+def _load_index(key: str, index_path: str, vec_path: Optional[str] = None, convert: bool = True):
+    """加载分区快照；量化配置与快照格式不一致时就地转换（reader 加载发布版本时不转换）"""
+    with open(index_path, 'rb') as f:
+        quantized_file = f.read(2) == b'PK'  # np.savez 为 zip 格式
+    vec_path = vec_path or os.path.join(_PARTITION_DIR, f"{key}.vec")
+    if quantized_file:
+        index = _QuantizedIndex.load(index_path, _dim, _QUANTIZATION if _QUANTIZATION != 'none' else 'float16', vec_path)
+        labels = index.labels[:index.get_current_count()].tolist()
     else:
-        dsn = f"postgresql+psycopg://{_PG_USER}:{_PG_PASSWORD}@{_PG_HOST}:{_PG_PORT}/{_PG_DB}"
-    _ENGINE = create_engine(dsn, pool_pre_ping=True)
-    return _ENGINE
+        index = hnswlib.Index(space='cosine', dim=_dim)
+        index.load_index(index_path)
+        index.set_ef(_EF_SEARCH)
+        labels = list(index.get_ids_list())
+    if not convert or quantized_file == (_QUANTIZATION != 'none'):
+        return index
+    converted = _new_index(key, max(_PARTITION_INIT_CAPACITY, int(index.get_max_elements())))
+    if labels:
+        converted.add_items(np.asarray(index.get_items(labels), dtype=np.float32), np.asarray(labels))
+    return converted
+
+
+def _get_partition(key: str, create: bool = False) -> Optional[_Partition]:
+    """获取（必要时从磁盘加载）分区；按 LRU 限制常驻内存的分区数量"""
+    with _registry_lock:
+        return _load_partition(key, create)
+
+
+def _load_partition(key: str, create: bool) -> Optional[_Partition]:
+    part = _partitions.get(key)
+    if part is not None:
+        _partitions.move_to_end(key)
+        return part
+    if _role == 'reader':
+        part = _load_published(key)
+        if part is not None:
+            _partitions[key] = part
+            _evict_partitions()
+        return part
+    index_path = os.path.join(_PARTITION_DIR, f"{key}.index")
+    meta_path = os.path.join(_PARTITION_DIR, f"{key}.meta.json")
+    wal_path = os.path.join(_PARTITION_DIR, f"{key}.wal")
+    if os.path.exists(index_path) and os.path.exists(meta_path):
+        index = _load_index(key, index_path)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        part = _Partition(key, index, meta.get('next_id', 0))
+        part.tombstones = int(meta.get('tombstones', 0))
+        if meta.get('id_to_meta'):
+            # 旧版快照把元数据内联在 JSON 中：迁移到元数据表并重写为精简快照
+            legacy = {int(k): v for k, v in meta['id_to_meta'].items()}
+            _get_meta_store().put_many(key, list(legacy.keys()), list(legacy.values()))
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'next_id': part.next_id}, f)
+            os.replace(meta_path + '.tmp', meta_path)
+    elif create or os.path.exists(wal_path):
+        part = _Partition(key, _new_index(key, _PARTITION_INIT_CAPACITY))
+    else:
+        return None
+    part.replay_wal()
+    _partitions[key] = part
+    _evict_partitions()
+    if part.needs_prealloc():
+        _snapshot_wakeup.set()
+    return part
+
+
+def _evict_partitions():
+    """淘汰最久未用的分区；未快照的写入保存在 WAL 中，重新加载时回放"""
+    for key in list(_partitions.keys()):
+        if len(_partitions) <= max(1, _MAX_LOADED_PARTITIONS):
+            return
+        part = _partitions[key]
+        # writer 中有未发布写入的分区先保留，待下一次快照发布后再淘汰
+        if _role == 'writer' and part.wal_pending:
+            continue
+        # 正在快照的分区跳过，避免与重新加载的实例同时写文件
+        if not part.lock.acquire(blocking=False):
+            continue
+        try:
+            part.evicted = True
+            del _partitions[key]
+        finally:
+            part.lock.release()
+
+
+def _all_partition_keys() -> List[str]:
+    with _registry_lock:
+        keys = set(_partitions.keys())
+    if _role == 'reader':
+        return sorted(keys | set(_replica_manifest().keys()))
+    if os.path.isdir(_PARTITION_DIR):
+        for name in os.listdir(_PARTITION_DIR):
+            for suffix in ('.index', '.wal'):
+                if name.endswith(suffix):
+                    keys.add(name[:-len(suffix)])
+    return sorted(keys)
+
+
+def _snapshot_due(force: bool = False) -> int:
+    """为达到阈值的分区生成快照，返回快照数量"""
+    now = time.time()
+    done = 0
+    with _registry_lock:
+        parts = list(_partitions.values())
+    for part in parts:
+        if not (part.wal_pending if force else part.needs_snapshot(now)):
+            continue
+        with part.lock:
+            if part.evicted or not part.wal_pending:
+                continue
+            try:
+                part.snapshot()
+                done += 1
+            except Exception as e:
+                print(f"Vector snapshot failed for partition {part.key}: {e}")
+    if done:
+        metrics_inc('vector_snapshots', done)
+    return done
+
+
+def _preallocate_due() -> int:
+    """为接近容量上限的分区提前扩容，返回扩容数量"""
+    with _registry_lock:
+        parts = [p for p in _partitions.values() if p.needs_prealloc()]
+    done = 0
+    for part in parts:
+        with part.lock:
+            if part.evicted:
+                continue
+            try:
+                done += int(part.preallocate())
+            except Exception as e:
+                print(f"Vector index preallocation failed for partition {part.key}: {e}")
+    return done
+
+
+def _compact_due() -> int:
+    """重建墓碑过多的分区，返回重建数量"""
+    with _registry_lock:
+        parts = [p for p in _partitions.values() if p.needs_compaction()]
+    done = 0
+    for part in parts:
+        with part.lock:
+            if part.evicted or not part.needs_compaction():
+                continue
+            try:
+                metrics_inc('vector_tombstones_reclaimed', part.compact())
+                done += 1
+            except Exception as e:
+                print(f"Vector compaction failed for partition {part.key}: {e}")
+    if done:
+        metrics_inc('vector_compactions', done)
+    return done
+
+
+_publish_lock = Lock()
+_manifest: Dict[str, int] = {}  # writer：分区 -> 最新发布版本
+_manifest_version = 0
+_writer_lock_file = None
+_replica_lock = Lock()
+_replica_state: Dict[str, Any] = {"version": 0, "partitions": {}, "mtime": None}
+_replica_thread: Optional[Thread] = None
+
+
+def _try_writer_lock() -> bool:
+    """非阻塞地获取 writer 文件锁；进程存活期间一直持有，退出时由内核释放"""
+    global _writer_lock_file
+    import fcntl
+    os.makedirs(_PARTITION_DIR, exist_ok=True)
+    f = open(_WRITER_LOCK_PATH, 'a+')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    _writer_lock_file = f
+    return True
+
+
+def _resolve_role() -> str:
+    if _ROLE_SETTING == 'reader':
+        return 'reader'
+    if _ROLE_SETTING in ('writer', 'auto'):
+        if _try_writer_lock():
+            return 'writer'
+        if _ROLE_SETTING == 'writer':
+            raise RuntimeError(f"vector writer lock is held by another process ({_WRITER_LOCK_PATH}); use VECTOR_ROLE=reader or auto")
+        return 'reader'
+    return 'standalone'
+
+
+def role() -> str:
+    """本进程的向量索引角色：standalone | writer | reader（初始化前返回配置值）"""
+    return _role or _ROLE_SETTING
+
+
+def _read_manifest() -> Dict[str, Any]:
+    try:
+        with open(_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": 0, "partitions": {}}
+
+
+def _load_writer_manifest() -> None:
+    global _manifest_version
+    data = _read_manifest()
+    with _publish_lock:
+        _manifest.clear()
+        _manifest.update({k: int(v) for k, v in data.get('partitions', {}).items()})
+        _manifest_version = int(data.get('version', 0))
+
+
+def _write_manifest() -> None:
+    """原子替换清单文件（调用方持有 _publish_lock）"""
+    global _manifest_version
+    _manifest_version += 1
+    os.makedirs(_PUBLISH_DIR, exist_ok=True)
+    tmp = _MANIFEST_PATH + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"version": _manifest_version, "writer_pid": os.getpid(), "partitions": _manifest}, f)
+    os.replace(tmp, _MANIFEST_PATH)
+
+
+def _prune_published(key: str, gen: int) -> None:
+    """只保留最近 VECTOR_PUBLISH_KEEP 个版本；reader 已映射的文件在删除后仍可读"""
+    root = os.path.join(_PUBLISH_DIR, key)
+    for name in os.listdir(root):
+        if name.isdigit() and int(name) <= gen - _PUBLISH_KEEP:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
 
-_lock = Lock()
-_model: Optional[SentenceTransformer] = None
-_index: Optional["hnswlib.Index"] = None
-_dim: Optional[int] = None
-_next_id: int = 0
-_id_to_meta: Dict[int, Dict[str, Any]] = {}
+
+def _unpublish(key: str) -> None:
+    with _publish_lock:
+        if _manifest.pop(key, None) is None:
+            return
+        _write_manifest()
+    shutil.rmtree(os.path.join(_PUBLISH_DIR, key), ignore_errors=True)
+
+
+def _published_current(key: str) -> bool:
+    """已发布版本与私有快照一致：WAL 为空且 meta.json（next_id、墓碑数）相同"""
+    with _publish_lock:
+        gen = _manifest.get(key)
+    if not gen:
+        return False
+    wal = os.path.join(_PARTITION_DIR, f"{key}.wal")
+    if os.path.exists(wal) and os.path.getsize(wal):
+        return False
+    try:
+        with open(os.path.join(_PARTITION_DIR, f"{key}.meta.json"), 'r', encoding='utf-8') as f:
+            private = json.load(f)
+        with open(os.path.join(_PUBLISH_DIR, key, str(gen), 'meta.json'), 'r', encoding='utf-8') as f:
+            published = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return private == published
+
+
+def _publish_unpublished() -> int:
+    """writer 启动时只发布落后于私有快照的分区：清单中缺失、WAL 非空，或上一任 writer 快照后未及发布"""
+    done = 0
+    for key in _all_partition_keys():
+        if _published_current(key):
+            continue
+        part = _get_partition(key)
+        if part is None:
+            continue
+        with part.lock:
+            # 等锁期间可能已被写入路径的快照发布，避免重复发布同一内容
+            if part.evicted or _published_current(key):
+                continue
+            try:
+                part.snapshot()
+                done += 1
+            except Exception as e:
+                print(f"Vector publish failed for partition {key}: {e}")
+    return done
+
+
+def _drain_outbox(batch: int = 256) -> int:
+    """writer：按顺序应用 reader 排队的写入/删除；失败的操作记录日志后丢弃，避免阻塞队列"""
+    store = _get_meta_store()
+    applied = 0
+    while True:
+        ops = store.pending_ops(batch)
+        for op_id, op, key, payload in ops:
+            try:
+                if op == 'add':
+                    metas = payload['metas']
+                    vecs = np.frombuffer(base64.b64decode(payload['vecs']), dtype=np.float32).reshape(len(metas), -1)
+                    _add_local(key, vecs, metas)
+                elif op == 'del':
+                    _delete_labels(key, payload['labels'])
+                elif op == 'drop':
+                    _drop_partition(key)
+            except Exception as e:
+                print(f"Vector outbox op {op_id} ({op}) failed: {e}")
+        if ops:
+            store.ack([op_id for op_id, _, _, _ in ops])
+            applied += len(ops)
+        if len(ops) < batch:
+            break
+    if applied:
+        metrics_inc('vector_outbox_applied', applied)
+    return applied
+
+
+def _refresh_manifest(force: bool = False) -> bool:
+    """reader：清单文件变化时重新读取，返回版本是否变化"""
+    try:
+        mtime = os.stat(_MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        return False
+    with _replica_lock:
+        if not force and mtime == _replica_state["mtime"]:
+            return False
+    data = _read_manifest()
+    with _replica_lock:
+        changed = int(data.get('version', 0)) != _replica_state["version"]
+        _replica_state.update(version=int(data.get('version', 0)), partitions=data.get('partitions', {}), mtime=mtime)
+    return changed
+
+
+def _replica_manifest() -> Dict[str, int]:
+    # 清单整体替换、从不原地修改，可直接返回引用
+    with _replica_lock:
+        return _replica_state["partitions"]
+
+
+def _load_published(key: str) -> Optional[_Partition]:
+    """reader：只读加载清单中该分区的最新版本；版本恰好被回收时刷新清单重试"""
+    for _ in range(3):
+        gen = _replica_manifest().get(key)
+        if not gen:
+            return None
+        path = os.path.join(_PUBLISH_DIR, key, str(gen))
+        try:
+            if os.path.exists(os.path.join(path, 'quantized.json')):
+                index = _QuantizedIndex.load_published(path)
+            else:
+                index = _load_index(key, os.path.join(path, 'index'), vec_path=os.path.join(path, 'vec'), convert=False)
+            with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            _refresh_manifest(force=True)
+            continue
+        if isinstance(index, _QuantizedIndex):
+            index.pin_vectors()
+        part = _Partition(key, index, meta.get('next_id', 0))
+        part.tombstones = int(meta.get('tombstones', 0))
+        part.generation = int(gen)
+        return part
+    return None
+
+
+def _swap_published() -> int:
+    """reader：已加载分区热替换为最新版本（查询看到旧版或新版之一）；清单中已移除的分区直接丢弃"""
+    manifest = _replica_manifest()
+    with _registry_lock:
+        parts = list(_partitions.values())
+    swapped = 0
+    for part in parts:
+        gen = manifest.get(part.key)
+        if gen == part.generation:
+            continue
+        if not gen:
+            with _registry_lock:
+                if _partitions.get(part.key) is part:
+                    del _partitions[part.key]
+            part.evicted = True
+            continue
+        fresh = _load_published(part.key)
+        if fresh is None:
+            continue
+        with part.rw.write():
+            part.index = fresh.index
+            part.next_id = fresh.next_id
+            part.tombstones = fresh.tombstones
+            part.generation = fresh.generation
+            part._ef = _EF_SEARCH
+        swapped += 1
+    if swapped:
+        metrics_inc('vector_replica_swaps', swapped)
+    return swapped
+
+
+def _promote_to_writer() -> None:
+    """auto：原 writer 退出后接管；丢弃只读分区，之后从私有快照 + WAL 加载"""
+    global _role
+    with _registry_lock:
+        for part in _partitions.values():
+            part.evicted = True
+        _partitions.clear()
+        _role = 'writer'
+    _load_writer_manifest()
+    metrics_inc('vector_writer_promotions', 1)
+    print(f"Vector index: process {os.getpid()} promoted to writer")
+    _start_snapshotter()
 
 
-def _load_model():
-    global _model, _dim
-    if _model is None:
-        _model = SentenceTransformer(_MODEL_NAME)
-        _dim = _model.get_sentence_embedding_dimension()
+def _replica_loop(stop: Event):
+    while not stop.wait(_PUBLISH_INTERVAL):
+        try:
+            if _ROLE_SETTING == 'auto' and _try_writer_lock():
+                _promote_to_writer()
+                return
+            if _refresh_manifest():
+                _swap_published()
+        except Exception as e:
+            print(f"Vector replica refresh failed: {e}")
 
 
-def _ensure_index():
-    global _index, _next_id, _id_to_meta
-    if _index is not None:
+def _start_replica():
+    global _replica_thread
+    if _replica_thread is not None:
         return
-    _load_model()
+    _refresh_manifest(force=True)
+    _replica_thread = Thread(target=_replica_loop, args=(_stop,), name='vector-replica', daemon=True)
+    _replica_thread.start()
+
+
+def _snapshot_loop(stop: Event):
+    if _role == 'writer':
+        _publish_unpublished()
+    while not stop.is_set():
+        writer = _role == 'writer'
+        _snapshot_wakeup.wait(timeout=_PUBLISH_INTERVAL if writer else max(1.0, min(_SNAPSHOT_INTERVAL, 10.0)))
+        _snapshot_wakeup.clear()
+        if stop.is_set():
+            break
+        if _role != 'reader':
+            try:
+                _drain_outbox()
+            except Exception as e:
+                print(f"Vector outbox drain failed: {e}")
+        _compact_due()
+        _preallocate_due()
+        _snapshot_due()
+
+
+def capacity_status() -> Dict[str, Any]:
+    """本地索引容量余量（仅统计常驻内存的分区），用于 /health"""
+    if _use_pg():
+        return {"backend": "pgvector"}
+    with _registry_lock:
+        parts = list(_partitions.values())
+    elements = sum(p.count() for p in parts)
+    capacity = sum(p.capacity() for p in parts)
+    ratios = [p.fill_ratio() for p in parts]
+    return {
+        "backend": "hnswlib",
+        "role": role(),
+        "partitions_loaded": len(parts),
+        "elements": elements,
+        "capacity": capacity,
+        "headroom": capacity - elements,
+        "max_fill_ratio": round(max(ratios), 4) if ratios else 0.0,
+        "partitions_near_full": sum(1 for r in ratios if r >= _PREALLOC_RATIO),
+    }
+
+
+def _start_snapshotter():
+    global _snapshot_thread
+    if _snapshot_thread is not None:
+        return
+    _snapshot_thread = Thread(target=_snapshot_loop, args=(_stop,), name='vector-snapshot', daemon=True)
+    _snapshot_thread.start()
+    atexit.register(flush)
+
+
+def flush() -> int:
+    """立即为所有有未快照写入的分区生成快照（用于关闭进程前）"""
+    return _snapshot_due(force=True)
+
+
+def close(flush_pending: bool = True) -> None:
+    """停止后台线程，（可选）为未快照的写入生成快照，释放 writer 锁与元数据库连接。
+
+    flush_pending=False 时 WAL 保持原样，下次加载时回放，等同于进程崩溃后重启。
+    """
+    global _stop, _snapshot_thread, _replica_thread, _writer_lock_file, _meta_store, _local_ready
+    _stop.set()
+    _snapshot_wakeup.set()
+    for t in (_snapshot_thread, _replica_thread):
+        if t is not None and t is not current_thread():
+            t.join(timeout=10)
+    _stop = Event()
+    _snapshot_thread = _replica_thread = None
+    if flush_pending:
+        flush()
+    if _writer_lock_file is not None:
+        _writer_lock_file.close()
+        _writer_lock_file = None
+    with _meta_store_lock:
+        if _meta_store is not None:
+            _meta_store.close()
+            _meta_store = None
+    _local_ready = False
+
+
+def _migrate_legacy_index():
+    """将旧版全局索引（memory_hnsw.index + meta.json）拆分为按用户分区"""
+    if not (os.path.exists(_INDEX_PATH) and os.path.exists(_META_PATH)):
+        return
+    if os.path.isdir(_PARTITION_DIR) and any(n.endswith(('.index', '.wal')) for n in os.listdir(_PARTITION_DIR)):
+        return
+    with open(_META_PATH, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    id_to_meta = {int(k): v for k, v in meta.get('id_to_meta', {}).items()}
+    legacy = hnswlib.Index(space='cosine', dim=_dim)
+    legacy.load_index(_INDEX_PATH)
+    by_user: Dict[str, List[int]] = {}
+    for i, m in id_to_meta.items():
+        by_user.setdefault(str(m.get('user_id')), []).append(i)
+    for uid, ids in by_user.items():
+        vecs = np.asarray(legacy.get_items(ids), dtype=np.float32)
+        key = _partition_key(uid)
+        part = _Partition(key, _new_index(key, max(_PARTITION_INIT_CAPACITY, len(ids))))
+        labels = list(range(len(ids)))
+        _get_meta_store().put_many(part.key, labels, [id_to_meta[i] for i in ids])
+        part._apply(vecs, labels)
+        part.snapshot()
+    os.replace(_INDEX_PATH, _INDEX_PATH + '.migrated')
+    os.replace(_META_PATH, _META_PATH + '.migrated')
+
+
+def _ensure_index(dim: Optional[int] = None):
+    if _pg_ready or _local_ready:
+        return
+    with _init_lock:
+        _init_index(dim)
+
+
+def _init_index(dim: Optional[int]):
+    global _pg_ready, _local_ready, _dim, _pg_column
+    if _pg_ready or _local_ready:
+        return
+    if _dim is None:
+        _dim = int(dim) if dim else embed_dimension()
     if _use_pg():
         # Ensure pgvector extension and table
         eng = _get_engine()
@@ -76,126 +1439,707 @@ def _ensure_index():
                     type TEXT,
                     text TEXT,
                     timestamp TEXT,
-                    embedding vector({dim})
+                    embedding {_PG_COLUMN_TYPE}({dim}),
+                    event_id BIGINT
                 );
+                ALTER TABLE memory_vectors ADD COLUMN IF NOT EXISTS event_id BIGINT;
                 CREATE INDEX IF NOT EXISTS idx_memory_vectors_user ON memory_vectors(user_id);
+                CREATE INDEX IF NOT EXISTS idx_memory_vectors_event ON memory_vectors(user_id, event_id);
             """
             conn.execute(text(ddl))
-            # Track next_id via max(id)
-            res = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM memory_vectors"))
-            _next_id = int(res.scalar() or 0)
+            actual = conn.execute(text(
+                "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+                "WHERE attrelid = 'memory_vectors'::regclass AND attname = 'embedding'"
+            )).scalar() or 'vector'
+            _pg_column = 'halfvec' if str(actual).startswith('halfvec') else 'vector'
+            if _pg_column != _PG_COLUMN_TYPE:
+                # 改列类型会重写整张表，不在启动时自动进行
+                print(f"memory_vectors.embedding is {actual}; PGVECTOR_COLUMN_TYPE={_PG_COLUMN_TYPE} applies to new tables. "
+                      f"To convert: drop the ANN indexes on memory_vectors.embedding, run ALTER TABLE memory_vectors "
+                      f"ALTER COLUMN embedding TYPE {_PG_COLUMN_TYPE}({dim}) USING embedding::{_PG_COLUMN_TYPE}({dim}), "
+                      f"then POST /admin/vector-index/rebuild")
         # No local HNSW index when using pgvector
-        _index = None
+        _pg_ready = True
+        ensure_ann_index()
         return
-    # Fallback to local HNSW
-    ef_construction = 200
-    M = 48
+    # Fallback to local HNSW partitions
     if not HAS_HNSWLIB:
         raise RuntimeError("hnswlib not available and Postgres not configured; please enable Postgres or install hnswlib")
-    index = hnswlib.Index(space='cosine', dim=_dim)
-    if os.path.exists(_INDEX_PATH) and os.path.exists(_META_PATH):
-        index.load_index(_INDEX_PATH)
-        with open(_META_PATH, 'r', encoding='utf-8') as f:
-            meta = json.load(f)
-            _next_id = meta.get('next_id', 0)
-            _id_to_meta = {int(k): v for k, v in meta.get('id_to_meta', {}).items()}
+    global _role
+    fresh = not os.path.isdir(_PARTITION_DIR)
+    _role = _resolve_role()
+    if _role == 'writer':
+        _load_writer_manifest()
+    if fresh and _role != 'reader':
+        _migrate_legacy_index()
+    os.makedirs(_PARTITION_DIR, exist_ok=True)
+    store = _get_meta_store()
+    if store.get_setting('dim') != str(_dim):
+        store.set_setting('dim', str(_dim))
+    if _role == 'reader':
+        _start_replica()
     else:
-        index.init_index(max_elements=200000, ef_construction=ef_construction, M=M)
-        index.set_ef(64)
-        _next_id = 0
-        _id_to_meta = {}
-    _index = index
+        _start_snapshotter()
+    _local_ready = True
+    if _role != 'reader':
+        # 应用未初始化索引时排队的删除（见 _open_for_delete）
+        try:
+            _drain_outbox()
+        except Exception as e:
+            print(f"Vector outbox drain failed: {e}")
 
 
-def _persist():
-    if _use_pg():
-        return  # pgvector is persisted in DB
-    _index.save_index(_INDEX_PATH)
-    with open(_META_PATH, 'w', encoding='utf-8') as f:
-        json.dump({'next_id': _next_id, 'id_to_meta': _id_to_meta}, f)
+def warmup() -> None:
+    """启动预热：加载嵌入模型并初始化向量后端（pgvector 建表 / 本地分区目录与快照线程）"""
+    _ensure_index()
 
 
 def add_texts(texts: List[str], metas: List[Dict[str, Any]]):
     """Add texts with metas to vector index (pgvector or local HNSW fallback)."""
-    with _lock:
-        _ensure_index()
-        embs = _model.encode(texts, normalize_embeddings=True)
-        global _next_id, _id_to_meta
-        if _use_pg():
-            eng = _get_engine()
-            with eng.begin() as conn:
-                for emb, meta in zip(embs, metas):
-                    # meta 应包含 user_id, type, text, timestamp
-                    # 将向量转换为 pgvector 文本字面量，避免适配器依赖
-                    emb_str = "[" + ",".join(str(float(x)) for x in emb.tolist()) + "]"
-                    conn.execute(text(
-                        """
-                        INSERT INTO memory_vectors(user_id, type, text, timestamp, embedding)
-                        VALUES (:user_id, :type, :text, :timestamp, :embedding::vector)
-                        """
-                    ), {
-                        "user_id": meta.get("user_id"),
-                        "type": meta.get("type"),
-                        "text": meta.get("text"),
-                        "timestamp": meta.get("timestamp"),
-                        "embedding": emb_str
-                    })
-            # 更新 next_id（可选）
-            with eng.begin() as conn:
-                res = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM memory_vectors"))
-                _next_id = int(res.scalar() or 0)
-            return
-        # HNSW 本地索引路径
-        ids = np.arange(_next_id, _next_id + len(texts))
-        _index.add_items(embs, ids)
-        for i, meta in zip(ids.tolist(), metas):
-            _id_to_meta[int(i)] = meta
-        _next_id += len(texts)
-        _persist()
-
-
-def query(text: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-    with _lock:
-        _ensure_index()
-        emb = _model.encode([text], normalize_embeddings=True)[0]
-        if _use_pg():
-            eng = _get_engine()
-            where = []
-            params: Dict[str, Any] = {"emb": list(map(float, emb.tolist())), "k": int(top_k)}
-            if filters:
-                if filters.get("user_id"):
-                    where.append("user_id = :uid")
-                    params["uid"] = filters["user_id"]
-                # 可按需扩展更多过滤
-            where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-            sql = (
-                "SELECT user_id, type, text, timestamp, 1 - (embedding <=> (:emb::vector)) AS score "
-                "FROM memory_vectors "
-                f"{where_sql} "
-                "ORDER BY embedding <=> (:emb::vector) ASC "
-                "LIMIT :k"
-            )
-            with eng.begin() as conn:
-                rows = conn.execute(text(sql), params).mappings().all()
-            results: List[Dict[str, Any]] = []
-            for r in rows:
-                results.append({
-                    "user_id": r["user_id"],
-                    "type": r.get("type"),
-                    "text": r.get("text"),
-                    "timestamp": r.get("timestamp"),
-                    "score": float(r.get("score") or 0.0),
-                })
-            return results
-        # 本地 HNSW 检索
-        labels, distances = _index.knn_query([emb], k=top_k)
-        results: List[Dict[str, Any]] = []
-        for lab, dist in zip(labels[0], distances[0]):
-            meta = _id_to_meta.get(int(lab))
-            if meta is None:
+    # 编码在锁外进行，便于并发请求合并为同一批次
+    add_embeddings(embed_encode(texts), metas)
+
+
+def add_embeddings(embs: np.ndarray, metas: List[Dict[str, Any]]):
+    """写入已编码的（归一化）向量"""
+    embs = np.asarray(embs, dtype=np.float32)
+    if not len(metas):
+        return
+    _ensure_index(embs.shape[1])
+    if _use_pg():
+        _pg_insert(embs, metas)
+        return
+    # HNSW 本地索引路径：按 user_id 路由到各自分区
+    groups: Dict[str, List[int]] = {}
+    for i, meta in enumerate(metas):
+        groups.setdefault(_partition_key(meta.get("user_id")), []).append(i)
+    for key, idxs in groups.items():
+        if _role == 'reader':
+            # 编码已在本进程完成，只把向量交给 writer 追加
+            _get_meta_store().enqueue('add', key, {
+                'metas': [metas[i] for i in idxs],
+                'vecs': base64.b64encode(np.ascontiguousarray(embs[idxs]).tobytes()).decode('ascii'),
+            })
+            continue
+        _add_local(key, embs[idxs], [metas[i] for i in idxs])
+
+
+def _add_local(key: str, embs: np.ndarray, metas: List[Dict[str, Any]]) -> None:
+    while True:
+        part = _get_partition(key, create=True)
+        with part.lock:
+            # 取到分区后可能已被 LRU 淘汰：重新加载后再写，避免两个实例争用同一 WAL
+            if part.evicted:
                 continue
-            if filters and any(meta.get(k) != v for k, v in filters.items()):
+            part.add(embs, metas)
+        break
+    if part.wal_pending >= _SNAPSHOT_MAX_WAL or part.needs_prealloc():
+        _snapshot_wakeup.set()
+
+
+def _stored_dim() -> Optional[int]:
+    """从已有存储推断向量维度（元数据表设置、分区快照、WAL 记录），不加载嵌入模型"""
+    if os.path.exists(_META_DB_PATH):
+        value = _get_meta_store().get_setting('dim')
+        if value:
+            return int(value)
+    if not os.path.isdir(_PARTITION_DIR):
+        return None
+    for name in sorted(os.listdir(_PARTITION_DIR)):
+        path = os.path.join(_PARTITION_DIR, name)
+        if name.endswith('.meta.json'):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    dim = json.load(f).get('dim')
+            except Exception:
+                continue
+            if dim:
+                return int(dim)
+        elif name.endswith('.wal'):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        if 'vec' in rec:
+                            return len(base64.b64decode(rec['vec'])) // 4
+                    except Exception:
+                        continue
+    return None
+
+
+def _has_local_vectors() -> bool:
+    if os.path.exists(_META_DB_PATH) or os.path.exists(_INDEX_PATH):
+        return True
+    return os.path.isdir(_PARTITION_DIR) and any(n.endswith(('.index', '.wal')) for n in os.listdir(_PARTITION_DIR))
+
+
+def _pg_has_table() -> bool:
+    with _get_engine().connect() as conn:
+        return conn.execute(text("SELECT to_regclass('memory_vectors')")).scalar() is not None
+
+
+def _open_for_delete() -> Optional[str]:
+    """删除/过期路径只打开已存在的存储，从不加载嵌入模型。
+
+    返回 'ready'（索引可用）、'deferred'（有本地数据但推断不出维度：只删元数据，索引墓碑排入 outbox，
+    下次初始化时应用）或 None（没有任何向量数据，无需删除）。
+    """
+    if _pg_ready or _local_ready:
+        return 'ready'
+    if _use_pg():
+        # DELETE 不依赖维度，表不存在即无数据；不在删除路径上建表
+        return 'ready' if _pg_has_table() else None
+    if not _has_local_vectors():
+        return None
+    dim = _dim or _stored_dim()
+    if dim is None or not HAS_HNSWLIB:
+        return 'deferred'
+    _ensure_index(dim)
+    return 'ready'
+
+
+def _defer_delete(key: str, labels: List[int]) -> int:
+    # 元数据立即删除（各进程查询即刻不再返回），索引中的墓碑由 writer（或下次初始化）标记
+    labels = sorted(set(int(lab) for lab in labels))
+    if not labels:
+        return 0
+    store = _get_meta_store()
+    store.delete_many(key, labels)
+    store.enqueue('del', key, {'labels': labels})
+    metrics_inc('vector_deleted', len(labels))
+    return len(labels)
+
+
+def _delete_labels(key: str, labels: List[int]) -> int:
+    if not labels:
+        return 0
+    if _role == 'reader':
+        return _defer_delete(key, labels)
+    while True:
+        part = _get_partition(key)
+        if part is None:
+            return 0
+        with part.lock:
+            if part.evicted:
+                continue
+            done = part.delete(labels)
+        break
+    metrics_inc('vector_deleted', done)
+    if part.needs_compaction():
+        _snapshot_wakeup.set()
+    return done
+
+
+def delete_matching(user_id: str, items: List[Dict[str, Any]]) -> int:
+    """删除与给定记忆对应的向量，返回删除数量。
+
+    items 为被删除的 memory_events 行：按 id 对齐；没有记录 event_id 的旧向量退回按 type/text/timestamp 匹配。
+    """
+    if not user_id or not items:
+        return 0
+    mode = _open_for_delete()
+    if mode is None:
+        return 0
+    if _use_pg():
+        eng = _get_engine()
+        total = 0
+        with eng.begin() as conn:
+            ids = [int(it["id"]) for it in items if it.get("id") is not None]
+            matched: set = set()
+            if ids:
+                rows = conn.execute(text(
+                    "DELETE FROM memory_vectors WHERE user_id=:uid AND event_id = ANY(:ids) RETURNING event_id"
+                ), {"uid": user_id, "ids": ids}).all()
+                matched = {int(r[0]) for r in rows}
+                total += len(rows)
+            for it in items:
+                if it.get("id") is not None and int(it["id"]) in matched:
+                    continue
+                res = conn.execute(text(
+                    "DELETE FROM memory_vectors WHERE user_id=:uid AND type IS NOT DISTINCT FROM :type "
+                    "AND text IS NOT DISTINCT FROM :text AND timestamp IS NOT DISTINCT FROM :ts"
+                    + (" AND event_id IS NULL" if it.get("id") is not None else "")
+                ), {"uid": user_id, "type": it.get("type"), "text": it.get("text"), "ts": it.get("timestamp")})
+                total += res.rowcount or 0
+        metrics_inc('vector_deleted', total)
+        return total
+    key = _partition_key(user_id)
+    labels = _get_meta_store().find(key, items)
+    return _defer_delete(key, labels) if mode == 'deferred' else _delete_labels(key, labels)
+
+
+def delete_user(user_id: str) -> int:
+    """删除用户的全部向量：pgvector 直接 DELETE，本地分区连同文件一并移除"""
+    if not user_id:
+        return 0
+    mode = _open_for_delete()
+    if mode is None:
+        return 0
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            total = conn.execute(text("DELETE FROM memory_vectors WHERE user_id=:uid"), {"uid": user_id}).rowcount or 0
+        metrics_inc('vector_deleted', total)
+        return total
+    total = _drop_partition(_partition_key(user_id), deferred=mode == 'deferred')
+    metrics_inc('vector_deleted', total)
+    return total
+
+
+def _drop_partition(key: str, deferred: bool = False) -> int:
+    if _role == 'reader' or deferred:
+        store = _get_meta_store()
+        total = store.delete_part(key)
+        store.enqueue('drop', key, {})
+        return total
+    # 持有注册表锁，避免删除文件期间被其他线程重新加载
+    with _registry_lock:
+        part = _partitions.pop(key, None)
+        if part is not None:
+            with part.lock:
+                part.evicted = True
+        total = _get_meta_store().delete_part(key)
+        for suffix in ('.index', '.meta.json', '.wal', '.vec'):
+            path = os.path.join(_PARTITION_DIR, key + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+    if _role == 'writer':
+        _unpublish(key)
+    return total
+
+
+def expire(type_: str, cutoff: str) -> int:
+    """删除某类型中时间戳早于 cutoff 的向量（TTL）"""
+    mode = _open_for_delete()
+    if mode is None:
+        return 0
+    if _use_pg():
+        eng = _get_engine()
+        with eng.begin() as conn:
+            total = conn.execute(text(
+                "DELETE FROM memory_vectors WHERE type=:type AND timestamp < :cutoff"
+            ), {"type": type_, "cutoff": cutoff}).rowcount or 0
+        metrics_inc('vector_deleted', total)
+        return total
+    delete = _defer_delete if mode == 'deferred' else _delete_labels
+    return sum(delete(key, labels) for key, labels in _get_meta_store().expired(type_, cutoff).items())
+
+
+def _pg_raw_connection(conn):
+    """取出底层 psycopg 连接，并在首次使用时注册 pgvector 二进制适配器"""
+    if not HAS_PGVECTOR:
+        raise RuntimeError("pgvector package not installed; please pip install pgvector")
+    fairy = conn.connection
+    raw = fairy.driver_connection
+    if not fairy.info.get('pgvector_registered'):
+        register_vector(raw)
+        fairy.info['pgvector_registered'] = True
+    return raw
+
+
+_PG_COPY_SQL = "COPY memory_vectors (user_id, type, text, timestamp, embedding, event_id) FROM STDIN WITH (FORMAT BINARY)"
+_PG_INSERT_SQL = "INSERT INTO memory_vectors(user_id, type, text, timestamp, embedding, event_id) VALUES (%s, %s, %s, %s, %b, %s)"
+
+
+def _pg_rows(embs: np.ndarray, metas: List[Dict[str, Any]]) -> List[tuple]:
+    half = _pg_column == 'halfvec'
+    return [
+        (m.get("user_id"), m.get("type"), m.get("text"), m.get("timestamp"), HalfVector(emb) if half else emb, m.get("id"))
+        for emb, m in zip(embs, metas)
+    ]
+
+
+def _pg_copy_types() -> List[str]:
+    return ['text', 'text', 'text', 'text', _pg_column, 'int8']
+
+
+def _pg_insert(embs: np.ndarray, metas: List[Dict[str, Any]]):
+    """批量写入：向量以二进制传输，大批量走 COPY，小批量走 executemany"""
+    rows = _pg_rows(embs, metas)
+    eng = _get_engine()
+    with eng.begin() as conn:
+        raw = _pg_raw_connection(conn)
+        with raw.cursor() as cur:
+            if len(rows) >= _PG_COPY_MIN_ROWS:
+                with cur.copy(_PG_COPY_SQL) as copy:
+                    copy.set_types(_pg_copy_types())
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                cur.executemany(_PG_INSERT_SQL, rows)
+    metrics_inc('pgvector_rows_written', len(rows))
+
+
+_ANN_METHODS = ('hnsw', 'ivfflat')
+_ann_lock = Lock()
+_ann_state: Dict[str, Any] = {"state": "idle", "error": None, "started_at": None, "finished_at": None}
+
+
+def _pg_half_index() -> bool:
+    """ANN 索引是否建在 halfvec 上：halfvec 列，或 vector 列上的 halfvec 表达式（量化模式）"""
+    return _pg_column == 'halfvec' or _PG_HALFVEC
+
+
+def _ann_index_name(method: str, halfvec: Optional[bool] = None) -> str:
+    if halfvec is None:
+        halfvec = _pg_half_index()
+    return f"idx_memory_vectors_emb_{method}" + ("_half" if halfvec else "")
+
+
+def _ann_options(conn, method: str) -> Dict[str, int]:
+    if method == 'hnsw':
+        return {"m": _PG_HNSW_M, "ef_construction": _PG_HNSW_EF_CONSTRUCTION}
+    lists = _PG_IVFFLAT_LISTS
+    if lists <= 0:
+        # pgvector 建议：百万行以内 lists ≈ rows / 1000
+        rows = int(conn.execute(text("SELECT COUNT(1) FROM memory_vectors")).scalar() or 0)
+        lists = max(10, rows // 1000)
+    return {"lists": lists}
+
+
+def _set_ann_state(**kw):
+    with _ann_lock:
+        _ann_state.update(kw)
+
+
+def _build_ann_index(rebuild: bool = False):
+    """创建/维护 embedding 上的 ANN 索引（CONCURRENTLY，不阻塞读写）"""
+    method = _PG_ANN_METHOD
+    _set_ann_state(state="building", error=None, started_at=time.time(), finished_at=None, method=method)
+    try:
+        eng = _get_engine()
+        with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # 建索引改动会话参数且耗时长：脱离共享连接池，用完即关闭，不把设置带给其他模块
+            conn.detach()
+            conn.execute(text("SET statement_timeout = 0"))
+            for other in _ANN_METHODS:
+                for half in (False, True):
+                    if (other, half) != (method, _pg_half_index()):
+                        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {_ann_index_name(other, half)}"))
+            if method not in _ANN_METHODS:
+                _set_ann_state(state="disabled", finished_at=time.time())
+                return
+            name = _ann_index_name(method)
+            opts = _ann_options(conn, method)
+            desired = sorted(f"{k}={v}" for k, v in opts.items())
+            row = conn.execute(text(
+                "SELECT c.reloptions, i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name"
+            ), {"name": name}).first()
+            if row is not None and row[1] and sorted(row[0] or []) == desired and not rebuild:
+                _set_ann_state(state="ready", finished_at=time.time(), options=opts)
+                return
+            if _PG_BUILD_WORK_MEM and re.fullmatch(r"\d+\s*(kB|MB|GB)", _PG_BUILD_WORK_MEM):
+                conn.execute(text(f"SET maintenance_work_mem = '{_PG_BUILD_WORK_MEM}'"))
+            with_sql = ", ".join(f"{k} = {int(v)}" for k, v in opts.items())
+            target = f"{name}_new" if row is not None else name
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_new"))
+            if _pg_column == 'halfvec':
+                column = "embedding halfvec_cosine_ops"
+            elif _PG_HALFVEC:
+                column = f"(embedding::halfvec({int(_dim)})) halfvec_cosine_ops"
+            else:
+                column = "embedding vector_cosine_ops"
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY {target} ON memory_vectors "
+                f"USING {method} ({column}) WITH ({with_sql})"
+            ))
+            if row is not None:
+                # 新索引就绪后再替换旧索引（参数变化或强制重建）
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                conn.execute(text(f"ALTER INDEX {target} RENAME TO {name}"))
+        _set_ann_state(state="ready", finished_at=time.time(), options=opts)
+    except Exception as e:
+        print(f"pgvector ANN index build failed: {e}")
+        _set_ann_state(state="error", error=str(e), finished_at=time.time())
+
+
+def ensure_ann_index(rebuild: bool = False, background: bool = True) -> Dict[str, Any]:
+    """在后台线程中创建或重建 pgvector ANN 索引；返回当前状态"""
+    if not _use_pg():
+        return {"state": "not_applicable"}
+    with _ann_lock:
+        if _ann_state.get("state") == "building":
+            return dict(_ann_state)
+        _ann_state["state"] = "building"
+    if background:
+        Thread(target=_build_ann_index, args=(rebuild,), name='pgvector-ann-build', daemon=True).start()
+    else:
+        _build_ann_index(rebuild)
+    with _ann_lock:
+        return dict(_ann_state)
+
+
+def index_status() -> Dict[str, Any]:
+    """向量索引状态：pgvector 索引构建进度与大小，或本地分区概况"""
+    if not _use_pg():
+        with _registry_lock:
+            loaded = list(_partitions.values())
+        status = {
+            "backend": "hnswlib",
+            "role": role(),
+            "partitions_on_disk": len(_all_partition_keys()),
+            "partitions_loaded": len(loaded),
+            "loaded_elements": sum(p.count() for p in loaded),
+        }
+        if _role == 'writer':
+            with _publish_lock:
+                status["published"] = {"version": _manifest_version, "partitions": len(_manifest)}
+        elif _role == 'reader':
+            with _replica_lock:
+                status["published"] = {"version": _replica_state["version"], "partitions": len(_replica_state["partitions"])}
+        if _role in ('writer', 'reader'):
+            status["outbox_pending"] = _get_meta_store().outbox_size()
+        return status
+    with _ann_lock:
+        status: Dict[str, Any] = {"backend": "pgvector", "method": _PG_ANN_METHOD, "build": dict(_ann_state)}
+    eng = _get_engine()
+    with eng.connect() as conn:
+        status["table_rows_estimate"] = int(conn.execute(text(
+            "SELECT reltuples::bigint FROM pg_class WHERE relname = 'memory_vectors'"
+        )).scalar() or 0)
+        rows = conn.execute(text(
+            "SELECT c.relname, i.indisvalid, c.reloptions, pg_relation_size(c.oid) AS size_bytes "
+            "FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = 'memory_vectors'::regclass"
+        )).mappings().all()
+        status["indexes"] = [
+            {"name": r["relname"], "valid": bool(r["indisvalid"]), "options": list(r["reloptions"] or []), "size_bytes": int(r["size_bytes"] or 0)}
+            for r in rows
+        ]
+        progress = conn.execute(text(
+            "SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total "
+            "FROM pg_stat_progress_create_index WHERE relid = 'memory_vectors'::regclass"
+        )).mappings().first()
+        status["progress"] = dict(progress) if progress else None
+    return status
+
+
+def _pg_search_settings_sql(ef_search: Optional[int], probes: Optional[int]) -> List[str]:
+    ef = int(ef_search or _PG_HNSW_EF_SEARCH or 0)
+    pr = int(probes or _PG_IVFFLAT_PROBES or 0)
+    stmts: List[str] = []
+    if _PG_ANN_METHOD == 'hnsw' and ef > 0:
+        stmts.append(f"SET LOCAL hnsw.ef_search = {ef}")
+    if _PG_ANN_METHOD == 'ivfflat' and pr > 0:
+        stmts.append(f"SET LOCAL ivfflat.probes = {pr}")
+    if _PG_ITERATIVE_SCAN in ('relaxed_order', 'strict_order') and _PG_ANN_METHOD in _ANN_METHODS:
+        stmts.append(f"SET LOCAL {_PG_ANN_METHOD}.iterative_scan = {_PG_ITERATIVE_SCAN}")
+    return stmts
+
+
+def _pg_search_settings(conn, ef_search: Optional[int], probes: Optional[int]):
+    """事务内设置查询参数（SET LOCAL 仅影响本次查询）"""
+    for stmt in _pg_search_settings_sql(ef_search, probes):
+        conn.execute(text(stmt))
+
+
+def _epoch(ts: Any) -> float:
+    try:
+        return datetime.fromisoformat(str(ts)).timestamp() if ts else math.nan
+    except ValueError:
+        return math.nan
+
+
+def rerank(items: List[Dict[str, Any]], top_k: int, half_life_days: Optional[float] = None,
+           type_weights: Optional[Dict[str, float]] = None, recency_weight: Optional[float] = None,
+           now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """按相似度、时间衰减与类型权重重排候选（一次向量化计算）。
+
+    blended = type_weight × ((1 - w) × similarity + w × 0.5 ** (age_days / half_life_days))，
+    无法解析时间戳的记忆衰减项记为 0。结果的 score 为 blended，原始余弦相似度保留在 similarity。
+    """
+    if not items:
+        return []
+    n = len(items)
+    sims = np.fromiter((float(it.get('score', 0.0)) for it in items), dtype=np.float64, count=n)
+    blended = sims.copy()
+    if half_life_days and half_life_days > 0:
+        w = _RECENCY_WEIGHT if recency_weight is None else min(1.0, max(0.0, float(recency_weight)))
+        ts = np.fromiter((_epoch(it.get('timestamp')) for it in items), dtype=np.float64, count=n)
+        age_days = np.maximum((time.time() if now is None else now) - ts, 0.0) / 86400.0
+        decay = np.exp2(-age_days / float(half_life_days))
+        decay[np.isnan(ts)] = 0.0
+        blended = (1.0 - w) * sims + w * decay
+    if type_weights:
+        blended = blended * np.fromiter((float(type_weights.get(it.get('type'), 1.0)) for it in items), dtype=np.float64, count=n)
+    order = np.argsort(-blended, kind='stable')[:int(top_k)]
+    return [{**items[i], 'similarity': float(sims[i]), 'score': float(blended[i])} for i in order]
+
+
+def query(text: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+          ef_search: Optional[int] = None, probes: Optional[int] = None,
+          half_life_days: Optional[float] = None, type_weights: Optional[Dict[str, float]] = None,
+          recency_weight: Optional[float] = None) -> List[Dict[str, Any]]:
+    return query_embedding(embed_encode([text])[0], top_k=top_k, filters=filters, ef_search=ef_search, probes=probes,
+                           half_life_days=half_life_days, type_weights=type_weights, recency_weight=recency_weight)
+
+
+def query_embedding(emb: np.ndarray, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                    ef_search: Optional[int] = None, probes: Optional[int] = None,
+                    half_life_days: Optional[float] = None, type_weights: Optional[Dict[str, float]] = None,
+                    recency_weight: Optional[float] = None) -> List[Dict[str, Any]]:
+    """用已编码的查询向量检索；ef_search/probes 仅作用于 pgvector ANN 索引。
+
+    给出 half_life_days 或 type_weights 时多取 top_k × VECTOR_RERANK_CANDIDATE_FACTOR 个候选，再经 rerank 重排。
+    """
+    emb = np.asarray(emb, dtype=np.float32)
+    _ensure_index(emb.shape[0])
+    fetch_k = _fetch_size(top_k, half_life_days, type_weights)
+    results = _search(emb, fetch_k, filters, ef_search, probes)
+    if fetch_k != int(top_k):
+        return rerank(results, top_k, half_life_days, type_weights, recency_weight)
+    return results
+
+
+def _fetch_size(top_k: int, half_life_days: Optional[float], type_weights: Optional[Dict[str, float]]) -> int:
+    """需要时间衰减/类型权重重排时多取候选"""
+    reranked = bool((half_life_days and half_life_days > 0) or type_weights)
+    return int(top_k) * _RERANK_FACTOR if reranked else int(top_k)
+
+
+def query_batch(specs: List[Dict[str, Any]]) -> List[Any]:
+    """批量检索：全部查询文本一次编码，同一分区的查询合并为一次 knn_query。
+
+    specs 每项含 text、top_k，可选 filters / ef_search / probes / half_life_days / type_weights / recency_weight；
+    返回与输入同序的列表，单项失败时该位置为异常对象，不影响其他项。
+    """
+    if not specs:
+        return []
+    embs = np.asarray(embed_encode([s["text"] for s in specs]), dtype=np.float32)
+    return query_embedding_batch(embs, specs)
+
+
+def query_embedding_batch(embs: np.ndarray, specs: List[Dict[str, Any]]) -> List[Any]:
+    embs = np.asarray(embs, dtype=np.float32)
+    out: List[Any] = [None] * len(specs)
+    if not specs:
+        return out
+    _ensure_index(embs.shape[1])
+    fetch = [_fetch_size(spec.get("top_k", 5), spec.get("half_life_days"), spec.get("type_weights")) for spec in specs]
+    if _use_pg():
+        # 同一连接上逐条执行（每条独立事务，单条失败不影响其他查询）
+        with _get_engine().connect() as conn:
+            for i, spec in enumerate(specs):
+                try:
+                    with conn.begin():
+                        out[i] = _pg_search(conn, embs[i], fetch[i], spec.get("filters"), spec.get("ef_search"), spec.get("probes"))
+                except Exception as e:
+                    out[i] = e
+    else:
+        groups: Dict[str, List[int]] = {}
+        for i, spec in enumerate(specs):
+            uid = (spec.get("filters") or {}).get("user_id")
+            if uid:
+                groups.setdefault(_partition_key(uid), []).append(i)
+            else:
+                # 未限定用户的查询需要遍历全部分区，按单条路径执行
+                try:
+                    out[i] = _search(embs[i], fetch[i], spec.get("filters"), None, None)
+                except Exception as e:
+                    out[i] = e
+        for key, idxs in groups.items():
+            try:
+                part = _get_partition(key)
+                found = part.search_many(embs[idxs], [fetch[i] for i in idxs]) if part is not None else [[] for _ in idxs]
+                for i, items in zip(idxs, found):
+                    filters = specs[i].get("filters") or {}
+                    out[i] = [it for it in items if all(it.get(k) == v for k, v in filters.items())]
+            except Exception as e:
+                for i in idxs:
+                    out[i] = e
+    for i, spec in enumerate(specs):
+        if isinstance(out[i], Exception):
+            continue
+        if fetch[i] != int(spec.get("top_k", 5)):
+            out[i] = rerank(out[i], int(spec.get("top_k", 5)), spec.get("half_life_days"), spec.get("type_weights"),
+                            spec.get("recency_weight"))
+    metrics_inc('vector_batch_queries', len(specs))
+    return out
+
+
+def _search(emb: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]],
+            ef_search: Optional[int], probes: Optional[int]) -> List[Dict[str, Any]]:
+    if _use_pg():
+        with _get_engine().begin() as conn:
+            return _pg_search(conn, emb, top_k, filters, ef_search, probes)
+    # 本地 HNSW 检索：有 user_id 时只查该用户分区，否则遍历所有分区后合并
+    if filters and filters.get("user_id"):
+        keys = [_partition_key(filters["user_id"])]
+    else:
+        keys = _all_partition_keys()
+    results: List[Dict[str, Any]] = []
+    for key in keys:
+        part = _get_partition(key)
+        if part is None:
+            continue
+        for item in part.search(emb, top_k):
+            if filters and any(item.get(k) != v for k, v in filters.items()):
                 continue
-            results.append({**meta, 'score': float(1 - dist)})
-        return results
+            results.append(item)
+    results.sort(key=lambda it: it['score'], reverse=True)
+    return results[:top_k]
+
+
+def _pg_search_sql(emb: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]]):
+    """pgvector 检索语句与参数（:name 占位）"""
+    where = []
+    params: Dict[str, Any] = {"emb": emb, "k": int(top_k)}
+    if filters:
+        if filters.get("user_id"):
+            where.append("user_id = :uid")
+            params["uid"] = filters["user_id"]
+        # 可按需扩展更多过滤
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    if _pg_column == 'halfvec':
+        # halfvec 列：直接按 halfvec 距离排序，没有 float32 列可供重排
+        sql = (
+            f"SELECT user_id, type, text, timestamp, event_id, 1 - (embedding <=> (:emb)::halfvec({int(_dim)})) AS score "
+            "FROM memory_vectors "
+            f"{where_sql} "
+            f"ORDER BY embedding <=> (:emb)::halfvec({int(_dim)}) ASC "
+            "LIMIT :k"
+        )
+    elif _PG_HALFVEC:
+        # halfvec 索引取候选，再按原始 vector 精确重排
+        params["cand"] = int(top_k) * _RESCORE_FACTOR
+        sql = (
+            "SELECT user_id, type, text, timestamp, event_id, 1 - (embedding <=> :emb) AS score FROM ("
+            "SELECT user_id, type, text, timestamp, event_id, embedding FROM memory_vectors "
+            f"{where_sql} "
+            f"ORDER BY embedding::halfvec({int(_dim)}) <=> (:emb)::halfvec({int(_dim)}) ASC LIMIT :cand"
+            ") AS cand "
+            "ORDER BY embedding <=> :emb ASC "
+            "LIMIT :k"
+        )
+    else:
+        sql = (
+            "SELECT user_id, type, text, timestamp, event_id, 1 - (embedding <=> :emb) AS score "
+            "FROM memory_vectors "
+            f"{where_sql} "
+            "ORDER BY embedding <=> :emb ASC "
+            "LIMIT :k"
+        )
+    return sql, params
+
+
+def _pg_hit(r) -> Dict[str, Any]:
+    return {
+        "user_id": r["user_id"],
+        "type": r.get("type"),
+        "text": r.get("text"),
+        "timestamp": r.get("timestamp"),
+        "id": r.get("event_id"),
+        "score": float(r.get("score") or 0.0),
+    }
+
 
+def _pg_search(conn, emb: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]],
+               ef_search: Optional[int], probes: Optional[int]) -> List[Dict[str, Any]]:
+    """在调用方的事务内执行一次 pgvector 检索"""
+    sql, params = _pg_search_sql(emb, top_k, filters)
+    # numpy 向量经 pgvector 适配器以 vector 类型绑定
+    _pg_raw_connection(conn)
+    _pg_search_settings(conn, ef_search, probes)
+    rows = conn.execute(text(sql), params).mappings().all()
+    return [_pg_hit(r) for r in rows]
@@ -0,0 +1,80 @@
+"""记忆库并发负载基准：多线程混合读写，对比"按后端加锁"（当前实现）与"全局串行"（旧 _DB_LOCK 行为）的吞吐。
+
+使用当前环境配置的后端（设置 POSTGRES_* 时为 Postgres，否则为 DATA_DIR 下的 SQLite）。
+
+    python benchmarks/bench_db_concurrency.py --threads 16 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+_TEXTS = ["今天心情不错，想出去散步", "最近工作压力很大", "周末去爬山", "我打算每天读书半小时", "一个人在家有点孤单"]
+
+
+def _op(db, rng, write_ratio, users):
+    uid = f"bench_conc_{rng.randrange(users)}"
+    if rng.random() < write_ratio:
+        db.upsert_events([{"user_id": uid, "type": "chat", "text": rng.choice(_TEXTS), "metadata": {},
+                           "timestamp": time.strftime('%Y-%m-%dT%H:%M')}])
+    elif rng.random() < 0.5:
+        db.fetch_user_events(uid, since_days=60, limit=100)
+    else:
+        db.lexical_search(uid, rng.choice(_TEXTS), 10)
+
+
+def _run(db, threads, seconds, write_ratio, users, serialize):
+    lock = threading.Lock()
+    counts = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def worker(i):
+        rng = random.Random(i)
+        while time.perf_counter() < stop:
+            if serialize:
+                with lock:
+                    _op(db, rng, write_ratio, users)
+            else:
+                _op(db, rng, write_ratio, users)
+            counts[i] += 1
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return sum(counts) / seconds
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--threads', type=int, default=16)
+    ap.add_argument('--seconds', type=float, default=5.0)
+    ap.add_argument('--write-ratio', type=float, default=0.2)
+    ap.add_argument('--users', type=int, default=50)
+    args = ap.parse_args()
+
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='bench_db_'))
+    from app import db
+    db.init_db()
+    backend = 'postgres' if db._use_pg() else 'sqlite'
+    # 预热：每个用户若干条记忆
+    for u in range(args.users):
+        db.upsert_events([{"user_id": f"bench_conc_{u}", "type": "chat", "text": t, "metadata": {},
+                           "timestamp": "2024-01-01T00:00"} for t in _TEXTS])
+    serial = _run(db, args.threads, args.seconds, args.write_ratio, args.users, serialize=True)
+    concurrent = _run(db, args.threads, args.seconds, args.write_ratio, args.users, serialize=False)
+    print(f"backend={backend} threads={args.threads} write_ratio={args.write_ratio}")
+    print(f"  global lock : {serial:9.1f} ops/s")
+    print(f"  per-backend : {concurrent:9.1f} ops/s  ({concurrent / max(serial, 1e-9):.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""嵌入后端基准：torch / onnx / onnx-int8 的单条与批量编码延迟、常驻内存，以及与 torch 输出的余弦相似度。
+
+需要安装 onnxruntime 与 onnx；首次运行会在 EMBED_ONNX_DIR 下导出模型。
+
+    python benchmarks/bench_embedding_backends.py --model moka-ai/m3e-small --rounds 200
+"""
+import argparse
+import importlib
+import os
+import resource
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+_TEXTS = [
+    "今天心情不错，想出去散步",
+    "最近工作压力很大，晚上睡不好",
+    "和朋友吵架了，有点难过",
+    "我打算每天读书半小时",
+    "周末去爬山，风景很美",
+    "考试没考好，很沮丧",
+    "新项目上线了，挺有成就感",
+    "一个人在家有点孤单",
+]
+
+
+def _load(backend, model):
+    os.environ['EMBED_BACKEND'] = backend
+    from app import embedding
+    importlib.reload(embedding)
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    enc = embedding.load_encoder(model)
+    load_s = time.perf_counter() - t0
+    return enc, load_s, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--model', default=os.getenv('EMBED_MODEL', 'moka-ai/m3e-small'))
+    ap.add_argument('--rounds', type=int, default=100)
+    ap.add_argument('--backends', default='torch,onnx,onnx-int8')
+    args = ap.parse_args()
+
+    import numpy as np
+    ref = None
+    for backend in args.backends.split(','):
+        enc, load_s, rss_kb = _load(backend.strip(), args.model)
+        embs = np.asarray(enc.encode(_TEXTS, normalize_embeddings=True), dtype=np.float32)
+        if ref is None:
+            ref = embs
+        cos = np.sum(ref * embs, axis=1)
+        single = []
+        for i in range(args.rounds):
+            t = time.perf_counter()
+            enc.encode([_TEXTS[i % len(_TEXTS)]], normalize_embeddings=True)
+            single.append((time.perf_counter() - t) * 1000.0)
+        t = time.perf_counter()
+        for _ in range(max(1, args.rounds // 10)):
+            enc.encode(_TEXTS * 4, normalize_embeddings=True)
+        batch_ms = (time.perf_counter() - t) * 1000.0 / max(1, args.rounds // 10)
+        single = np.asarray(single)
+        print(f"{backend:>10}  impl={type(enc).__name__}  load={load_s:.1f}s  rss+={rss_kb / 1024:.0f}MB  "
+              f"p50={np.percentile(single, 50):.2f}ms  p95={np.percentile(single, 95):.2f}ms  "
+              f"batch32={batch_ms:.1f}ms  min_cos={cos.min():.5f}")
+
+
+if __name__ == '__main__':
+    main()
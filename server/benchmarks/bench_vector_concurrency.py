@@ -0,0 +1,114 @@
+"""本地向量索引并发基准：批量写入进行时的查询吞吐。
+
+使用随机单位向量直接调用 add_embeddings / query_embedding，不加载嵌入模型。
+
+    python benchmarks/bench_vector_concurrency.py --users 50 --per-user 2000 --readers 8
+    python benchmarks/bench_vector_concurrency.py --serialize   # 模拟旧版单一全局锁
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+
+def _unit(rng, n, dim):
+    import numpy as np
+    v = rng.standard_normal((n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--users', type=int, default=20)
+    ap.add_argument('--per-user', type=int, default=1000)
+    ap.add_argument('--dim', type=int, default=512)
+    ap.add_argument('--readers', type=int, default=8)
+    ap.add_argument('--duration', type=float, default=5.0)
+    ap.add_argument('--ingest-batch', type=int, default=64)
+    ap.add_argument('--top-k', type=int, default=5)
+    ap.add_argument('--serialize', action='store_true', help='所有调用经同一把锁，模拟旧版全局 _lock')
+    args = ap.parse_args()
+
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='bench_vs_')
+    import numpy as np
+    from app import vector_store as vs
+
+    rng = np.random.default_rng(0)
+    users = [f"bench_user_{i}" for i in range(args.users)]
+    big = threading.Lock() if args.serialize else None
+
+    def call(fn, *a, **kw):
+        if big is None:
+            return fn(*a, **kw)
+        with big:
+            return fn(*a, **kw)
+
+    t0 = time.perf_counter()
+    for u in users:
+        vecs = _unit(rng, args.per_user, args.dim)
+        vs.add_embeddings(vecs, [{"user_id": u, "type": "chat", "text": f"{u}-{i}", "timestamp": ""} for i in range(args.per_user)])
+    print(f"seeded {args.users * args.per_user} vectors in {time.perf_counter() - t0:.2f}s")
+
+    def run_readers(stop):
+        counts = [0] * args.readers
+
+        def reader(slot):
+            r = np.random.default_rng(slot + 1)
+            qs = _unit(r, 256, args.dim)
+            i = 0
+            while not stop.is_set():
+                call(vs.query_embedding, qs[i % len(qs)], args.top_k, {"user_id": users[i % len(users)]})
+                counts[slot] += 1
+                i += 1
+
+        threads = [threading.Thread(target=reader, args=(k,)) for k in range(args.readers)]
+        for t in threads:
+            t.start()
+        return threads, counts
+
+    # 阶段一：仅查询
+    stop = threading.Event()
+    threads, counts = run_readers(stop)
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    idle_qps = sum(counts) / args.duration
+
+    # 阶段二：查询 + 持续批量写入
+    stop = threading.Event()
+    ingested = [0]
+
+    def writer():
+        r = np.random.default_rng(99)
+        j = 0
+        while not stop.is_set():
+            u = users[j % len(users)]
+            vecs = _unit(r, args.ingest_batch, args.dim)
+            call(vs.add_embeddings, vecs, [{"user_id": u, "type": "chat", "text": f"ingest-{j}-{i}", "timestamp": ""} for i in range(args.ingest_batch)])
+            ingested[0] += args.ingest_batch
+            j += 1
+
+    threads, counts = run_readers(stop)
+    w = threading.Thread(target=writer)
+    w.start()
+    time.sleep(args.duration)
+    stop.set()
+    w.join()
+    for t in threads:
+        t.join()
+    busy_qps = sum(counts) / args.duration
+
+    mode = 'global-lock' if args.serialize else 'rw-partitions'
+    print(f"[{mode}] readers={args.readers} query_qps_idle={idle_qps:.0f} "
+          f"query_qps_during_ingest={busy_qps:.0f} ingest_vectors_per_s={ingested[0] / args.duration:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""量化存储基准：float32 HNSW 与 float16 / int8 量化分区的召回率、查询延迟和内存占用。
+
+真值为 float32 暴力检索；使用带簇结构的随机单位向量，不加载嵌入模型。
+
+    python benchmarks/bench_vector_quantization.py --n 20000 --dim 512 --queries 500
+    python benchmarks/bench_vector_quantization.py --rescore 1   # 关闭重排余量，观察召回下降
+    python benchmarks/bench_vector_quantization.py --rescore-dtype float32,float16,none   # 重排文件精度与磁盘占用
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+
+def _clustered(rng, n, dim, clusters=64):
+    import numpy as np
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    v = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _run(name, index, data, queries, truth, k, ram_bytes, disk_bytes=None):
+    import numpy as np
+    t0 = time.perf_counter()
+    for start in range(0, len(data), 4096):
+        index.add_items(data[start:start + 4096], np.arange(start, min(len(data), start + 4096)))
+    build_s = time.perf_counter() - t0
+    lat = []
+    hits = 0
+    for q, gt in zip(queries, truth):
+        t = time.perf_counter()
+        labels, _ = index.knn_query([q], k=k)
+        lat.append((time.perf_counter() - t) * 1000.0)
+        hits += len(set(int(x) for x in labels[0]) & set(int(x) for x in gt))
+    lat = np.asarray(lat)
+    print(f"{name:>10}  recall@{k}={hits / (len(queries) * k):.4f}  "
+          f"p50={np.percentile(lat, 50):.3f}ms  p95={np.percentile(lat, 95):.3f}ms  "
+          f"build={build_s:.2f}s  ram_per_vec={ram_bytes / len(data):.0f}B"
+          + (f"  disk_per_vec={disk_bytes() / len(data):.0f}B" if disk_bytes else ""))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--n', type=int, default=20000)
+    ap.add_argument('--dim', type=int, default=512)
+    ap.add_argument('--queries', type=int, default=300)
+    ap.add_argument('--top-k', type=int, default=10)
+    ap.add_argument('--rescore', type=int, default=4, help='候选数 = top_k * rescore')
+    ap.add_argument('--rescore-dtype', default='float32,float16,none', help='重排向量文件精度，逗号分隔')
+    args = ap.parse_args()
+
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='bench_vq_')
+    import numpy as np
+    import hnswlib
+    from app import vector_store as vs
+    vs._RESCORE_FACTOR = max(1, args.rescore)
+
+    rng = np.random.default_rng(0)
+    data = _clustered(rng, args.n, args.dim)
+    queries = _clustered(np.random.default_rng(1), args.queries, args.dim)
+    truth = np.argsort(-(queries @ data.T), axis=1)[:, :args.top_k]
+
+    hnsw = hnswlib.Index(space='cosine', dim=args.dim)
+    hnsw.init_index(max_elements=args.n, ef_construction=vs._EF_CONSTRUCTION, M=vs._M)
+    hnsw.set_ef(max(vs._EF_SEARCH, args.top_k))
+    # hnswlib 每个元素：float32 向量 + 第 0 层 2*M 条边 + 标签；磁盘快照与内存同构
+    ram = args.n * (args.dim * 4 + vs._M * 2 * 4 + 8)
+    _run('float32', hnsw, data, queries, truth, args.top_k, ram, lambda: ram)
+
+    for mode in ('float16', 'int8'):
+        for dtype in [d.strip() for d in args.rescore_dtype.split(',') if d.strip()]:
+            vec_path = os.path.join(os.environ['DATA_DIR'], f'{mode}-{dtype}.vec')
+            index = vs._QuantizedIndex(args.dim, mode, vec_path, args.n, vec_dtype=None if dtype == 'none' else dtype)
+            ram = index.codes.nbytes + index.scales.nbytes + index.labels.nbytes
+            # 磁盘 = 编码快照 + 重排文件
+            disk = lambda: ram + (os.path.getsize(vec_path) if os.path.exists(vec_path) else 0)
+            _run(f'{mode}/{dtype}', index, data, queries, truth, args.top_k, ram, disk)
+
+
+if __name__ == '__main__':
+    main()
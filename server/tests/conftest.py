@@ -0,0 +1,34 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+
+@pytest.fixture
+def load_vector_store(tmp_path):
+    """在独立数据目录下重新加载 app.vector_store（路径与 VECTOR_* 配置在导入时读取环境变量）。
+
+    返回 load(crash=False, data_dir=None, **env)：关闭当前实例后按新环境重新加载并返回模块，
+    可在同一测试中多次调用模拟进程重启；crash=True 时不为未快照的写入生成快照，下次加载回放 WAL。
+    测试结束后恢复原环境并再次重新加载，其他测试不受影响。
+    """
+    from app import vector_store
+    env = pytest.MonkeyPatch()
+
+    def load(crash: bool = False, data_dir=None, **overrides):
+        vector_store.close(flush_pending=not crash)
+        env.setenv('DATA_DIR', str(data_dir or tmp_path))
+        env.setenv('VECTOR_ROLE', 'standalone')
+        for key, value in overrides.items():
+            env.setenv(key, str(value))
+        return importlib.reload(vector_store)
+
+    yield load
+    vector_store.close(flush_pending=False)
+    env.undo()
+    importlib.reload(vector_store)
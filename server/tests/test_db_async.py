@@ -0,0 +1,262 @@
+import os
+import sys
+import asyncio
+
+import numpy as np
+import pytest
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+from app import db, db_async as adb  # type: ignore
+
+
+def test_async_storage_roundtrip():
+    async def scenario():
+        user_id = "async_store_user"
+        written = await adb.upsert_events([
+            {"user_id": user_id, "type": "chat", "text": f"异步写入 {i}", "metadata": {}, "timestamp": "2024-01-01T00:00"}
+            for i in range(3)
+        ])
+        events = await adb.fetch_user_events(user_id, limit=10)
+        ok = await adb.insert_feedback({"user_id": user_id, "feedback_type": "like", "timestamp": "2024-01-01T00:00"})
+        stats = await adb.fetch_feedback_stats(user_id)
+        return written, events, ok, stats
+
+    written, events, ok, stats = asyncio.run(scenario())
+    assert written == 3 and len(events) >= 3
+    assert ok == 1 and stats["counts"].get("like", 0) >= 1
+
+
+def test_sqlite_writes_do_not_occupy_read_pool():
+    if db._use_pg():
+        return
+    db.init_db()
+
+    async def scenario():
+        # 持有写连接期间排队的写入只占 db_write 线程，读取照常完成
+        pool = db._sqlite()
+        with pool.writer():
+            writes = [asyncio.ensure_future(adb.upsert_events([
+                {"user_id": "async_wq", "type": "chat", "text": f"排队 {i}", "metadata": {}, "timestamp": "2024-01-01T00:00"}
+            ])) for i in range(20)]
+            await asyncio.sleep(0.05)
+            reads = await asyncio.wait_for(asyncio.gather(*[adb.query_events("async_wq", None, 5) for _ in range(10)]), 2.0)
+            assert all(isinstance(r, list) for r in reads)
+        return sum(await asyncio.gather(*writes))
+
+    assert asyncio.run(scenario()) == 20
+
+
+# Postgres 原生异步路径：伪造 psycopg AsyncConnectionPool / AsyncConnection / 游标，检查 SQL 与绑定参数，
+# 并确认数据库往返不经过线程池（只有编码留在 inference）
+class _AsyncCopy:
+    def __init__(self, log, sql):
+        self.log, self.sql, self.types, self.rows = log, sql, None, []
+        log.append(("COPY", self))
+
+    def set_types(self, types):
+        self.types = types
+
+    async def write_row(self, row):
+        self.rows.append(row)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _AsyncCursor:
+    def __init__(self, conn, row_factory=None):
+        self.conn, self.row_factory, self.rowcount, self._rows = conn, row_factory, 0, []
+
+    async def execute(self, sql, params=None):
+        self.conn.log.append((sql, params))
+        self._rows = self.conn.respond(sql, params)
+        self.rowcount = len(params["c0"]) if params and "c0" in params else len(self._rows)
+
+    async def executemany(self, sql, rows):
+        self.conn.log.append((sql, list(rows)))
+
+    async def fetchall(self):
+        return self._rows
+
+    def copy(self, sql):
+        return _AsyncCopy(self.conn.log, sql)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _AsyncTransaction:
+    def __init__(self, log):
+        self.log = log
+
+    async def __aenter__(self):
+        self.log.append(("BEGIN", None))
+
+    async def __aexit__(self, exc_type, *exc):
+        self.log.append(("ROLLBACK" if exc_type else "COMMIT", None))
+        return False
+
+
+class _AsyncConn:
+    def __init__(self):
+        self.log, self.next_id = [], 100
+
+    def respond(self, sql, params):
+        if "RETURNING id" in sql:
+            ids = list(range(self.next_id, self.next_id + len(params["c0"])))
+            self.next_id += len(ids)
+            return [(i,) for i in reversed(ids)]  # RETURNING 的行序不作保证
+        if sql.startswith("SELECT id, user_id"):
+            return [{"id": 7, "user_id": params["uid"], "type": "chat", "text": "t", "metadata": '{"a": 1}', "timestamp": "2024-01-01T00:00"}]
+        if sql.startswith("SELECT feedback_type"):
+            return [{"feedback_type": "like", "cnt": 2}]
+        if "FROM memory_vectors" in sql:
+            if params.get("uid") == "broken":
+                raise RuntimeError("query failed")
+            return [{"user_id": params.get("uid"), "type": "chat", "text": "t", "timestamp": "2024-01-01T00:00", "event_id": 7, "score": 0.8}]
+        return []
+
+    def cursor(self, row_factory=None):
+        return _AsyncCursor(self, row_factory)
+
+    def transaction(self):
+        return _AsyncTransaction(self.log)
+
+
+class _AsyncPool:
+    def __init__(self):
+        self.conn = _AsyncConn()
+
+    def connection(self):
+        pool = self
+
+        class _Ctx:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Ctx()
+
+
+@pytest.fixture
+def native_pg(monkeypatch):
+    from app import storage, vector_store  # type: ignore
+    import pgvector.psycopg
+    pool = _AsyncPool()
+
+    async def get_pool():
+        return pool
+
+    async def register(conn):
+        conn.log.append(("REGISTER", None))
+
+    class _InferenceOnly:
+        def __init__(self, name):
+            assert name == 'inference', f"database call went through the {name} thread pool"
+
+        async def run(self, fn, *args, **kwargs):
+            return fn(*args, **kwargs)
+
+    monkeypatch.setattr(db, '_use_pg', lambda: True)
+    monkeypatch.setattr(storage, 'HAS_ASYNC_PG', True)
+    monkeypatch.setattr(storage, 'get_async_pool', get_pool)
+    monkeypatch.setattr(pgvector.psycopg, 'register_vector_async', register)
+    monkeypatch.setattr(db, '_schema_ready', True)
+    monkeypatch.setattr(adb.db_feedback, '_table_ready', True)
+    monkeypatch.setattr(vector_store, '_pg_ready', True)
+    monkeypatch.setattr(vector_store, '_PG_COPY_MIN_ROWS', 3)
+    monkeypatch.setattr(vector_store, '_PG_ANN_METHOD', 'hnsw')
+    monkeypatch.setattr(vector_store, '_PG_ITERATIVE_SCAN', '')
+    monkeypatch.setattr(vector_store, '_PG_HALFVEC', False)
+    monkeypatch.setattr(vector_store, '_pg_column', 'vector')
+    monkeypatch.setattr(vector_store, 'embed_encode', lambda texts: np.eye(4, dtype=np.float32)[:len(texts)])
+    monkeypatch.setattr(adb, 'get_executor', _InferenceOnly)
+    return pool.conn
+
+
+def test_psycopg_placeholders_keep_casts():
+    assert adb._psycopg("SELECT 1 WHERE a=:uid AND b ILIKE :q AND e <=> (:emb)::halfvec(4)") == \
+        "SELECT 1 WHERE a=%(uid)s AND b ILIKE %(q)s AND e <=> (%(emb)s)::halfvec(4)"
+    assert adb._psycopg("SELECT '50%' FROM t WHERE x = :x") == "SELECT '50%%' FROM t WHERE x = %(x)s"
+
+
+def test_native_pg_events_and_feedback(native_pg):
+    async def scenario():
+        events = [{"user_id": "u1", "type": "chat", "text": f"记忆 {i}", "metadata": {}, "timestamp": "2024-01-01T00:00"} for i in range(3)]
+        written = await adb.upsert_events(events)
+        found = await adb.query_events("u1", "记忆", 5)
+        recent = await adb.fetch_user_events("u1", limit=10)
+        ok = await adb.insert_feedback({"user_id": "u1", "feedback_type": "like", "timestamp": "2024-01-01T00:00"})
+        stats = await adb.fetch_feedback_stats("u1")
+        return events, written, found, recent, ok, stats
+
+    events, written, found, recent, ok, stats = asyncio.run(scenario())
+    assert written == 3 and [ev["id"] for ev in events] == [100, 101, 102]
+    sql, params = native_pg.log[0]
+    assert sql.startswith("INSERT INTO memory_events(user_id, type, text, metadata, timestamp, content_hash, search_tokens) "
+                          "SELECT * FROM unnest(CAST(%(c0)s AS text[])")
+    assert sql.endswith("RETURNING id") and params["c0"] == ["u1"] * 3
+    sql, params = native_pg.log[1]
+    assert "text ILIKE %(q)s" in sql and params == {"uid": "u1", "limit": 5, "q": "%记忆%"}
+    assert found == recent == [{"id": 7, "user_id": "u1", "type": "chat", "text": "t", "metadata": {"a": 1}, "timestamp": "2024-01-01T00:00"}]
+    assert native_pg.log[3][0].startswith("INSERT INTO user_feedback(") and ok == 1
+    assert native_pg.log[4] == ("SELECT feedback_type, COUNT(1) as cnt FROM user_feedback WHERE user_id=%(uid)s GROUP BY feedback_type", {"uid": "u1"})
+    assert stats == {"counts": {"like": 2}}
+
+
+def test_native_pg_vectors(native_pg):
+    from app import vector_store  # type: ignore
+
+    async def scenario():
+        metas = [{"user_id": "u1", "type": "chat", "text": f"t{i}", "timestamp": "2024-01-01T00:00", "id": i} for i in range(3)]
+        await adb.vector_add_texts([m["text"] for m in metas], metas)
+        await adb.vector_add_texts(["t3"], [{**metas[0], "text": "t3", "id": 3}])
+        hits = await adb.vector_query("t0", top_k=2, filters={"user_id": "u1"}, ef_search=50)
+        batch = await adb.vector_query_batch([
+            {"text": "a", "top_k": 1, "filters": {"user_id": "broken"}},
+            {"text": "b", "top_k": 1, "filters": {"user_id": "u2"}, "half_life_days": 7},
+        ])
+        return hits, batch
+
+    hits, batch = asyncio.run(scenario())
+    log = native_pg.log
+    assert log[0] == ("REGISTER", None)
+    copy = log[1][1]
+    assert copy.sql == vector_store._PG_COPY_SQL and copy.types[4] == 'vector' and len(copy.rows) == 3
+    assert log[2] == (vector_store._PG_INSERT_SQL, log[2][1]) and log[2][1][0][5] == 3
+    # 检索：事务内 SET LOCAL 后执行，:name 占位已转换
+    begin = log.index(("BEGIN", None))
+    assert log[begin + 1] == ("SET LOCAL hnsw.ef_search = 50", None)
+    sql, params = log[begin + 2]
+    assert "WHERE user_id = %(uid)s" in sql and params["uid"] == "u1" and params["k"] == 2
+    assert hits == [{"user_id": "u1", "type": "chat", "text": "t", "timestamp": "2024-01-01T00:00", "id": 7, "score": 0.8}]
+    # 批量检索：单条失败只影响该项（其事务回滚），其余照常返回并按时间衰减重排
+    assert isinstance(batch[0], RuntimeError) and ("ROLLBACK", None) in log
+    assert batch[1][0]["user_id"] == "u2" and "similarity" in batch[1][0]
+
+
+def test_native_pg_roundtrip_against_server():
+    from app import storage  # type: ignore
+    if not (db._use_pg() and storage.HAS_ASYNC_PG):
+        pytest.skip("requires POSTGRES_DSN and psycopg_pool")
+
+    async def scenario():
+        try:
+            events = [{"user_id": "async_native", "type": "chat", "text": "原生异步", "metadata": {"k": 1}, "timestamp": "2024-01-01T00:00"}]
+            assert await adb.upsert_events(events) == 1
+            recent = await adb.fetch_user_events("async_native", limit=50)
+            assert any(r["id"] == events[0]["id"] and r["metadata"] == {"k": 1} for r in recent)
+        finally:
+            await storage.close_async_pool()
+
+    asyncio.run(scenario())
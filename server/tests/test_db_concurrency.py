@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+from app import db, storage  # type: ignore
+
+_DELAY = 0.1
+_THREADS = 8
+
+
+class _SlowResult:
+    def mappings(self):
+        return self
+
+    def all(self):
+        return []
+
+
+class _SlowConn:
+    def execute(self, *args, **kwargs):
+        time.sleep(_DELAY)  # 模拟一次数据库往返
+        return _SlowResult()
+
+
+class _SlowEngine:
+    @contextmanager
+    def begin(self):
+        yield _SlowConn()
+
+
+def _run_concurrently(fn) -> float:
+    threads = [threading.Thread(target=fn) for _ in range(_THREADS)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def test_postgres_path_has_no_global_lock(monkeypatch):
+    monkeypatch.setattr(db, '_use_pg', lambda: True)
+    monkeypatch.setattr(storage, '_ENGINE', _SlowEngine())
+    monkeypatch.setattr(storage, '_ENGINE_PID', os.getpid())
+    monkeypatch.setattr(db, '_schema_ready', True)
+
+    concurrent = _run_concurrently(lambda: db.fetch_user_events("u_pg", since_days=7, limit=10))
+    # 对照：旧实现每个操作都持有进程级锁
+    serial_lock = threading.Lock()
+
+    def serialized():
+        with serial_lock:
+            db.fetch_user_events("u_pg", since_days=7, limit=10)
+
+    serial = _run_concurrently(serialized)
+    assert serial >= _THREADS * _DELAY * 0.9
+    assert concurrent < serial / 3, (concurrent, serial)
+
+
+def test_sqlite_reads_not_blocked_by_open_write():
+    db.init_db()
+    done = threading.Event()
+    with db._sqlite().writer() as conn:
+        conn.execute("INSERT INTO memory_events(user_id, type, text, metadata, timestamp) VALUES('u_wal','chat','pending','{}','2024-01-01T00:00')")
+        # 写事务尚未提交：WAL 下读连接不等待写锁
+        reader = threading.Thread(target=lambda: (db.query_events("u_wal", None, 5), done.set()))
+        reader.start()
+        assert done.wait(2.0)
+    reader.join()
+    assert any(it["text"] == "pending" for it in db.query_events("u_wal", None, 5))
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import types
+
+import numpy as np
+import pytest
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+from app import embedding  # type: ignore
+from app.metrics import get_counters  # type: ignore
+
+
+class _RecordingModel:
+    """按 batch_size 分块编码并记录每次前向的大小（同 sentence-transformers 的行为）"""
+
+    def __init__(self):
+        self.forward_sizes = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, **_kwargs):
+        out = []
+        for start in range(0, len(texts), batch_size):
+            chunk = texts[start:start + batch_size]
+            self.forward_sizes.append(len(chunk))
+            out.extend(np.full(4, float(len(t)), dtype=np.float32) for t in chunk)
+        return np.stack(out)
+
+
+def test_batcher_caps_forward_pass_size(monkeypatch):
+    model = _RecordingModel()
+    monkeypatch.setattr(embedding, 'get_model', lambda: model)
+    batcher = embedding.EmbeddingBatcher(max_batch=8, max_wait_ms=0)
+    texts = ["x" * (i % 5 + 1) for i in range(100)]
+    embs = batcher.encode(texts)
+    assert embs.shape == (100, 4)
+    assert [int(v) for v in embs[:, 0]] == [len(t) for t in texts]
+    assert max(model.forward_sizes) <= 8 and sum(model.forward_sizes) == 100
+
+
+class _StubEncoder:
+    """记录每次实际编码的文本，向量取文本长度"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([np.full(4, float(len(t)), dtype=np.float32) for t in texts]) if texts else np.zeros((0, 4), dtype=np.float32)
+
+
+def _cache_counts():
+    counters = get_counters()
+    return counters.get('embed_cache_hits', 0), counters.get('embed_cache_misses', 0)
+
+
+def test_cached_encode_counts_hits_and_misses(monkeypatch):
+    monkeypatch.setattr(embedding, '_cache', embedding.EmbeddingCache(max_items=16, use_redis=False))
+    enc = _StubEncoder()
+    hits0, misses0 = _cache_counts()
+
+    first = embedding.cached_encode('m', ["a", "bb", "a"], enc)
+    assert [int(v) for v in first[:, 0]] == [1, 2, 1]
+    # 批内重复文本只编码一次
+    assert enc.calls == [["a", "bb"]]
+    assert _cache_counts() == (hits0, misses0 + 3)
+
+    second = embedding.cached_encode('m', ["bb", "ccc"], enc)
+    assert [int(v) for v in second[:, 0]] == [2, 3]
+    assert enc.calls[-1] == ["ccc"]
+    assert _cache_counts() == (hits0 + 1, misses0 + 4)
+
+    # 不同模型命名空间互不共享
+    embedding.cached_encode('other', ["a"], enc)
+    assert enc.calls[-1] == ["a"]
+
+
+def test_cache_keys_on_normalized_text(monkeypatch):
+    monkeypatch.setattr(embedding, '_cache', embedding.EmbeddingCache(max_items=16, use_redis=False))
+    enc = _StubEncoder()
+    embedding.cached_encode('m', ["hello  world"], enc)
+    # 首尾空白、连续空白与全角字符（NFKC）归一化后命中同一键
+    embedding.cached_encode('m', ["  hello world\n", "hello\tworld", "ｈｅｌｌｏ world"], enc)
+    assert enc.calls == [["hello  world"]]
+    assert embedding.EmbeddingCache.key('m', "Hello world") != embedding.EmbeddingCache.key('m', "hello world")
+
+
+def test_cache_evicts_least_recently_used_at_capacity(monkeypatch):
+    cache = embedding.EmbeddingCache(max_items=2, use_redis=False)
+    monkeypatch.setattr(embedding, '_cache', cache)
+    enc = _StubEncoder()
+    embedding.cached_encode('m', ["a", "bb"], enc)
+    embedding.cached_encode('m', ["a"], enc)  # 命中后 "a" 成为最近使用
+    embedding.cached_encode('m', ["ccc"], enc)  # 超出容量，淘汰最久未用的 "bb"
+    assert len(cache) == 2
+    assert cache.get(embedding.EmbeddingCache.key('m', "bb")) is None
+    assert cache.get(embedding.EmbeddingCache.key('m', "a")) is not None
+    embedding.cached_encode('m', ["bb"], enc)
+    assert enc.calls[-1] == ["bb"]
+
+    # max_items=0 关闭本地缓存：每次都重新编码
+    monkeypatch.setattr(embedding, '_cache', embedding.EmbeddingCache(max_items=0, use_redis=False))
+    enc = _StubEncoder()
+    embedding.cached_encode('m', ["a"], enc)
+    embedding.cached_encode('m', ["a"], enc)
+    assert enc.calls == [["a"], ["a"]]
+
+
+# ONNX 后端：以桩替代 onnxruntime / transformers / sentence_transformers，不下载模型
+_TABLE = np.random.default_rng(3).normal(size=(8, 4)).astype(np.float32)
+
+
+def _tokenize(texts, max_length=16):
+    ids = [[ord(c) % 7 + 1 for c in t][:max_length] for t in texts]
+    width = max(len(i) for i in ids)
+    input_ids = np.array([i + [0] * (width - len(i)) for i in ids], dtype=np.int64)
+    return {"input_ids": input_ids, "attention_mask": (input_ids > 0).astype(np.int64)}
+
+
+def _mean_pooled(texts):
+    enc = _tokenize(texts)
+    mask = enc["attention_mask"][..., None]
+    pooled = (_TABLE[enc["input_ids"]] * mask).sum(axis=1) / mask.sum(axis=1)
+    return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+
+class _Tokenizer:
+    def __call__(self, texts, padding=True, truncation=True, max_length=16, return_tensors='np'):
+        return _tokenize(texts, max_length)
+
+
+class _Session:
+    def __init__(self, path, *args, **kwargs):
+        self.path = path
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name='input_ids'), types.SimpleNamespace(name='attention_mask')]
+
+    def run(self, outputs, feeds):
+        return [_TABLE[feeds['input_ids']]]
+
+
+class _SentenceTransformer:
+    """torch 后端桩：encode 返回 reference（默认与 ONNX 桩一致）"""
+    reference = staticmethod(_mean_pooled)
+
+    def __init__(self, name, device=None):
+        self.name = name
+        transformer = types.SimpleNamespace(max_seq_length=16, tokenizer=_Tokenizer())
+        pooling = types.SimpleNamespace(pooling_mode_cls_token=False, pooling_mode_max_tokens=False)
+        self._modules = [transformer, pooling]
+
+    def __getitem__(self, i):
+        return self._modules[i]
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+    def encode(self, texts, normalize_embeddings=False, **_kwargs):
+        return type(self).reference(texts)
+
+
+def _unexpected(*args, **kwargs):
+    raise AssertionError("unexpected call")
+
+
+@pytest.fixture
+def onnx_env(monkeypatch, tmp_path):
+    onnxruntime = types.ModuleType('onnxruntime')
+    onnxruntime.SessionOptions = lambda: types.SimpleNamespace()
+    onnxruntime.InferenceSession = _Session
+    transformers = types.ModuleType('transformers')
+    transformers.AutoTokenizer = types.SimpleNamespace(from_pretrained=lambda path: _Tokenizer())
+    st = types.ModuleType('sentence_transformers')
+    st.SentenceTransformer = _SentenceTransformer
+    for name, module in (('onnxruntime', onnxruntime), ('transformers', transformers),
+                         ('sentence_transformers', st), ('torch', types.ModuleType('torch'))):
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.setattr(embedding, 'HAS_ONNXRUNTIME', True)
+    monkeypatch.setattr(embedding, '_BACKEND', 'onnx')
+    monkeypatch.setattr(embedding, '_ONNX_DIR', str(tmp_path))
+    model_dir = tmp_path / 'org__model'
+    model_dir.mkdir()
+    (model_dir / 'model.onnx').write_bytes(b'')  # 已导出：跳过 torch.onnx.export，只做校验
+    return model_dir
+
+
+def test_onnx_encoder_verifies_export_and_pools_in_numpy(onnx_env, monkeypatch):
+    texts = ["今天心情不错", "ok", "The weather is nice today."]
+    enc = embedding.load_encoder('org/model')
+    assert isinstance(enc, embedding.OnnxSentenceEncoder)
+    assert enc.get_sentence_embedding_dimension() == 4
+    # 不同长度的句子按 attention_mask 做均值池化，填充位不参与
+    np.testing.assert_allclose(enc.encode(texts, batch_size=2, normalize_embeddings=True), _mean_pooled(texts), rtol=1e-5)
+
+    info = json.loads((onnx_env / 'export.json').read_text())
+    assert info['pooling'] == 'mean' and info['verified']['model.onnx'] >= 0.99
+    # 已校验的导出直接复用，不再加载 torch 模型比对
+    monkeypatch.setattr(_SentenceTransformer, '__init__', _unexpected)
+    assert isinstance(embedding.load_encoder('org/model'), embedding.OnnxSentenceEncoder)
+
+
+def test_onnx_export_rejected_when_cosine_below_threshold(onnx_env, monkeypatch):
+    # torch 输出与 ONNX 输出方向相反：校验失败，回退到 torch 且不记录为已校验
+    monkeypatch.setattr(_SentenceTransformer, 'reference', staticmethod(lambda texts: -_mean_pooled(texts)))
+    enc = embedding.load_encoder('org/model')
+    assert isinstance(enc, _SentenceTransformer) and enc.name == 'org/model'
+    assert not (onnx_env / 'export.json').exists()
+    with pytest.raises(RuntimeError, match='deviates from torch'):
+        embedding.OnnxSentenceEncoder('org/model')
+
+
+def test_load_encoder_falls_back_to_torch_without_onnxruntime(onnx_env, monkeypatch):
+    monkeypatch.setattr(embedding, 'HAS_ONNXRUNTIME', False)
+    monkeypatch.setattr(embedding, 'OnnxSentenceEncoder', _unexpected)
+    assert isinstance(embedding.load_encoder('org/model'), _SentenceTransformer)
@@ -35,3 +35,16 @@ def test_feedback_post_and_stats():
     assert counts.get("useful", 0) >= 1
     assert counts.get("complete", 0) >= 1
 
+
+
+def test_feedback_batch_returns_written_count():
+    user_id = "test_feedback_batch_user"
+    now = datetime.now().isoformat(timespec='minutes')
+    events = [{"user_id": user_id, "feedback_type": "like", "target_type": "chat", "target_id": f"r{i}", "score": 1.0, "timestamp": now}
+              for i in range(50)]
+    r = client.post("/feedback/batch", json={"events": events})
+    assert r.status_code == 200
+    j = r.json()
+    assert j.get("status") == "success" and j["data"].get("written") == 50
+    counts = client.get(f"/feedback/stats/{user_id}").json().get("data", {}).get("counts", {})
+    assert counts.get("like", 0) >= 50
@@ -9,6 +9,7 @@ sys.path.insert(0, SERVER_DIR)
 
 from fastapi.testclient import TestClient  # type: ignore
 from app.main import app  # type: ignore
+from app import db, retrieval  # type: ignore
 
 client = TestClient(app)
 
@@ -110,3 +111,156 @@ def test_memory_query_invalid_user_returns_empty():
     data = q.json()
     assert data.get("status") == "success"
     assert data.get("data") == []
+
+
+def test_memory_query_hybrid_lexical_match():
+    user_id = "test_user_mem_hybrid"
+    payload = {
+        "events": [
+            {"user_id": user_id, "type": "chat", "text": "下午去公园散步了一小时", "metadata": {}, "timestamp": _iso_minute(datetime.now())},
+            {"user_id": user_id, "type": "chat", "text": "晚上整理房间", "metadata": {}, "timestamp": _iso_minute(datetime.now())},
+        ]
+    }
+    r = client.post("/memory/upsert", json=payload)
+    assert r.status_code == 200 and r.json().get("status") == "success"
+
+    q = client.post("/memory/query", json={"user_id": user_id, "query": "公园", "top_k": 5})
+    assert q.status_code == 200
+    items = q.json().get("data", [])
+    assert any("公园" in it.get("text", "") for it in items)
+
+
+def test_memory_delete_by_id_and_user():
+    user_id = "test_user_mem_delete"
+    payload = {
+        "events": [
+            {"user_id": user_id, "type": "chat", "text": "周末去爬山", "metadata": {}, "timestamp": _iso_minute(datetime.now())},
+            {"user_id": user_id, "type": "goal", "text": "每天读书半小时", "metadata": {}, "timestamp": _iso_minute(datetime.now())},
+        ]
+    }
+    r = client.post("/memory/upsert", json=payload)
+    assert r.status_code == 200 and r.json().get("status") == "success"
+
+    items = client.post("/memory/query", json={"user_id": user_id, "top_k": 10}).json().get("data", [])
+    target = next(it for it in items if it.get("text") == "周末去爬山")
+    d = client.post("/memory/delete", json={"user_id": user_id, "ids": [target["id"]]})
+    assert d.status_code == 200 and d.json().get("deleted") == 1
+
+    items = client.post("/memory/query", json={"user_id": user_id, "query": "爬山", "top_k": 5}).json().get("data", [])
+    assert all("爬山" not in it.get("text", "") for it in items)
+
+    d = client.delete(f"/memory/user/{user_id}")
+    assert d.status_code == 200 and d.json().get("status") == "success"
+    items = client.post("/memory/query", json={"user_id": user_id, "top_k": 10}).json().get("data", [])
+    assert items == []
+
+
+def test_memory_upsert_skips_duplicates():
+    user_id = "test_user_mem_dedup"
+    client.delete(f"/memory/user/{user_id}")
+    now = _iso_minute(datetime.now())
+    line = {"user_id": user_id, "type": "chat", "text": "今天想早点睡觉", "metadata": {}, "timestamp": now}
+    r = client.post("/memory/upsert", json={"events": [line, {**line, "text": " 今天想早点睡觉。"}]})
+    assert r.status_code == 200
+    data = r.json()
+    assert data.get("written") == 1 and data.get("deduplicated") == 1 and data["dedup"]["exact"] == 1
+
+    # 客户端重发同一条：整批被跳过；不同类型的同文本不算重复
+    r = client.post("/memory/upsert", json={"events": [line, {**line, "type": "goal"}]})
+    data = r.json()
+    assert data.get("written") == 1 and data["dedup"]["exact"] == 1
+
+    items = client.post("/memory/query", json={"user_id": user_id, "top_k": 10}).json().get("data", [])
+    assert sorted(it.get("type") for it in items) == ["chat", "goal"]
+    client.delete(f"/memory/user/{user_id}")
+
+
+def test_memory_query_batch_preserves_order():
+    now = _iso_minute(datetime.now())
+    events = [
+        {"user_id": "test_batch_a", "type": "chat", "text": "周末去爬山看日出", "metadata": {}, "timestamp": now},
+        {"user_id": "test_batch_b", "type": "mood", "text": "今天加班很累", "metadata": {}, "timestamp": now},
+    ]
+    assert client.post("/memory/upsert", json={"events": events}).status_code == 200
+
+    r = client.post("/memory/query-batch", json={"queries": [
+        {"user_id": "test_batch_a", "query": "爬山", "top_k": 3},
+        {"user_id": "test_batch_b", "query": "加班", "top_k": 3},
+        {"user_id": "test_batch_a", "top_k": 1},
+    ]})
+    assert r.status_code == 200
+    data = r.json().get("data")
+    assert [d.get("status") for d in data] == ["success"] * 3
+    # 结果与请求同序，且各自限定在对应用户内
+    assert data[0]["data"] and all(it["user_id"] == "test_batch_a" for it in data[0]["data"])
+    assert data[1]["data"] and all(it["user_id"] == "test_batch_b" for it in data[1]["data"])
+    assert len(data[2]["data"]) == 1
+
+    too_many = {"queries": [{"user_id": "u", "query": "x"}] * 33}
+    assert client.post("/memory/query-batch", json=too_many).status_code == 422
+
+
+def test_memory_upsert_bulk_counts_every_row():
+    from app import db  # type: ignore
+    user_id = "test_user_mem_bulk"
+    client.delete(f"/memory/user/{user_id}")
+    now = _iso_minute(datetime.now())
+    texts = ["周一去游泳馆练习自由泳", "周三晚上给妈妈打电话", "周五读完那本科幻小说"]
+    r = client.post("/memory/upsert", json={"events": [
+        {"user_id": user_id, "type": "chat", "text": t, "metadata": {}, "timestamp": now} for t in texts
+    ]})
+    assert r.status_code == 200
+    assert r.json().get("written") == 3
+    # 批量写入的每一行都进入分词索引
+    hits = db.lexical_search(user_id, "科幻小说", 5)
+    assert any(it["text"] == texts[2] for it in hits)
+
+
+def test_destructive_endpoints_require_admin_key(monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEY", "admin-secret")
+    monkeypatch.setenv("METRICS_API_KEY", "metrics-secret")
+    user_id = "test_user_mem_admin"
+    assert client.delete(f"/memory/user/{user_id}").status_code == 403
+    assert client.delete(f"/memory/user/{user_id}", headers={"X-API-Key": "metrics-secret"}).status_code == 403
+    assert client.post("/memory/delete", json={"user_id": user_id, "ids": [1]}).status_code == 403
+    assert client.post("/admin/memory/sweep").status_code == 403
+    assert client.post("/admin/vector-index/rebuild").status_code == 403
+    r = client.delete(f"/memory/user/{user_id}", headers={"X-API-Key": "admin-secret"})
+    assert r.status_code == 200 and r.json().get("status") == "success"
+
+
+def test_memory_upsert_keeps_repeated_entries_on_different_days():
+    user_id = "test_user_mem_timeseries"
+    client.delete(f"/memory/user/{user_id}")
+    day1 = _iso_minute(datetime.now() - timedelta(days=2))
+    day2 = _iso_minute(datetime.now() - timedelta(days=1))
+    events = [{"user_id": user_id, "type": t, "text": "今天好累", "metadata": {}, "timestamp": ts}
+              for t in ("mood", "chat") for ts in (day1, day2)]
+    r = client.post("/memory/upsert", json={"events": events})
+    data = r.json()
+    assert data.get("written") == 4 and data.get("deduplicated") == 0
+
+    # 同一天重发（客户端重试）仍然跳过
+    r = client.post("/memory/upsert", json={"events": events[:1]})
+    assert r.json().get("written") == 0 and r.json()["dedup"]["exact"] == 1
+
+    # MEMORY_DEDUP_TYPES 中的类型（默认 goal）在时间窗内跨天去重
+    goals = [{**ev, "type": "goal", "text": "每天早睡"} for ev in events[:2]]
+    r = client.post("/memory/upsert", json={"events": goals})
+    assert r.json().get("written") == 1 and r.json()["dedup"]["exact"] == 1
+    client.delete(f"/memory/user/{user_id}")
+
+
+def test_vector_only_hits_carry_event_id_and_metadata():
+    user_id = "test_user_mem_vector_only"
+    client.delete(f"/memory/user/{user_id}")
+    events = [{"user_id": user_id, "type": "mood", "text": "心情平静", "metadata": {"score": 3},
+               "timestamp": _iso_minute(datetime.now())}]
+    assert db.upsert_events(events) == 1 and isinstance(events[0]["id"], int)
+
+    # 查询词与记忆没有词法重叠：命中只来自向量召回，按 id 回查补全 metadata
+    raw = [{"id": events[0]["id"], "user_id": user_id, "type": "mood", "text": "心情平静",
+            "timestamp": events[0]["timestamp"], "score": 0.9}]
+    items, stats = retrieval._fuse(user_id, "放松", 5, raw)
+    assert stats["vector_hits"] == 1 and stats["lexical_hits"] == 0
+    assert items[0]["id"] == events[0]["id"] and items[0]["metadata"] == {"score": 3}
@@ -59,3 +59,39 @@ def test_index_persistence_reload():
     # 至少返回一条
     assert len(items) >= 1
 
+
+
+def test_vector_query_scoped_to_user_partition():
+    # 其他用户的大量相似记忆不应挤占当前用户的召回结果
+    now = _iso_minute(datetime.now())
+    noise = {
+        "events": [
+            {"user_id": "test_vec_noise", "type": "chat", "text": f"晚上想去公园散步{i}", "metadata": {}, "timestamp": now}
+            for i in range(20)
+        ]
+    }
+    assert client.post("/memory/upsert", json=noise).status_code == 200
+    owner = {"events": [{"user_id": "test_vec_owner", "type": "chat", "text": "晚上想去公园散步", "metadata": {}, "timestamp": now}]}
+    assert client.post("/memory/upsert", json=owner).status_code == 200
+
+    q = client.post("/memory/query", json={"user_id": "test_vec_owner", "query": "去公园散步", "top_k": 3})
+    assert q.status_code == 200
+    items = q.json().get("data", [])
+    assert len(items) >= 1
+    assert all(it.get("user_id") == "test_vec_owner" for it in items)
+
+
+def test_rerank_prefers_recent_and_weighted_types():
+    from datetime import timedelta
+    from app.vector_store import rerank  # type: ignore
+    now = datetime.now()
+    items = [
+        {"type": "chat", "text": "old", "timestamp": _iso_minute(now - timedelta(days=120)), "score": 0.80},
+        {"type": "goal", "text": "recent goal", "timestamp": _iso_minute(now - timedelta(days=1)), "score": 0.72},
+        {"type": "chat", "text": "no ts", "timestamp": None, "score": 0.75},
+    ]
+    # 不重排时按相似度；加入半衰期与类型权重后近期目标排在最前，原始相似度保留在 similarity
+    out = rerank(items, top_k=3, half_life_days=14, type_weights={"goal": 1.2}, recency_weight=0.3)
+    assert [it["text"] for it in out][0] == "recent goal"
+    assert out[0]["similarity"] == 0.72 and out[0]["score"] > out[1]["score"]
+    assert [it["text"] for it in rerank(items, top_k=2)] == ["old", "no ts"]
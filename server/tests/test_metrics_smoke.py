@@ -25,3 +25,13 @@ def test_metrics_increments():
     # total retrieval should be counted at least once
     assert counters.get('mem_retrieval_total', 0) >= 1
 
+
+
+def test_metrics_reports_executor_pools():
+    r = client.post('/memory/query', json={'user_id': 'metrics_exec_user', 'top_k': 1})
+    assert r.status_code == 200
+
+    data = client.get('/metrics').json().get('data', {})
+    pools = data.get('executors', {})
+    assert {'inference', 'db', 'analytics'} <= set(pools)
+    assert data.get('counters', {}).get('executor_inference_tasks', 0) >= 1
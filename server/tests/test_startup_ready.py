@@ -0,0 +1,25 @@
+import os, sys, time
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+from fastapi.testclient import TestClient  # type: ignore
+from app.main import app  # type: ignore
+
+
+def test_ready_after_lifespan_warmup(monkeypatch):
+    # 只预热轻量组件，验证 lifespan 启动后 /ready 由 503 变为 200
+    monkeypatch.setenv('STARTUP_WARMUP', 'cache')
+    with TestClient(app) as client:
+        r = client.get('/ready')
+        for _ in range(100):
+            if r.status_code == 200:
+                break
+            assert r.status_code == 503 and r.json().get('status') == 'warming'
+            time.sleep(0.05)
+            r = client.get('/ready')
+        assert r.status_code == 200
+        data = r.json()
+        assert data.get('status') == 'ready' and data.get('pending') == []
+        timings = data.get('timings_ms', {})
+        assert 'init:init_db' in timings and 'warmup:cache' in timings
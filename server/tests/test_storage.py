@@ -0,0 +1,55 @@
+import os
+import sys
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+from app import storage, db, db_feedback, vector_store  # type: ignore
+
+
+class _FakePool:
+    def checkedout(self):
+        return 3
+
+    def checkedin(self):
+        return 7
+
+    def overflow(self):
+        return -7
+
+
+class _FakeEngine:
+    pool = _FakePool()
+
+
+def test_single_engine_shared_by_all_modules(monkeypatch):
+    created = []
+
+    def fake_create_engine(dsn, **kwargs):
+        created.append((dsn, kwargs))
+        return _FakeEngine()
+
+    monkeypatch.setattr(storage, 'create_engine', fake_create_engine)
+    monkeypatch.setattr(storage, '_PG_DSN', 'postgresql+psycopg://u:p@h/db')
+    monkeypatch.setattr(storage, '_ENGINE', None)
+    monkeypatch.setattr(storage, '_ENGINE_PID', None)
+    monkeypatch.setattr(storage, '_PG_STATEMENT_TIMEOUT_MS', 5000)
+    engines = {id(m._get_engine()) for m in (db, db_feedback, vector_store)}
+    assert len(engines) == 1 and len(created) == 1
+    opts = created[0][1]
+    assert opts["connect_args"]["options"] == "-c statement_timeout=5000"
+    stats = storage.pool_stats()
+    assert stats["backend"] == "postgres" and stats["checked_out"] == 3 and stats["overflow"] == 0
+    assert stats["capacity"] == opts["pool_size"] + opts["max_overflow"]
+
+
+def test_sqlite_pool_stats_reports_writer():
+    if storage.use_pg():
+        return
+    db.init_db()
+    with db._sqlite().writer():
+        busy = storage.pool_stats()
+    assert busy["backend"] == "sqlite" and busy["checked_out"] >= 1
+    assert 0 < busy["utilization"] <= 1
+    assert storage.pool_stats()["checked_out"] == 0
@@ -0,0 +1,37 @@
+import numpy as np
+from fastapi.testclient import TestClient  # type: ignore
+
+
+def _vectors(n, dim=16, seed=1):
+    vecs = np.random.default_rng(seed).normal(size=(n, dim)).astype('float32')
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_partition_grows_past_initial_capacity(load_vector_store):
+    # 初始容量 16：先越过预分配阈值由后台扩容，再用单批超出剩余容量的写入触发同步扩容
+    vs = load_vector_store(VECTOR_PARTITION_INIT_CAPACITY='16', VECTOR_INDEX_PREALLOC_RATIO='0.8')
+    vs._ensure_index(16)
+    vecs = _vectors(113)
+    metas = [{"user_id": "u1", "type": "chat", "text": f"t{i}", "timestamp": "2024-01-01T00:00"} for i in range(113)]
+
+    vs.add_embeddings(vecs[:10], metas[:10])
+    part = vs._get_partition(vs._partition_key("u1"))
+    assert part.capacity() == 16 and not part.needs_prealloc()
+
+    vs.add_embeddings(vecs[10:13], metas[10:13])
+    vs._preallocate_due()  # 后台线程可能已先完成，两种情况都应已扩容
+    assert part.capacity() > 16 and not part.needs_prealloc()
+
+    grown = part.capacity()
+    vs.add_embeddings(vecs[13:], metas[13:])
+    assert part.count() == 113 and part.capacity() >= 113 > grown
+
+    for i in range(13):
+        hits = vs.query_embedding(vecs[i], top_k=1, filters={"user_id": "u1"})
+        assert hits and hits[0]["text"] == f"t{i}"
+
+    from app.main import app  # type: ignore
+    status = TestClient(app).get("/health").json()["vector_index"]
+    assert status["elements"] == 113 and status["capacity"] == part.capacity()
+    assert status["headroom"] == status["capacity"] - status["elements"]
+    assert status["max_fill_ratio"] == round(part.fill_ratio(), 4)
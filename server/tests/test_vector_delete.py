@@ -0,0 +1,95 @@
+import json
+import sqlite3
+
+import numpy as np
+
+
+def _no_model():
+    raise RuntimeError("embedding model must not load on delete")
+
+
+def _meta(user, i):
+    return {"user_id": user, "type": "chat", "text": f"{user}-{i}", "timestamp": "2024-01-01T00:00"}
+
+
+def _write(vs):
+    vecs = np.random.default_rng(0).normal(size=(6, 16)).astype('float32')
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    vs.add_embeddings(vecs[:3], [_meta("u1", i) for i in range(3)])
+    vs.add_embeddings(vecs[3:], [_meta("u2", i) for i in range(3)])
+    vs.flush()
+
+
+def test_delete_paths_do_not_load_embedding_model(load_vector_store, monkeypatch):
+    _write(load_vector_store())
+    # 重启后嵌入模型不可用：删除/过期只依赖已有分区与元数据表
+    vs = load_vector_store()
+    monkeypatch.setattr(vs, 'embed_dimension', _no_model)
+    assert vs.delete_matching("u1", [_meta("u1", 0)]) == 1
+    assert vs.delete_user("u2") == 3
+    assert vs.expire("chat", "2025-01-01T00:00") == 2
+    assert vs.delete_user("nobody") == 0
+
+
+def test_delete_on_empty_store_is_noop(load_vector_store, monkeypatch, tmp_path):
+    vs = load_vector_store()
+    monkeypatch.setattr(vs, 'embed_dimension', _no_model)
+    assert vs.delete_user("u1") == 0
+    assert not (tmp_path / 'memory_hnsw').exists()
+
+
+def test_memory_delete_reports_partial_when_vector_cleanup_fails(monkeypatch):
+    from fastapi.testclient import TestClient  # type: ignore
+    from app import main  # type: ignore
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("vector backend unavailable")
+
+    monkeypatch.setattr(main, 'vs_delete_user', broken)
+    monkeypatch.setattr(main, '_VECTOR_CLEANUP_RETRY_DELAYS', ())
+    client = TestClient(main.app)
+    user_id = "test_user_partial_delete"
+    client.post("/memory/upsert", json={"events": [
+        {"user_id": user_id, "type": "chat", "text": "部分删除测试", "metadata": {}, "timestamp": "2024-01-01T00:00"}]})
+    r = client.delete(f"/memory/user/{user_id}").json()
+    assert r["status"] == "partial" and r["deleted"] == 1 and r["vector_cleanup"] == "pending"
+
+
+def test_delete_without_known_dim_is_deferred(load_vector_store, monkeypatch, tmp_path):
+    _write(load_vector_store())
+    # 旧版本数据：快照与元数据表都没有记录维度
+    part_dir = tmp_path / 'memory_hnsw'
+    conn = sqlite3.connect(str(part_dir / 'meta.db'))
+    conn.execute("DELETE FROM vector_settings")
+    conn.commit()
+    conn.close()
+    for path in part_dir.glob('*.meta.json'):
+        meta = json.loads(path.read_text())
+        meta.pop('dim', None)
+        path.write_text(json.dumps(meta))
+
+    # 只删元数据并把墓碑排入 outbox
+    vs = load_vector_store()
+    monkeypatch.setattr(vs, 'embed_dimension', _no_model)
+    assert vs.delete_matching("u1", [_meta("u1", 0)]) == 1
+    assert vs._get_meta_store().outbox_size() == 1
+
+    # 下次初始化时应用
+    vs = load_vector_store()
+    vs._ensure_index(16)
+    assert vs._get_meta_store().outbox_size() == 0
+    part = vs._get_partition(vs._partition_key("u1"))
+    assert part.tombstones == 1 and part.live_count() == 2
+
+
+def test_vectors_are_deleted_by_event_id(load_vector_store):
+    vs = load_vector_store()
+    vecs = np.random.default_rng(1).normal(size=(2, 16)).astype('float32')
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    # 两条内容与时间戳都相同的记忆：只删除 id 对应的那条向量
+    vs.add_embeddings(vecs, [{**_meta("u1", 0), "id": 101}, {**_meta("u1", 0), "id": 102}])
+    assert [h["id"] for h in vs.query_embedding(vecs[1], top_k=1, filters={"user_id": "u1"})] == [102]
+
+    assert vs.delete_matching("u1", [{**_meta("u1", 0), "id": 102}]) == 1
+    hits = vs.query_embedding(vecs[1], top_k=2, filters={"user_id": "u1"})
+    assert [h["id"] for h in hits] == [101]
@@ -0,0 +1,107 @@
+import os
+import sys
+import sqlite3
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, SERVER_DIR)
+
+from app.vector_store import _MetaStore  # noqa: E402
+
+
+def _meta(user, type_, text, ts):
+    return {"user_id": user, "type": type_, "text": text, "timestamp": ts}
+
+
+def test_meta_store_insert_delete_expire(tmp_path):
+    store = _MetaStore(str(tmp_path / 'meta.db'))
+    store.put_many('p1', [0, 1, 2], [
+        _meta('u1', 'chat', 'a', '2024-01-01T00:00'),
+        _meta('u1', 'goal', 'b', '2024-01-02T00:00'),
+        _meta('u1', 'chat', 'c', '2024-03-01T00:00'),
+    ])
+    store.put_many('p2', [0], [_meta('u2', 'chat', 'a', '2024-01-01T00:00')])
+
+    # 同一分区内标签唯一；另一分区的相同标签互不影响
+    assert store.labels('p1') == [0, 1, 2]
+    got = store.get_many('p1', [0, 2, 9])
+    assert set(got) == {0, 2} and got[2]['text'] == 'c'
+    assert store.get_many('p2', [0])[0]['user_id'] == 'u2'
+    assert store.get_many('p1', []) == {}
+
+    # 重复写入同一标签覆盖旧元数据
+    store.put_many('p1', [1], [_meta('u1', 'goal', 'b2', '2024-01-02T00:00')])
+    assert store.get_many('p1', [1])[1]['text'] == 'b2'
+
+    assert store.find('p1', [{"type": "chat", "text": "a", "timestamp": "2024-01-01T00:00"},
+                             {"type": "chat", "text": "missing", "timestamp": "2024-01-01T00:00"}]) == [0]
+
+    # 过期按类型与时间戳筛选，并按分区分组
+    assert store.expired('chat', '2024-02-01T00:00') == {'p1': [0], 'p2': [0]}
+    assert store.expired('goal', '2024-02-01T00:00') == {'p1': [1]}
+
+    store.delete_many('p1', [0])
+    assert store.labels('p1') == [1, 2]
+    assert store.expired('chat', '2024-02-01T00:00') == {'p2': [0]}
+
+    assert store.delete_part('p1') == 2
+    assert store.labels('p1') == []
+    assert store.delete_part('p1') == 0
+    assert store.labels('p2') == [0]
+
+
+def test_meta_store_outbox_and_settings(tmp_path):
+    path = str(tmp_path / 'meta.db')
+    store = _MetaStore(path)
+    assert store.outbox_size() == 0
+    assert store.pending_ops(10) == []
+
+    store.enqueue('add', 'p1', {'metas': [{'text': '你好'}], 'vecs': 'AAAA'})
+    store.enqueue('del', 'p1', {'labels': [3, 4]})
+    store.enqueue('drop', 'p2', {})
+    assert store.outbox_size() == 3
+
+    # 按入队顺序取出，载荷原样往返
+    ops = store.pending_ops(2)
+    assert [(op, part) for _, op, part, _ in ops] == [('add', 'p1'), ('del', 'p1')]
+    assert ops[0][3]['metas'][0]['text'] == '你好'
+    assert ops[1][3] == {'labels': [3, 4]}
+
+    # 只确认已应用的操作；未确认的保留到下一轮（至少一次）
+    store.ack([ops[0][0]])
+    rest = store.pending_ops(10)
+    assert [op for _, op, _, _ in rest] == ['del', 'drop']
+    store.ack([op_id for op_id, _, _, _ in rest])
+    assert store.outbox_size() == 0
+
+    assert store.get_setting('dim') is None
+    store.set_setting('dim', 16)
+    store.set_setting('dim', 32)
+    assert store.get_setting('dim') == '32'
+
+    # 重新打开同一文件：队列与设置均已持久化
+    store.enqueue('del', 'p3', {'labels': [1]})
+    reopened = _MetaStore(path)
+    assert reopened.get_setting('dim') == '32'
+    assert [(op, part) for _, op, part, _ in reopened.pending_ops(10)] == [('del', 'p3')]
+
+
+def test_meta_store_finds_by_event_id_with_legacy_fallback(tmp_path):
+    path = str(tmp_path / 'meta.db')
+    # 旧版元数据表没有 event_id 列：打开时补列，旧行保持为空
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE vector_meta (part TEXT NOT NULL, label INTEGER NOT NULL, user_id TEXT, type TEXT, "
+                 "text TEXT, timestamp TEXT, PRIMARY KEY (part, label)) WITHOUT ROWID")
+    conn.execute("INSERT INTO vector_meta VALUES ('p1', 0, 'u1', 'chat', 'same', '2024-01-01T00:00')")
+    conn.commit()
+    conn.close()
+
+    store = _MetaStore(path)
+    same = _meta('u1', 'chat', 'same', '2024-01-01T00:00')
+    store.put_many('p1', [1, 2], [{**same, "id": 11}, {**same, "id": 12}])
+    assert store.get_many('p1', [0, 2]) == {0: {**same, "id": None}, 2: {**same, "id": 12}}
+
+    # 内容相同的记忆按 id 各自对齐；没有 event_id 的旧向量按内容匹配
+    assert store.find('p1', [{**same, "id": 12}]) == [2]
+    assert store.find('p1', [{**same, "id": 99}]) == [0]
+    assert sorted(store.find('p1', [same])) == [0, 1, 2]
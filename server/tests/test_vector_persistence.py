@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+_ENV = dict(VECTOR_SNAPSHOT_INTERVAL='3600', VECTOR_SNAPSHOT_MAX_WAL='100000')
+
+
+def _vectors(n, dim=16, seed=0):
+    vecs = np.random.default_rng(seed).normal(size=(n, dim)).astype('float32')
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def _meta(i):
+    return {"user_id": "u1", "type": "chat", "text": f"t{i}", "timestamp": "2024-01-01T00:00"}
+
+
+def _top(vs, vec, k=3):
+    return [h["text"] for h in vs.query_embedding(vec, top_k=k, filters={"user_id": "u1"})]
+
+
+def _wal_lines(path):
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+def test_wal_replay_and_truncation_across_crashes(load_vector_store, tmp_path):
+    vecs = _vectors(40)
+    vs = load_vector_store(**_ENV)
+    vs._ensure_index(16)
+    key = vs._partition_key("u1")
+    wal = tmp_path / 'memory_hnsw' / f'{key}.wal'
+    index = tmp_path / 'memory_hnsw' / f'{key}.index'
+
+    # 写入后崩溃（不快照）：只有 WAL 落盘
+    vs.add_embeddings(vecs[:30], [_meta(i) for i in range(30)])
+    assert not index.exists() and _wal_lines(wal) == 30
+    expected = {i: _top(vs, vecs[i]) for i in range(0, 30, 5)}
+
+    # 重启后回放 WAL 得到相同结果；快照后 WAL 被截断
+    vs = load_vector_store(crash=True, **_ENV)
+    vs._ensure_index(16)
+    assert {i: _top(vs, vecs[i]) for i in expected} == expected
+    part = vs._get_partition(key)
+    assert part.count() == 30 and part.wal_pending == 30
+    vs.flush()
+    assert index.exists() and os.path.getsize(wal) == 0 and part.wal_pending == 0
+
+    # 快照之后再写入/删除，再次崩溃
+    vs.add_embeddings(vecs[30:], [_meta(i) for i in range(30, 40)])
+    vs.delete_matching("u1", [_meta(0), _meta(35)])
+    assert _wal_lines(wal) == 11  # 10 条写入 + 1 条墓碑记录
+
+    # 再次重启：快照 + 快照之后的 WAL
+    vs = load_vector_store(crash=True, **_ENV)
+    vs._ensure_index(16)
+    part = vs._get_partition(key)
+    assert part.count() == 40 and part.live_count() == 38
+    assert part.wal_pending == 12  # 10 条写入 + 2 个墓碑
+    assert _top(vs, vecs[0], 1) != ["t0"] and _top(vs, vecs[35], 1) != ["t35"]
+    for i in (5, 20, 31, 39):
+        assert _top(vs, vecs[i], 1) == [f"t{i}"]
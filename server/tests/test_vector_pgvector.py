@@ -0,0 +1,278 @@
+import numpy as np
+import pytest
+
+# 不连接真实 Postgres：伪造 SQLAlchemy 引擎/连接与底层 psycopg 游标，检查发出的 SQL 与绑定参数
+
+
+class _Result:
+    def __init__(self, rows=None, scalar=None):
+        self._rows = rows or []
+        self._scalar = scalar
+
+    def scalar(self):
+        return self._scalar
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+
+class _Copy:
+    def __init__(self, cursor, sql):
+        cursor.engine.copies.append(self)
+        self.sql, self.types, self.rows = sql, None, []
+
+    def set_types(self, types):
+        self.types = types
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Cursor:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def copy(self, sql):
+        return _Copy(self, sql)
+
+    def executemany(self, sql, rows):
+        self.engine.executemany.append((sql, list(rows)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Raw:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def cursor(self):
+        return _Cursor(self.engine)
+
+
+class _Fairy:
+    def __init__(self, engine):
+        self.driver_connection = _Raw(engine)
+        self.info = engine.info
+
+
+class _Conn:
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = _Fairy(engine)
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        self.engine.sql.append((sql, params))
+        for prefix, result in self.engine.responses.items():
+            if sql.startswith(prefix):
+                if isinstance(result, Exception):
+                    raise result
+                return result
+        return _Result()
+
+    def execution_options(self, **options):
+        self.engine.options.update(options)
+        return self
+
+    def detach(self):
+        self.engine.detached = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Engine:
+    def __init__(self):
+        self.sql, self.copies, self.executemany = [], [], []
+        self.responses, self.options, self.info = {}, {}, {}
+        self.detached = False
+
+    def begin(self):
+        return _Conn(self)
+
+    def connect(self):
+        return _Conn(self)
+
+    def statements(self):
+        return [sql for sql, _ in self.sql]
+
+
+@pytest.fixture
+def pg(load_vector_store, monkeypatch):
+    vs = load_vector_store(PGVECTOR_INDEX='hnsw', VECTOR_QUANTIZATION='none')
+    if not vs.HAS_PGVECTOR:
+        pytest.skip("pgvector package not installed")
+    engine = _Engine()
+    monkeypatch.setattr(vs, '_use_pg', lambda: True)
+    monkeypatch.setattr(vs, '_get_engine', lambda: engine)
+    monkeypatch.setattr(vs, 'register_vector', lambda raw: engine.info.setdefault('registered', []).append(raw))
+    monkeypatch.setattr(vs, '_dim', 4)
+    return vs, engine
+
+
+def _metas(n):
+    return [{"user_id": "u1", "type": "chat", "text": f"t{i}", "timestamp": "2024-01-01T00:00", "id": 100 + i}
+            for i in range(n)]
+
+
+def test_pg_insert_copies_large_batches_and_executemany_small(pg, monkeypatch):
+    vs, engine = pg
+    monkeypatch.setattr(vs, '_PG_COPY_MIN_ROWS', 3)
+    embs = np.eye(4, dtype=np.float32)
+
+    vs._pg_insert(embs, _metas(4))
+    (copy,) = engine.copies
+    assert copy.sql == "COPY memory_vectors (user_id, type, text, timestamp, embedding, event_id) FROM STDIN WITH (FORMAT BINARY)"
+    assert copy.types == ['text', 'text', 'text', 'text', 'vector', 'int8']
+    assert [r[:4] + r[5:] for r in copy.rows] == [("u1", "chat", f"t{i}", "2024-01-01T00:00", 100 + i) for i in range(4)]
+    assert all(np.array_equal(r[4], e) for r, e in zip(copy.rows, embs))
+    assert not engine.executemany
+
+    # 小批量：executemany，向量以二进制（%b）绑定
+    vs._pg_insert(embs[:2], _metas(2))
+    (sql, rows), = engine.executemany
+    assert sql == "INSERT INTO memory_vectors(user_id, type, text, timestamp, embedding, event_id) VALUES (%s, %s, %s, %s, %b, %s)"
+    assert len(rows) == 2 and rows[1][5] == 101
+    assert len(engine.copies) == 1
+    # pgvector 适配器每个底层连接只注册一次
+    assert len(engine.info['registered']) == 1
+
+
+def test_build_ann_index_creates_concurrently_outside_pool(pg):
+    vs, engine = pg
+    engine.responses["SELECT c.reloptions"] = _Result([])
+    status = vs.ensure_ann_index(background=False)
+
+    assert engine.options == {"isolation_level": "AUTOCOMMIT"} and engine.detached
+    stmts = engine.statements()
+    assert stmts[0] == "SET statement_timeout = 0"
+    for name in ("idx_memory_vectors_emb_ivfflat", "idx_memory_vectors_emb_hnsw_half", "idx_memory_vectors_emb_ivfflat_half"):
+        assert f"DROP INDEX CONCURRENTLY IF EXISTS {name}" in stmts
+    assert "DROP INDEX CONCURRENTLY IF EXISTS idx_memory_vectors_emb_hnsw" not in stmts
+    assert stmts[-1] == ("CREATE INDEX CONCURRENTLY idx_memory_vectors_emb_hnsw ON memory_vectors "
+                         "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)")
+    assert status["state"] == "ready" and status["method"] == "hnsw"
+    assert status["options"] == {"m": 16, "ef_construction": 64}
+
+
+def test_build_ann_index_skips_matching_and_swaps_changed_index(pg):
+    vs, engine = pg
+    # 已有有效索引且参数一致：不重建
+    engine.responses["SELECT c.reloptions"] = _Result([(["m=16", "ef_construction=64"], True)])
+    assert vs.ensure_ann_index(background=False)["state"] == "ready"
+    assert not any(s.startswith("CREATE INDEX") for s in engine.statements())
+
+    # 参数变化：先建 _new 索引，就绪后替换旧索引
+    engine.sql.clear()
+    engine.responses["SELECT c.reloptions"] = _Result([(["m=8", "ef_construction=64"], True)])
+    assert vs.ensure_ann_index(background=False)["state"] == "ready"
+    stmts = engine.statements()
+    create = next(i for i, s in enumerate(stmts) if s.startswith("CREATE INDEX CONCURRENTLY"))
+    assert stmts[create].startswith("CREATE INDEX CONCURRENTLY idx_memory_vectors_emb_hnsw_new ON memory_vectors")
+    assert stmts[create + 1:] == ["DROP INDEX CONCURRENTLY IF EXISTS idx_memory_vectors_emb_hnsw",
+                                  "ALTER INDEX idx_memory_vectors_emb_hnsw_new RENAME TO idx_memory_vectors_emb_hnsw"]
+
+
+def test_build_ann_index_failure_is_reported(pg):
+    vs, engine = pg
+    engine.responses["SELECT c.reloptions"] = _Result([])
+    engine.responses["CREATE INDEX CONCURRENTLY"] = RuntimeError("out of maintenance_work_mem")
+    status = vs.ensure_ann_index(background=False)
+    assert status["state"] == "error" and "maintenance_work_mem" in status["error"]
+
+
+def test_index_status_reports_indexes_and_build_progress(pg):
+    vs, engine = pg
+    engine.responses["SELECT reltuples"] = _Result(scalar=1200)
+    engine.responses["SELECT c.relname"] = _Result([
+        {"relname": "idx_memory_vectors_emb_hnsw", "indisvalid": False, "reloptions": ["m=16"], "size_bytes": 8192}])
+    engine.responses["SELECT phase"] = _Result([
+        {"phase": "building index", "blocks_done": 3, "blocks_total": 10, "tuples_done": 300, "tuples_total": 1200}])
+    status = vs.index_status()
+    assert status["backend"] == "pgvector" and status["method"] == "hnsw"
+    assert status["table_rows_estimate"] == 1200
+    assert status["indexes"] == [{"name": "idx_memory_vectors_emb_hnsw", "valid": False, "options": ["m=16"], "size_bytes": 8192}]
+    assert status["progress"]["phase"] == "building index" and status["progress"]["tuples_done"] == 300
+
+
+@pytest.mark.parametrize('method,ef_search,probes,expected', [
+    ('hnsw', 80, None, ["SET LOCAL hnsw.ef_search = 80"]),
+    ('hnsw', None, 7, []),
+    ('ivfflat', 80, 7, ["SET LOCAL ivfflat.probes = 7"]),
+])
+def test_pg_search_sets_local_search_parameters(pg, monkeypatch, method, ef_search, probes, expected):
+    vs, engine = pg
+    monkeypatch.setattr(vs, '_PG_ANN_METHOD', method)
+    engine.responses["SELECT user_id"] = _Result([
+        {"user_id": "u1", "type": "chat", "text": "t0", "timestamp": "2024-01-01T00:00", "event_id": 100, "score": 0.9}])
+    conn = engine.begin()
+    hits = vs._pg_search(conn, np.eye(4, dtype=np.float32)[0], 3, {"user_id": "u1"}, ef_search, probes)
+
+    assert [s for s in engine.statements() if s.startswith("SET")] == expected
+    sql, params = engine.sql[-1]
+    assert "WHERE user_id = :uid" in sql and "ORDER BY embedding <=> :emb ASC" in sql
+    assert params["uid"] == "u1" and params["k"] == 3
+    assert hits == [{"user_id": "u1", "type": "chat", "text": "t0", "timestamp": "2024-01-01T00:00", "id": 100, "score": 0.9}]
+
+
+def test_pg_search_iterative_scan(pg, monkeypatch):
+    vs, engine = pg
+    monkeypatch.setattr(vs, '_PG_ITERATIVE_SCAN', 'relaxed_order')
+    vs._pg_search(engine.begin(), np.eye(4, dtype=np.float32)[0], 3, None, 40, None)
+    assert [s for s in engine.statements() if s.startswith("SET")] == [
+        "SET LOCAL hnsw.ef_search = 40", "SET LOCAL hnsw.iterative_scan = relaxed_order"]
+
+
+def test_halfvec_column_inserts_indexes_and_searches_as_halfvec(pg, monkeypatch):
+    vs, engine = pg
+    monkeypatch.setattr(vs, '_pg_column', 'halfvec')
+    monkeypatch.setattr(vs, '_PG_COPY_MIN_ROWS', 1)
+    vs._pg_insert(np.eye(4, dtype=np.float32)[:2], _metas(2))
+    (copy,) = engine.copies
+    assert copy.types[4] == 'halfvec' and all(isinstance(r[4], vs.HalfVector) for r in copy.rows)
+
+    engine.responses["SELECT c.reloptions"] = _Result([])
+    assert vs.ensure_ann_index(background=False)["state"] == "ready"
+    stmts = engine.statements()
+    assert "DROP INDEX CONCURRENTLY IF EXISTS idx_memory_vectors_emb_hnsw" in stmts
+    assert stmts[-1].startswith("CREATE INDEX CONCURRENTLY idx_memory_vectors_emb_hnsw_half ON memory_vectors "
+                                "USING hnsw (embedding halfvec_cosine_ops)")
+
+    vs._pg_search(engine.begin(), np.eye(4, dtype=np.float32)[0], 3, {"user_id": "u1"}, None, None)
+    assert "ORDER BY embedding <=> (:emb)::halfvec(4) ASC" in engine.sql[-1][0]
+
+
+def test_quantized_vector_column_indexes_halfvec_expression_and_rescores(pg, monkeypatch):
+    vs, engine = pg
+    monkeypatch.setattr(vs, '_PG_HALFVEC', True)
+    engine.responses["SELECT c.reloptions"] = _Result([])
+    vs.ensure_ann_index(background=False)
+    assert engine.statements()[-1].startswith(
+        "CREATE INDEX CONCURRENTLY idx_memory_vectors_emb_hnsw_half ON memory_vectors "
+        "USING hnsw ((embedding::halfvec(4)) halfvec_cosine_ops)")
+
+    # halfvec 索引取 top_k × VECTOR_RESCORE_FACTOR 个候选，再按原始 vector 精确重排
+    vs._pg_search(engine.begin(), np.eye(4, dtype=np.float32)[0], 3, None, None, None)
+    sql, params = engine.sql[-1]
+    assert "ORDER BY embedding::halfvec(4) <=> (:emb)::halfvec(4) ASC LIMIT :cand" in sql
+    assert sql.endswith("ORDER BY embedding <=> :emb ASC LIMIT :k")
+    assert params["cand"] == 3 * vs._RESCORE_FACTOR
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+_N, _DIM, _QUERIES, _K = 500, 32, 20, 10
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    rng = np.random.default_rng(7)
+    vecs = rng.normal(size=(_N, _DIM)).astype('float32')
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    queries = vecs[rng.choice(_N, _QUERIES, replace=False)] + rng.normal(scale=0.1, size=(_QUERIES, _DIM)).astype('float32')
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = [list(np.argsort(-(vecs @ q))[:_K]) for q in queries]
+    return vecs, queries, truth
+
+
+def _search(vs, queries):
+    return [[int(h["text"]) for h in vs.query_embedding(q, top_k=_K, filters={"user_id": "u1"})] for q in queries]
+
+
+def _build(load, data_dir, mode, vecs, queries, rescore='auto'):
+    vs = load(data_dir=data_dir, VECTOR_QUANTIZATION=mode, VECTOR_RESCORE_DTYPE=rescore)
+    vs._ensure_index(_DIM)
+    vs.add_embeddings(vecs, [{"user_id": "u1", "type": "chat", "text": str(i), "timestamp": "2024-01-01T00:00"}
+                             for i in range(len(vecs))])
+    vs.flush()
+    return _search(vs, queries)
+
+
+def _recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+@pytest.mark.parametrize('mode,rescore,min_recall', [
+    ('float16', 'auto', 0.9),  # 不落盘重排文件
+    ('int8', 'auto', 0.9),  # float16 重排文件
+    ('int8', 'float32', 0.9),
+    ('int8', 'none', 0.8),  # 只按 int8 编码打分
+])
+def test_quantized_topk_matches_float32_and_survives_reload(load_vector_store, tmp_path, corpus, mode, rescore, min_recall):
+    vecs, queries, truth = corpus
+    baseline = _build(load_vector_store, tmp_path / 'none', 'none', vecs, queries)
+    assert _recall(baseline, truth) >= 0.9
+
+    # 粗排用量化编码，候选再精确重排：与 none 模式的 top-k 基本一致
+    written = _build(load_vector_store, tmp_path / mode, mode, vecs, queries, rescore)
+    assert _recall(written, truth) >= min_recall
+    assert _recall(written, baseline) >= min_recall
+
+    # 重启后从快照与内存映射的重排文件加载，结果不变
+    vs = load_vector_store(data_dir=tmp_path / mode, VECTOR_QUANTIZATION=mode, VECTOR_RESCORE_DTYPE=rescore)
+    vs._ensure_index(_DIM)
+    part = vs._get_partition(vs._partition_key("u1"))
+    assert isinstance(part.index, vs._QuantizedIndex) and part.count() == _N
+    assert part.index.vec_dtype == vs._RESCORE_DTYPE
+    assert _search(vs, queries) == written
+
+
+def test_rescore_file_size_follows_dtype_and_converts_on_rebuild(load_vector_store, tmp_path, corpus):
+    vecs, queries, truth = corpus
+    _build(load_vector_store, tmp_path, 'int8', vecs, queries, 'float32')
+    vs = load_vector_store(VECTOR_QUANTIZATION='int8', VECTOR_RESCORE_DTYPE='float32')
+    vec_file = tmp_path / 'memory_hnsw' / f'{vs._partition_key("u1")}.vec'
+    assert vec_file.stat().st_size == _N * _DIM * 4
+
+    # 改为 float16 重排：已有分区加载后由后台重建改写重排文件，大小减半
+    vs = load_vector_store(VECTOR_QUANTIZATION='int8', VECTOR_RESCORE_DTYPE='float16')
+    vs._ensure_index(_DIM)
+    part = vs._get_partition(vs._partition_key("u1"))
+    assert part.index.vec_dtype == 'float32' and part.needs_compaction()
+    vs._compact_due()
+    assert part.index.vec_dtype == 'float16' and not part.needs_compaction()
+    assert vec_file.stat().st_size == _N * _DIM * 2
+    assert _recall(_search(vs, queries), truth) >= 0.9
+
+    # 关闭重排：重建后删除重排文件
+    vs = load_vector_store(VECTOR_QUANTIZATION='int8', VECTOR_RESCORE_DTYPE='none')
+    vs._ensure_index(_DIM)
+    vs._get_partition(vs._partition_key("u1"))
+    vs._compact_due()
+    assert not vec_file.exists()
+    assert _recall(_search(vs, queries), truth) >= 0.8
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import subprocess
+
+import numpy as np
+from app.metrics import get_counters  # type: ignore
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVER_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+
+# writer 必须是另一个进程（writer 锁按进程持有）：写入并发布后保持运行、消费 reader 的 outbox，直到出现 stop 文件
+_WRITER = r"""
+import os, sys, time
+import numpy as np
+from app import vector_store as vs
+data = sys.argv[1]
+vecs = np.load(os.path.join(data, 'vecs.npy'))
+vs.add_embeddings(vecs, [{"user_id": "u1", "type": "chat", "text": f"t{i}", "timestamp": "2024-01-01T00:00"} for i in range(len(vecs))])
+assert vs.role() == 'writer', vs.role()
+vs.flush()
+open(os.path.join(data, 'ready'), 'w').close()
+deadline = time.time() + 60
+while not os.path.exists(os.path.join(data, 'stop')) and time.time() < deadline:
+    time.sleep(0.05)
+"""
+
+
+def _vectors(n, dim=16, seed=0):
+    vecs = np.random.default_rng(seed).normal(size=(n, dim)).astype('float32')
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def _meta(user, text, ts="2024-01-01T00:00"):
+    return {"user_id": user, "type": "chat", "text": text, "timestamp": ts}
+
+
+def _top1(vs, vec):
+    hits = vs.query_embedding(vec, top_k=1, filters={"user_id": "u1"})
+    return hits[0]["text"] if hits else None
+
+
+def test_writer_publishes_and_reader_hot_swaps(load_vector_store, tmp_path):
+    vecs = _vectors(20)
+    np.save(tmp_path / 'vecs.npy', vecs)
+    env = dict(os.environ, DATA_DIR=str(tmp_path), VECTOR_ROLE='auto', VECTOR_PUBLISH_INTERVAL='0.2')
+    env['PYTHONPATH'] = os.pathsep.join([SERVER_DIR, env.get('PYTHONPATH', '')])
+    writer = subprocess.Popen([sys.executable, '-c', _WRITER, str(tmp_path)], cwd=SERVER_DIR, env=env)
+    try:
+        for _ in range(600):
+            if (tmp_path / 'ready').exists() or writer.poll() is not None:
+                break
+            time.sleep(0.05)
+        assert (tmp_path / 'ready').exists(), "writer did not publish"
+        assert (tmp_path / 'memory_hnsw' / 'published' / 'manifest.json').exists()
+
+        # 本进程为 reader：检索已发布版本；新写入经 outbox 交给 writer，发布后热替换可见
+        vs = load_vector_store(VECTOR_ROLE='reader', VECTOR_PUBLISH_INTERVAL='0.2')
+        assert _top1(vs, vecs[3]) == "t3"
+        assert vs.role() == 'reader'
+        new = np.zeros(16, dtype='float32')
+        new[0] = 1.0
+        vs.add_embeddings(new[None, :], [_meta("u1", "fresh", "2024-01-02T00:00")])
+        deadline = time.time() + 20
+        while _top1(vs, new) != "fresh" and time.time() < deadline:
+            time.sleep(0.1)
+        assert _top1(vs, new) == "fresh"
+    finally:
+        (tmp_path / 'stop').touch()
+        writer.wait(timeout=30)
+
+
+def test_writer_publishes_only_changed_partitions(load_vector_store, tmp_path):
+    env = dict(VECTOR_ROLE='writer', VECTOR_QUANTIZATION='int8', VECTOR_PUBLISH_INTERVAL='60')
+    vs = load_vector_store(**env)
+    vs._ensure_index(16)
+    assert vs.role() == 'writer'
+    vecs = _vectors(10)
+    vs.add_embeddings(vecs[:5], [_meta("u1", f"u1-{i}") for i in range(5)])
+    vs.add_embeddings(vecs[5:], [_meta("u2", f"u2-{i}") for i in range(5)])
+    vs.flush()
+    k1, k2 = vs._partition_key("u1"), vs._partition_key("u2")
+    root = tmp_path / 'memory_hnsw'
+
+    def pub(key, gen, name):
+        return root / 'published' / key / str(gen) / name
+
+    # 量化编码发布为 .npy，meta.json 硬链接
+    assert vs._manifest == {k1: 1, k2: 1}
+    assert os.path.samefile(pub(k1, 1, 'meta.json'), root / f'{k1}.meta.json')
+    assert not pub(k1, 1, 'index').exists() and pub(k1, 1, 'codes.npy').exists()
+
+    # 只有删除：只发布 u1，原始向量文件沿用上一版本
+    copied = get_counters().get('vector_publish_bytes_copied', 0)
+    assert vs.delete_matching("u1", [_meta("u1", "u1-0")]) == 1
+    vs.flush()
+    assert vs._manifest == {k1: 2, k2: 1}
+    for name in ('vec', 'codes.npy', 'scales.npy', 'labels.npy'):
+        assert os.path.samefile(pub(k1, 2, name), pub(k1, 1, name))
+    assert get_counters().get('vector_publish_bytes_copied', 0) == copied
+
+    # 新写入：复制原始向量文件
+    vs.add_embeddings(vecs[:1], [_meta("u1", "new", "2024-01-02T00:00")])
+    vs.flush()
+    assert vs._manifest == {k1: 3, k2: 1}
+    assert not os.path.samefile(pub(k1, 3, 'vec'), pub(k1, 2, 'vec'))
+    assert not os.path.samefile(pub(k1, 3, 'codes.npy'), pub(k1, 2, 'codes.npy'))
+    version = vs._manifest_version
+
+    # 新 writer 启动：已发布版本与私有快照一致的分区不重新发布
+    vs = load_vector_store(**env)
+    vs._ensure_index(16)
+    assert vs._publish_unpublished() == 0
+    assert vs._manifest_version == version
+
+
+def test_quantized_reader_maps_published_codes(load_vector_store, tmp_path):
+    vecs = _vectors(20)
+    vs = load_vector_store(VECTOR_ROLE='writer', VECTOR_QUANTIZATION='int8', VECTOR_PUBLISH_INTERVAL='60')
+    vs._ensure_index(16)
+    vs.add_embeddings(vecs, [_meta("u1", f"t{i}") for i in range(20)])
+    vs.flush()
+    vs.delete_matching("u1", [_meta("u1", "t4")])
+    vs.flush()
+
+    # reader 的编码、scale、标签均为发布文件的只读内存映射，多个 reader 共享页缓存
+    vs = load_vector_store(VECTOR_ROLE='reader', VECTOR_QUANTIZATION='int8')
+    vs._ensure_index(16)
+    index = vs._get_partition(vs._partition_key("u1")).index
+    assert isinstance(index, vs._QuantizedIndex)
+    for arr in (index.codes, index.scales, index.labels):
+        assert isinstance(arr, np.memmap) and not arr.flags.writeable
+    assert index.get_current_count() == 20 and len(index.deleted) == 1
+    assert _top1(vs, vecs[3]) == "t3" and _top1(vs, vecs[4]) != "t4"